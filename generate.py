@@ -1,12 +1,127 @@
 import argparse
 from datetime import datetime
+import hashlib
 import json
+import multiprocessing
 import os
+import re
 import shutil
 import sys
 from shapeworld import dataset, util
 
 
+def init_worker(worker_args):
+    # every worker process creates its own dataset instance
+    global args, dataset
+    from shapeworld import dataset as create_dataset
+    import random
+    import numpy as np
+    args = worker_args
+    dataset = create_dataset(dtype=args.type, name=args.name, language=args.language, config=args.config)
+    # forked workers would otherwise share the random state of the parent
+    random.seed()
+    np.random.seed()
+
+
+def generate_part(task):
+    mode, path, seed, tf_records_flag = task
+    before = datetime.now()
+    generated = dataset.generate(n=args.instances, mode=mode, noise_range=args.pixel_noise, include_model=args.include_model, alternatives=True, seed=seed)
+    if generated is None:
+        assert False
+    elif tf_records_flag:
+        from shapeworld import tf_util
+        tf_util.write_records(dataset=dataset, records=generated, path=path)
+    else:
+        dataset.serialize(path=path, generated=generated, archive=args.archive, concat_worlds=args.concatenate_images, html=args.html)
+    # if args.html and dataset.type == 'agreement':
+    #     captions = generated['caption']
+    #     agreements = generated['agreement']
+    #     html_content = list()
+    #     for n, (caption, agreement) in enumerate(zip(captions, agreements)):
+    #         html_content.append('<div class="{agreement}"><div class="world"><img src="{world}.bmp" alt="{world}.bmp"></div><div class="caption">{caption}</div></div>'.format(
+    #             agreement=('correct' if agreement == 1.0 else 'incorrect'),
+    #             world=('world-' + str(n)),
+    #             caption=' '.join(str(c) for c in caption)
+    #         ))
+    #     with open(os.path.join(path, 'data.html'), 'w') as filehandle:
+    #         filehandle.write('<!DOCTYPE html><html><head><style>.data{{width: 100%; height: 100%;}} .correct{{width: 100%; height: 64px; margin-top: 1px; margin-bottom: 1px; background-color: #77FF77;}} .incorrect{{width: 100%; height: 64px; margin-top: 1px; margin-bottom: 1px; background-color: #FF7777;}} .world{{display: inline-block; vertical-align: middle;}} .caption{{display: inline-block; vertical-align: middle; margin-left: 10px;}}</style><title>{dtype} {name}</title></head><body><div class="data">{data}</div></body></html>'.format(
+    #             dtype=dataset.type,
+    #             name=dataset.name,
+    #             data=''.join(html_content)
+    #         ))
+    after = datetime.now()
+    return after - before
+
+
+def part_path(path):
+    # the file or directory written for a part, depending on archive or tf-records extension
+    directory, part = os.path.split(path)
+    paths = [os.path.join(directory, name) for name in os.listdir(directory) if name == part or name.startswith(part + '.')]
+    assert len(paths) == 1
+    return paths[0]
+
+
+def checksum(path):
+    sha256 = hashlib.sha256()
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for filename in sorted(files):
+                sha256.update(os.path.relpath(os.path.join(root, filename), path).encode('utf-8') + b'\0')
+                with open(os.path.join(root, filename), 'rb') as filehandle:
+                    sha256.update(filehandle.read())
+    else:
+        with open(path, 'rb') as filehandle:
+            for chunk in iter(lambda: filehandle.read(1 << 20), b''):
+                sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+shard_manifest_regex = re.compile(pattern=r'^(.+)-shard([0-9]+)of([0-9]+)\.json$')
+
+
+def merge_shards(directory, shard_directories):
+    # combines shards written with --shard into the standard layout, after verifying their manifests
+    manifests = list()
+    for shard_directory in shard_directories:
+        for filename in sorted(os.listdir(shard_directory)):
+            if shard_manifest_regex.match(filename):
+                with open(os.path.join(shard_directory, filename), 'r') as filehandle:
+                    manifests.append((shard_directory, json.load(fp=filehandle)))
+    assert manifests, 'no shard manifests found'
+    manifest = manifests[0][1]
+    for _, other in manifests:
+        for key in ('specification', 'specification_path', 'directory', 'num_shards', 'seed', 'instances'):
+            assert other[key] == manifest[key], 'shard manifests differ in ' + key
+    assert sorted(other['shard'] for _, other in manifests) == list(range(1, manifest['num_shards'] + 1)), 'shards missing or duplicated'
+
+    dataset_directory = os.path.join(directory, manifest['directory'])
+    if os.path.isdir(dataset_directory):
+        shutil.rmtree(dataset_directory)
+    parts = {subdir: list() for subdir in manifest['parts']}
+    for subdir in parts:
+        os.makedirs(os.path.join(dataset_directory, subdir))
+    num_instances = 0
+    for shard_directory, other in manifests:
+        for subdir, subdir_parts in other['parts'].items():
+            for part in subdir_parts:
+                source = os.path.join(shard_directory, part['path'])
+                assert checksum(source) == part['checksum'], 'checksum mismatch for ' + source
+                target = os.path.join(directory, part['path'])
+                if os.path.isdir(source):
+                    shutil.copytree(source, target)
+                else:
+                    shutil.copy2(source, target)
+                parts[subdir].append(part['part'])
+                num_instances += part['instances']
+    for subdir, numbers in parts.items():
+        assert sorted(numbers) == list(range(1, len(numbers) + 1)), 'parts missing in ' + subdir
+    with open(os.path.join(directory, manifest['specification_path']), 'w') as filehandle:
+        filehandle.write(json.dumps(manifest['specification']))
+    return num_instances
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Generate example data')
 
@@ -24,13 +139,33 @@ if __name__ == '__main__':
     parser.add_argument('-f', '--files', type=util.parse_tuple, default=(1,), help='Number of files to split data into')
     parser.add_argument('-i', '--instances', type=util.parse_int_with_factor, default=100, help='Number of instances per file')
 
+    parser.add_argument('-s', '--seed', type=int, default=None, help='Random seed, instances are then reproducible per part')
     parser.add_argument('-p', '--pixel-noise', type=float, default=0.0, help='Pixel noise range')
     parser.add_argument('-M', '--include-model', action='store_true', help='Include world/caption model (as json file)')
     parser.add_argument('-C', '--concatenate-images', action='store_true', help='Concatenate images per part into one image file')
     parser.add_argument('-H', '--html', action='store_true', help='Create HTML file showing the generated data')
+
+    parser.add_argument('-w', '--workers', type=int, default=None, help='Number of worker processes generating parts in parallel')
+    parser.add_argument('-S', '--shard', default=None, help='Only generate shard i/k of the parts, with a manifest for --merge')
+    parser.add_argument('--merge', nargs='+', default=None, help='Merge the given shard directories into --directory')
     # parser.add_argument('-v', '--values', default=None, help='Comma-separated list of values to include')
     args = parser.parse_args()
 
+    if args.merge:
+        sys.stdout.write('{time} merge {shards} shard directories...\n'.format(time=datetime.now().strftime('%H:%M:%S'), shards=len(args.merge)))
+        sys.stdout.flush()
+        num_instances = merge_shards(directory=args.directory, shard_directories=args.merge)
+        sys.stdout.write('{time} merged {instances} instances!\n'.format(time=datetime.now().strftime('%H:%M:%S'), instances=num_instances))
+        sys.stdout.flush()
+        exit(0)
+
+    if args.shard:
+        # shard i (from 1) of k owns the parts i, i + k, i + 2k, ... of every mode, seeded as when generated at once
+        shard, num_shards = (int(x) for x in args.shard.split('/'))
+        assert 1 <= shard <= num_shards
+        assert args.seed is not None, 'sharded generation requires --seed'
+        assert not args.append and not args.unmanaged
+
     dataset = dataset(dtype=args.type, name=args.name, language=args.language, config=args.config)
     sys.stdout.write('{time} {dataset}\n'.format(time=datetime.now().strftime('%H:%M:%S'), dataset=dataset))
     sys.stdout.write('         config: {config}\n'.format(config=args.config))
@@ -122,43 +257,71 @@ if __name__ == '__main__':
             for subdir in directories:
                 os.makedirs(subdir)
 
+    # parts as (mode, path, seed, tf_records_flag), seeded by directory and part number so that the output does not
+    # depend on the number of workers
+    tasks = list()
     for mode, directory, num_parts, start, tf_records_flag in zip(modes, directories, parts, start_part, tf_records_flags):
-        sys.stdout.write('{time} generate {dtype} {name}{mode} data...\n'.format(time=datetime.now().strftime('%H:%M:%S'), dtype=dataset.type, name=dataset.name, mode=(' ' + mode if mode else '')))
-        sys.stdout.write('         0%  0/{parts}  (time per part: n/a)'.format(parts=num_parts))
-        sys.stdout.flush()
+        mode_tasks = list()
         for part in range(1, num_parts + 1):
-            before = datetime.now()
+            if args.shard and (start + part - 1) % num_shards != shard - 1:
+                continue
             if args.unmanaged and len(parts) == 1 and parts[0] == 1:
                 path = directory
             else:
                 path = os.path.join(directory, 'part{}'.format(start + part))
-            generated = dataset.generate(n=args.instances, mode=mode, noise_range=args.pixel_noise, include_model=args.include_model, alternatives=True)
-            if generated is None:
-                assert False
-            elif tf_records_flag:
-                tf_util.write_records(dataset=dataset, records=generated, path=path)
-            else:
-                dataset.serialize(path=path, generated=generated, archive=args.archive, concat_worlds=args.concatenate_images, html=args.html)
-            # if args.html and dataset.type == 'agreement':
-            #     captions = generated['caption']
-            #     agreements = generated['agreement']
-            #     html_content = list()
-            #     for n, (caption, agreement) in enumerate(zip(captions, agreements)):
-            #         html_content.append('<div class="{agreement}"><div class="world"><img src="{world}.bmp" alt="{world}.bmp"></div><div class="caption">{caption}</div></div>'.format(
-            #             agreement=('correct' if agreement == 1.0 else 'incorrect'),
-            #             world=('world-' + str(n)),
-            #             caption=' '.join(str(c) for c in caption)
-            #         ))
-            #     with open(os.path.join(path, 'data.html'), 'w') as filehandle:
-            #         filehandle.write('<!DOCTYPE html><html><head><style>.data{{width: 100%; height: 100%;}} .correct{{width: 100%; height: 64px; margin-top: 1px; margin-bottom: 1px; background-color: #77FF77;}} .incorrect{{width: 100%; height: 64px; margin-top: 1px; margin-bottom: 1px; background-color: #FF7777;}} .world{{display: inline-block; vertical-align: middle;}} .caption{{display: inline-block; vertical-align: middle; margin-left: 10px;}}</style><title>{dtype} {name}</title></head><body><div class="data">{data}</div></body></html>'.format(
-            #             dtype=dataset.type,
-            #             name=dataset.name,
-            #             data=''.join(html_content)
-            #         ))
-            after = datetime.now()
-            sys.stdout.write('\r         {completed:.0f}%  {part}/{parts}  (time per part: {duration})'.format(completed=((part) * 100 / num_parts), part=part, parts=num_parts, duration=str(after - before).split('.')[0]))
+            seed = None if args.seed is None else [args.seed, 'tf-records' if tf_records_flag else mode, start + part]
+            mode_tasks.append((mode, path, seed, tf_records_flag))
+        tasks.append(mode_tasks)
+
+    begin = datetime.now()
+    if args.workers:
+        sys.stdout.write('{time} generate {dtype} {name} data with {workers} workers...\n'.format(time=datetime.now().strftime('%H:%M:%S'), dtype=dataset.type, name=dataset.name, workers=args.workers))
+        num_parts = sum(len(mode_tasks) for mode_tasks in tasks)
+        sys.stdout.write('         0%  0/{parts}  (instances per second: n/a)'.format(parts=num_parts))
+        sys.stdout.flush()
+        pool = multiprocessing.Pool(processes=args.workers, initializer=init_worker, initargs=(args,))
+        for part, _ in enumerate(pool.imap_unordered(generate_part, [task for mode_tasks in tasks for task in mode_tasks]), 1):
+            seconds = (datetime.now() - begin).total_seconds()
+            sys.stdout.write('\r         {completed:.0f}%  {part}/{parts}  (instances per second: {rate:.1f})'.format(completed=(part * 100 / num_parts), part=part, parts=num_parts, rate=(part * args.instances / seconds)))
             sys.stdout.flush()
+        pool.close()
+        pool.join()
         sys.stdout.write('\n')
         sys.stdout.flush()
+    else:
+        for mode, mode_tasks in zip(modes, tasks):
+            sys.stdout.write('{time} generate {dtype} {name}{mode} data...\n'.format(time=datetime.now().strftime('%H:%M:%S'), dtype=dataset.type, name=dataset.name, mode=(' ' + mode if mode else '')))
+            sys.stdout.write('         0%  0/{parts}  (time per part: n/a)'.format(parts=len(mode_tasks)))
+            sys.stdout.flush()
+            for part, task in enumerate(mode_tasks, 1):
+                duration = generate_part(task)
+                sys.stdout.write('\r         {completed:.0f}%  {part}/{parts}  (time per part: {duration})'.format(completed=(part * 100 / len(mode_tasks)), part=part, parts=len(mode_tasks), duration=str(duration).split('.')[0]))
+                sys.stdout.flush()
+            sys.stdout.write('\n')
+            sys.stdout.flush()
+    if args.shard:
+        manifest = {
+            'specification': specification,
+            'specification_path': os.path.basename(specification_path),
+            'directory': os.path.relpath(os.path.dirname(directories[0]), args.directory),
+            'shard': shard,
+            'num_shards': num_shards,
+            'seed': args.seed,
+            'instances': args.instances,
+            'parts': dict()
+        }
+        for subdir, mode_tasks in zip(directories, tasks):
+            manifest['parts'][os.path.basename(subdir)] = [{
+                'part': int(os.path.basename(path)[4:]),
+                'path': os.path.relpath(part_path(path), args.directory),
+                'instances': args.instances,
+                'checksum': checksum(part_path(path))
+            } for _, path, _, _ in mode_tasks]
+        manifest_path = '{}-shard{}of{}.json'.format(specification_path[:-5], shard, num_shards)
+        with open(manifest_path, 'w') as filehandle:
+            filehandle.write(json.dumps(manifest))
+    num_instances = sum(len(mode_tasks) for mode_tasks in tasks) * args.instances
+    seconds = (datetime.now() - begin).total_seconds()
+    sys.stdout.write('{time} generated {instances} instances in {duration}  (instances per second: {rate:.1f})\n'.format(time=datetime.now().strftime('%H:%M:%S'), instances=num_instances, duration=str(datetime.now() - begin).split('.')[0], rate=(num_instances / max(seconds, 1e-6))))
     sys.stdout.write('{time} data generation completed!\n'.format(time=datetime.now().strftime('%H:%M:%S')))
     sys.stdout.flush()
@@ -0,0 +1,32 @@
+import argparse
+from datetime import datetime
+import sys
+from shapeworld import util
+from shapeworld.server import DatasetServer
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve generated data to local clients')
+
+    parser.add_argument('-a', '--address', default='localhost:7650', help='Address to serve on, either host:port or the path of a Unix domain socket')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='Number of worker processes (default: number of CPUs)')
+
+    parser.add_argument('-t', '--type', default=None, help='Dataset type to preload')
+    parser.add_argument('-n', '--name', action='append', default=None, help='Dataset name(s) to preload')
+    parser.add_argument('-l', '--language', default=None, help='Dataset language')
+    parser.add_argument('-c', '--config', type=util.parse_config, default=None, help='Dataset configuration file')
+    args = parser.parse_args()
+
+    # clients connect via dataset(dtype, name, language, config='connect(address)'), other datasets are created on request
+    preload = [{'dtype': args.type, 'name': name, 'language': args.language, 'config': args.config} for name in (args.name or ())]
+    server = DatasetServer(address=args.address, num_workers=args.workers, preload=preload)
+    sys.stdout.write('{time} serving on {address}...\n'.format(time=datetime.now().strftime('%H:%M:%S'), address=args.address))
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+    sys.stdout.write('{time} server stopped!\n'.format(time=datetime.now().strftime('%H:%M:%S')))
+    sys.stdout.flush()
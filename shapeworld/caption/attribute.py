@@ -1,4 +1,6 @@
+import numpy as np
 from shapeworld.caption import Predicate, Settings
+from shapeworld.world import EntityTable
 
 
 class Attribute(Predicate):
@@ -26,86 +28,104 @@ class Attribute(Predicate):
         else:
             return dict(component='attribute', attrtype=self.attrtype, value=self.value)
 
-    def agreeing_entities(self, entities):
+    def signature(self):
         if self.attrtype == 'relation':
-            return self.value.agreeing_entities(entities=entities)
+            return ('attribute', self.attrtype, self.value.signature())
+        elif self.attrtype in ('shapes', 'colors', 'textures', 'combinations'):
+            return ('attribute', self.attrtype, tuple(tuple(value) if isinstance(value, list) else value for value in self.value))
+        else:
+            return ('attribute', self.attrtype, self.value)
+
+    def compute_agreeing_mask(self, table, mask, signature):
+        if self.attrtype == 'relation':
+            return self.value.agreeing_mask(table=table, mask=mask, signature=signature[2])
 
         elif self.attrtype == 'shape':
-            return [entity for entity in entities if entity.shape.name == self.value]
+            return mask & (table.shape == EntityTable.name_id(self.value, EntityTable.shape_ids))
 
         elif self.attrtype == 'color':
-            return [entity for entity in entities if entity.color.name == self.value]
+            return mask & (table.color == EntityTable.name_id(self.value, EntityTable.color_ids))
 
         elif self.attrtype == 'texture':
-            return [entity for entity in entities if entity.texture.name == self.value]
+            return mask & (table.texture == EntityTable.name_id(self.value, EntityTable.texture_ids))
 
         elif self.attrtype == 'combination':
-            return [entity for entity in entities if (entity.shape.name, entity.color.name, entity.texture.name) == self.value]
+            return mask & np.array([combination == self.value for combination in table.combinations()], dtype=bool)
 
         elif self.attrtype == 'shapes':
-            return [entity for entity in entities if entity.shape.name in self.value]
+            return mask & EntityTable.names_lookup(self.value, EntityTable.shape_ids)[table.shape]
 
         elif self.attrtype == 'colors':
-            return [entity for entity in entities if entity.color.name in self.value]
+            return mask & EntityTable.names_lookup(self.value, EntityTable.color_ids)[table.color]
 
         elif self.attrtype == 'textures':
-            return [entity for entity in entities if entity.texture.name in self.value]
+            return mask & EntityTable.names_lookup(self.value, EntityTable.texture_ids)[table.texture]
 
         elif self.attrtype == 'combinations':
-            return [entity for entity in entities if (entity.shape.name, entity.color.name, entity.texture.name) in self.value]
+            return mask & np.array([combination in self.value for combination in table.combinations()], dtype=bool)
 
         elif self.attrtype == 'x-max':
             # min distance to second
-            return [entity for entity in entities if all(entity.center.x * self.value - other.center.x * self.value > Settings.min_distance for other in entities)]
+            return maximal(values=(table.x * self.value), mask=mask, threshold=Settings.min_distance)
 
         elif self.attrtype == 'y-max':
             # min distance to second
-            return [entity for entity in entities if all(entity.center.y * self.value - other.center.y * self.value > Settings.min_distance for other in entities)]
+            return maximal(values=(table.y * self.value), mask=mask, threshold=Settings.min_distance)
 
         elif self.attrtype == 'size-max':
             # min difference to second
-            return [entity for entity in entities if all(entity.shape.area * self.value - other.shape.area * self.value > Settings.min_area for other in entities)]
+            return maximal(values=(table.area * self.value), mask=mask, threshold=Settings.min_area)
 
         elif self.attrtype == 'shade-max':
             # min difference to second
-            return [entity for entity in entities if all(entity.color.shade * self.value - other.color.shade * self.value > Settings.min_shade for other in entities)]
+            return maximal(values=(table.shade * self.value), mask=mask, threshold=Settings.min_shade)
 
-    def disagreeing_entities(self, entities):
+    def compute_disagreeing_mask(self, table, mask, signature):
         if self.attrtype == 'relation':
-            return self.value.disagreeing_entities(entities=entities)
+            return self.value.disagreeing_mask(table=table, mask=mask, signature=signature[2])
 
         elif self.attrtype == 'shape':
-            return [entity for entity in entities if entity.shape.name != self.value]
+            return mask & (table.shape != EntityTable.name_id(self.value, EntityTable.shape_ids))
 
         elif self.attrtype == 'color':
-            return [entity for entity in entities if entity.color.name != self.value]
+            return mask & (table.color != EntityTable.name_id(self.value, EntityTable.color_ids))
 
         elif self.attrtype == 'texture':
-            return [entity for entity in entities if entity.texture.name != self.value]
+            return mask & (table.texture != EntityTable.name_id(self.value, EntityTable.texture_ids))
 
         elif self.attrtype == 'combination':
-            return [entity for entity in entities if (entity.shape.name, entity.color.name, entity.texture.name) != self.value]
+            return mask & np.array([combination != self.value for combination in table.combinations()], dtype=bool)
 
         elif self.attrtype == 'shapes':
-            return [entity for entity in entities if entity.shape.name not in self.value]
+            return mask & ~EntityTable.names_lookup(self.value, EntityTable.shape_ids)[table.shape]
 
         elif self.attrtype == 'colors':
-            return [entity for entity in entities if entity.color.name not in self.value]
+            return mask & ~EntityTable.names_lookup(self.value, EntityTable.color_ids)[table.color]
 
         elif self.attrtype == 'textures':
-            return [entity for entity in entities if entity.texture.name not in self.value]
+            return mask & ~EntityTable.names_lookup(self.value, EntityTable.texture_ids)[table.texture]
 
         elif self.attrtype == 'combinations':
-            return [entity for entity in entities if (entity.shape.name, entity.color.name, entity.texture.name) not in self.value]
+            return mask & np.array([combination not in self.value for combination in table.combinations()], dtype=bool)
 
         elif self.attrtype == 'x-max':
-            return [entity for entity in entities if any(other.center.x * self.value - entity.center.x * self.value > Settings.min_distance for other in entities)]
+            return exceeded(values=(table.x * self.value), mask=mask, threshold=Settings.min_distance)
 
         elif self.attrtype == 'y-max':
-            return [entity for entity in entities if any(other.center.y * self.value - entity.center.y * self.value > Settings.min_distance for other in entities)]
+            return exceeded(values=(table.y * self.value), mask=mask, threshold=Settings.min_distance)
 
         elif self.attrtype == 'size-max':
-            return [entity for entity in entities if any(other.shape.area * self.value - entity.shape.area * self.value > Settings.min_area for other in entities)]
+            return exceeded(values=(table.area * self.value), mask=mask, threshold=Settings.min_area)
 
         elif self.attrtype == 'shade-max':
-            return [entity for entity in entities if any(other.color.shade * self.value - entity.color.shade * self.value > Settings.min_shade for other in entities)]
+            return exceeded(values=(table.shade * self.value), mask=mask, threshold=Settings.min_shade)
+
+
+def maximal(values, mask, threshold):
+    # masked entities whose value exceeds the value of every masked entity by more than threshold
+    return mask & ((values[:, np.newaxis] - values[np.newaxis, :] > threshold) | ~mask[np.newaxis, :]).all(axis=1)
+
+
+def exceeded(values, mask, threshold):
+    # masked entities whose value is exceeded by the value of some masked entity by more than threshold
+    return mask & ((values[np.newaxis, :] - values[:, np.newaxis] > threshold) & mask[np.newaxis, :]).any(axis=1)
@@ -1,3 +1,4 @@
+from shapeworld.world import EntityTable
 
 
 class Clause(object):
@@ -8,5 +9,18 @@ class Clause(object):
     def model(self):
         raise NotImplementedError
 
+    def signature(self):
+        # hashable canonical form of the clause, computed on every evaluation as captioners modify clauses in place,
+        # contains the signatures of the nested clauses, which evaluations pass on to them
+        raise NotImplementedError
+
     def agreement(self, entities):  # returns 0.0, 0.5, 1.0
+        table, indices = EntityTable.select(entities=entities)
+        return self.mask_agreement(table=table, mask=table.mask(indices=indices))
+
+    def mask_agreement(self, table, mask, signature=None):
+        # agreement with the entities of the table selected by the boolean mask, memoized by the table
+        return table.memoize(evaluation='agreement', clause=self, mask=mask, compute=self.compute_agreement, signature=signature)
+
+    def compute_agreement(self, table, mask, signature):
         raise NotImplementedError
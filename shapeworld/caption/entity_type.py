@@ -1,3 +1,4 @@
+import numpy as np
 from shapeworld.caption import Predicate, Attribute
 
 
@@ -20,17 +21,16 @@ class EntityType(Predicate):
     def model(self):
         return {'component': 'type', 'attributes': [attribute.model() for attribute in self.attributes]}
 
-    def agreeing_entities(self, entities):
-        for attribute in self.attributes:
-            entities = attribute.agreeing_entities(entities)
-        return entities
-
-    def disagreeing_entities(self, entities):
-        disagreeing_entities = []
-        disagreeing_ids = set()
-        for attribute in self.attributes:
-            for entity in attribute.disagreeing_entities(entities):
-                if entity.id not in disagreeing_ids:
-                    disagreeing_entities.append(entity)
-                    disagreeing_ids.add(entity.id)
-        return disagreeing_entities
+    def signature(self):
+        return ('type',) + tuple(attribute.signature() for attribute in self.attributes)
+
+    def compute_agreeing_mask(self, table, mask, signature):
+        for attribute, attribute_signature in zip(self.attributes, signature[1:]):
+            mask = attribute.agreeing_mask(table=table, mask=mask, signature=attribute_signature)
+        return mask
+
+    def compute_disagreeing_mask(self, table, mask, signature):
+        disagreeing = np.zeros_like(mask)
+        for attribute, attribute_signature in zip(self.attributes, signature[1:]):
+            disagreeing = disagreeing | attribute.disagreeing_mask(table=table, mask=mask, signature=attribute_signature)
+        return disagreeing
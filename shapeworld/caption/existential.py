@@ -1,4 +1,5 @@
 from __future__ import division
+import numpy as np
 from shapeworld.caption import Clause, EntityType, Relation
 
 
@@ -15,14 +16,18 @@ class Existential(Clause):
     def model(self):
         return {'component': 'existential', 'restrictor': self.restrictor.model(), 'body': self.body.model()}
 
-    def agreement(self, entities):
-        body_agreeing_entities = self.body.agreeing_entities(entities=entities)
-        num_entities = len(entities)
-        num_restrictor_disagreeing = len(self.restrictor.disagreeing_entities(entities=entities))
-        num_body_agreeing = len(body_agreeing_entities)
-        num_body_disagreeing = len(self.body.disagreeing_entities(entities=entities))
-        num_restrictor_body_agreeing = len(self.restrictor.agreeing_entities(entities=body_agreeing_entities))
-        num_restrictor_body_disagreeing = len(self.restrictor.disagreeing_entities(entities=body_agreeing_entities))
+    def signature(self):
+        return ('existential', self.restrictor.signature(), self.body.signature())
+
+    def compute_agreement(self, table, mask, signature):
+        _, restrictor_signature, body_signature = signature
+        body_agreeing = self.body.agreeing_mask(table=table, mask=mask, signature=body_signature)
+        num_entities = np.count_nonzero(mask)
+        num_restrictor_disagreeing = np.count_nonzero(self.restrictor.disagreeing_mask(table=table, mask=mask, signature=restrictor_signature))
+        num_body_agreeing = np.count_nonzero(body_agreeing)
+        num_body_disagreeing = np.count_nonzero(self.body.disagreeing_mask(table=table, mask=mask, signature=body_signature))
+        num_restrictor_body_agreeing = np.count_nonzero(self.restrictor.agreeing_mask(table=table, mask=body_agreeing, signature=restrictor_signature))
+        num_restrictor_body_disagreeing = np.count_nonzero(self.restrictor.disagreeing_mask(table=table, mask=body_agreeing, signature=restrictor_signature))
         # print(num_entities, num_restrictor_disagreeing, num_body_agreeing, num_body_disagreeing, num_restrictor_body_agreeing, num_restrictor_body_disagreeing)
 
         if num_restrictor_body_agreeing == num_entities:
@@ -1,18 +1,37 @@
+import numpy as np
 from shapeworld.caption import Clause
+from shapeworld.world import EntityTable
 
 
 class Predicate(Clause):
 
     def agreeing_entities(self, entities):
-        raise NotImplementedError
+        table, indices = EntityTable.select(entities=entities)
+        agreeing = self.agreeing_mask(table=table, mask=table.mask(indices=indices))
+        return [entity for entity, index in zip(entities, indices) if agreeing[index]]
 
     def disagreeing_entities(self, entities):
+        table, indices = EntityTable.select(entities=entities)
+        disagreeing = self.disagreeing_mask(table=table, mask=table.mask(indices=indices))
+        return [entity for entity, index in zip(entities, indices) if disagreeing[index]]
+
+    def agreeing_mask(self, table, mask, signature=None):
+        # boolean mask of the entities selected by mask which agree, memoized by the table
+        return table.memoize(evaluation='agreeing', clause=self, mask=mask, compute=self.compute_agreeing_mask, signature=signature)
+
+    def disagreeing_mask(self, table, mask, signature=None):
+        return table.memoize(evaluation='disagreeing', clause=self, mask=mask, compute=self.compute_disagreeing_mask, signature=signature)
+
+    def compute_agreeing_mask(self, table, mask, signature):
+        raise NotImplementedError
+
+    def compute_disagreeing_mask(self, table, mask, signature):
         raise NotImplementedError
 
-    def agreement(self, entities):
-        num_entities = len(entities)
-        num_agreeing = len(self.agreeing_entities(entities))
-        num_disagreeing = len(self.disagreeing_entities(entities))
+    def compute_agreement(self, table, mask, signature):
+        num_entities = np.count_nonzero(mask)
+        num_agreeing = np.count_nonzero(self.agreeing_mask(table=table, mask=mask, signature=signature))
+        num_disagreeing = np.count_nonzero(self.disagreeing_mask(table=table, mask=mask, signature=signature))
 
         if num_agreeing == num_entities:
             return 2.0
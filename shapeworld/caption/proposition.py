@@ -15,10 +15,14 @@ class Proposition(Clause):
     def model(self):
         return {'component': 'proposition', 'proptype': self.proptype, 'clauses': [clause.model() for clause in self.clauses]}
 
-    def agreement(self, entities):
+    def signature(self):
+        return ('proposition', self.proptype) + tuple(clause.signature() for clause in self.clauses)
+
+    def compute_agreement(self, table, mask, signature):
+        agreements = (clause.mask_agreement(table=table, mask=mask, signature=clause_signature) for clause, clause_signature in zip(self.clauses, signature[2:]))
         if self.proptype == 'conjunction':
-            return min(clause.agreement(entities) for clause in self.clauses)
+            return min(agreements)
         elif self.proptype == 'disjunction':
-            return max(clause.agreement(entities) for clause in self.clauses)
+            return max(agreements)
         elif self.proptype == 'exclusive-disjunction':
-            return float(sum(clause.agreement(entities) > 0.0 for clause in self.clauses) == 1)
+            return float(sum(agreement > 0.0 for agreement in agreements) == 1)
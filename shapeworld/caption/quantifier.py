@@ -1,4 +1,5 @@
 from __future__ import division
+import numpy as np
 from shapeworld.caption import Clause, EntityType, Relation, Settings
 
 
@@ -28,14 +29,18 @@ class Quantifier(Clause):
     def model(self):
         return {'component': 'quantifier', 'qtype': self.qtype, 'qrange': self.qrange, 'quantity': self.quantity, 'restrictor': self.restrictor.model(), 'body': self.body.model()}
 
-    def agreement(self, entities):
-        num_entities = len(entities)
-        restrictor_agreeing_entities = self.restrictor.agreeing_entities(entities=entities)
-        num_restrictor_agreeing = len(restrictor_agreeing_entities)
-        num_restrictor_disagreeing = len(self.restrictor.disagreeing_entities(entities=entities))
-        num_body_disagreeing = len(self.body.disagreeing_entities(entities=entities))
-        num_restrictor_body_agreeing = len(self.body.agreeing_entities(entities=restrictor_agreeing_entities))
-        num_restrictor_body_disagreeing = len(self.body.disagreeing_entities(entities=restrictor_agreeing_entities))
+    def signature(self):
+        return ('quantifier', self.qtype, self.qrange, self.quantity, self.restrictor.signature(), self.body.signature())
+
+    def compute_agreement(self, table, mask, signature):
+        restrictor_signature, body_signature = signature[4:]
+        num_entities = np.count_nonzero(mask)
+        restrictor_agreeing = self.restrictor.agreeing_mask(table=table, mask=mask, signature=restrictor_signature)
+        num_restrictor_agreeing = np.count_nonzero(restrictor_agreeing)
+        num_restrictor_disagreeing = np.count_nonzero(self.restrictor.disagreeing_mask(table=table, mask=mask, signature=restrictor_signature))
+        num_body_disagreeing = np.count_nonzero(self.body.disagreeing_mask(table=table, mask=mask, signature=body_signature))
+        num_restrictor_body_agreeing = np.count_nonzero(self.body.agreeing_mask(table=table, mask=restrictor_agreeing, signature=body_signature))
+        num_restrictor_body_disagreeing = np.count_nonzero(self.body.disagreeing_mask(table=table, mask=restrictor_agreeing, signature=body_signature))
 
         if num_restrictor_body_agreeing == num_entities:  # special case: all entities agree
             if self.qrange == 'geq' or (self.qrange in ('eq', 'eq-all') and self.quantity > 0.0):
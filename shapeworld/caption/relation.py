@@ -1,3 +1,4 @@
+import numpy as np
 from shapeworld.caption import Predicate, EntityType, Settings
 
 
@@ -35,123 +36,108 @@ class Relation(Predicate):
         else:
             return dict(component='relation', reltype=self.reltype, value=self.value, reference=self.reference.model(), comparison=self.comparison.model())
 
-    def agreeing_entities(self, entities):
+    def signature(self):
         if self.reltype == 'attribute' or self.reltype == 'type':
-            return self.value.agreeing_entities(entities=entities)
+            return ('relation', self.reltype, self.value.signature())
+        elif self.reltype in Relation.ternary_relations:
+            return ('relation', self.reltype, self.value, self.reference.signature(), self.comparison.signature())
+        else:
+            # the comparison does not affect binary relations
+            return ('relation', self.reltype, self.value, self.reference.signature())
+
+    def compute_agreeing_mask(self, table, mask, signature):
+        if self.reltype == 'attribute' or self.reltype == 'type':
+            return self.value.agreeing_mask(table=table, mask=mask, signature=signature[2])
 
-        reference_entities = self.reference.agreeing_entities(entities=entities)
+        reference = self.reference.agreeing_mask(table=table, mask=mask, signature=signature[3])
+        # pairwise offsets and distances, indexed [entity, reference]
+        dx, dy, distances = table.geometry()
 
         if self.reltype == 'x-rel':
             # min distance in case of overlap
-            return [entity for entity in entities if any((entity.center.x - reference.center.x) * self.value > max(Settings.min_distance, abs(entity.center.y - reference.center.y)) for reference in reference_entities)]
+            return mask & ((dx * self.value > np.maximum(Settings.min_distance, np.abs(dy))) & reference[np.newaxis, :]).any(axis=1)
 
         elif self.reltype == 'y-rel':
-            return [entity for entity in entities if any((entity.center.y - reference.center.y) * self.value > max(Settings.min_distance, abs(entity.center.x - reference.center.x)) for reference in reference_entities)]
+            return mask & ((dy * self.value > np.maximum(Settings.min_distance, np.abs(dx))) & reference[np.newaxis, :]).any(axis=1)
 
         elif self.reltype == 'z-rel':
-            return [entity for entity in entities if any(entity.collides(reference, ratio=True, symmetric=True) > 0.0 and entity.id * self.value > reference.id * self.value for reference in reference_entities)]
+            above = table.z[:, np.newaxis] * self.value > table.z[np.newaxis, :] * self.value
+            return mask & ((table.collision > 0.0) & above & reference[np.newaxis, :]).any(axis=1)
 
         elif self.reltype == 'proximity-max':
-            # min distance to second
-            agreeing_ids = set()
-            for reference in reference_entities:
-                max_distance = -1.0
-                max_entity = None
-                significant = False
-                for entity in entities:
-                    if entity.id == reference.id:
-                        continue
-                    distance = (entity.center - reference.center).length * self.value
-                    if distance > max_distance:
-                        significant = (distance - max_distance) > Settings.min_distance
-                        max_distance = distance
-                        max_entity = entity
-                if significant:
-                    agreeing_ids.add(max_entity.id)
-            return [entity for entity in entities if entity.id in agreeing_ids]
+            # min distance to second, where second is the running maximum over the entities in order before the maximal one
+            agreeing = np.zeros_like(mask)
+            if not mask.any():
+                return agreeing
+            num_entities = len(table)
+            distances = np.where(mask[:, np.newaxis] & ~np.eye(num_entities, dtype=bool), distances * self.value, -np.inf)
+            previous = np.maximum.accumulate(np.concatenate([np.full(shape=(1, num_entities), fill_value=-1.0), distances[:-1]], axis=0), axis=0)
+            updates = distances > previous
+            maximal = num_entities - 1 - np.argmax(updates[::-1], axis=0)
+            references = np.arange(num_entities)
+            significant = reference & updates.any(axis=0) & (distances[maximal, references] - previous[maximal, references] > Settings.min_distance)
+            agreeing[maximal[significant]] = True
+            return agreeing
 
         elif self.reltype == 'proximity-rel':
             # min distance to second
-            comparison_entities = self.comparison.agreeing_entities(entities=entities)
-            agreeing_ids = set()
-            for reference in reference_entities:
-                for comparison in comparison_entities:
-                    if reference.id == comparison.id:
-                        continue
-                    reference_distance = (comparison.center - reference.center).length * self.value
-                    for entity in entities:
-                        if entity.id == reference.id or entity.id == comparison.id:
-                            continue
-                        if (entity.center - reference.center).length * self.value - reference_distance > Settings.min_distance:
-                            agreeing_ids.add(entity.id)
-            # print([entity for entity in entities if entity.id in agreeing_ids])
-            return [entity for entity in entities if entity.id in agreeing_ids]
+            comparison = self.comparison.agreeing_mask(table=table, mask=mask, signature=signature[4])
+            distances = distances * self.value
+            # indexed [entity, reference, comparison]
+            differences = distances[:, :, np.newaxis] - distances.T[np.newaxis, :, :]
+            return mask & ((differences > Settings.min_distance) & proximity_triples(reference=reference, comparison=comparison)).any(axis=(1, 2))
 
         elif self.reltype == 'size-rel':
             # min difference
-            return [entity for entity in entities if any(entity.shape.area * self.value - reference.shape.area * self.value > Settings.min_area for reference in reference_entities)]
+            return mask & ((table.area[:, np.newaxis] * self.value - table.area[np.newaxis, :] * self.value > Settings.min_area) & reference[np.newaxis, :]).any(axis=1)
 
         elif self.reltype == 'shade-rel':
             # min difference
-            return [entity for entity in entities if any(entity.color.shade * self.value - reference.color.shade * self.value > Settings.min_shade for reference in reference_entities)]
+            return mask & ((table.shade[:, np.newaxis] * self.value - table.shade[np.newaxis, :] * self.value > Settings.min_shade) & reference[np.newaxis, :]).any(axis=1)
 
-    def disagreeing_entities(self, entities):
+    def compute_disagreeing_mask(self, table, mask, signature):
         if self.reltype == 'attribute' or self.reltype == 'type':
-            return self.value.disagreeing_entities(entities=entities)
+            return self.value.disagreeing_mask(table=table, mask=mask, signature=signature[2])
 
-        reference_entities = self.reference.agreeing_entities(entities=entities)
+        reference = self.reference.agreeing_mask(table=table, mask=mask, signature=signature[3])
+        dx, dy, distances = table.geometry()
 
         if self.reltype == 'x-rel':
-            return [entity for entity in entities if all((entity.center.x - reference.center.x) * self.value <= 0.0 for reference in reference_entities)]
+            return mask & ((dx * self.value <= 0.0) | ~reference[np.newaxis, :]).all(axis=1)
 
         elif self.reltype == 'y-rel':
-            return [entity for entity in entities if all((entity.center.y - reference.center.y) * self.value <= 0.0 for reference in reference_entities)]
+            return mask & ((dy * self.value <= 0.0) | ~reference[np.newaxis, :]).all(axis=1)
 
         elif self.reltype == 'z-rel':
-            not_disagreeing_ids = set()
-            for entity in entities:
-                for reference in reference_entities:
-                    collision = entity.collides(reference, ratio=True, symmetric=True)
-                    if collision > 0.0 and (collision <= Settings.min_overlap or entity.id * self.value > reference.id * self.value):
-                        not_disagreeing_ids.add(entity.id)
-                        break
-            return [entity for entity in entities if entity.id not in not_disagreeing_ids]
+            above = table.z[:, np.newaxis] * self.value > table.z[np.newaxis, :] * self.value
+            not_disagreeing = (table.collision > 0.0) & ((table.collision <= Settings.min_overlap) | above)
+            return mask & ~(not_disagreeing & reference[np.newaxis, :]).any(axis=1)
 
         elif self.reltype == 'proximity-max':
-            not_disagreeing_ids = set()
-            for reference in reference_entities:
-                max_distance = -1.0
-                max_entities = list()
-                for entity in entities:
-                    if entity.id == reference.id:
-                        continue
-                    distance = (entity.center - reference.center).length * self.value
-                    if distance > max_distance:
-                        max_distance = distance
-                        max_entities = [(e, d) for e, d in max_entities if max_distance - d < Settings.min_distance]
-                    if max_distance - distance < Settings.min_distance:
-                        max_entities.append((entity, distance))
-                not_disagreeing_ids.update(e.id for e, _ in max_entities)
-            return [entity for entity in entities if entity.id not in not_disagreeing_ids]
+            # all entities within min distance of the maximal one
+            if not mask.any():
+                return np.zeros_like(mask)
+            num_entities = len(table)
+            distances = np.where(mask[:, np.newaxis] & ~np.eye(num_entities, dtype=bool), distances * self.value, -np.inf)
+            max_distances = np.maximum(distances.max(axis=0), -1.0)
+            not_disagreeing = (max_distances[np.newaxis, :] - distances < Settings.min_distance) & reference[np.newaxis, :]
+            return mask & ~not_disagreeing.any(axis=1)
 
         elif self.reltype == 'proximity-rel':
             # min distance to second
-            comparison_entities = self.comparison.agreeing_entities(entities=entities)
-            not_disagreeing_ids = set()
-            for reference in reference_entities:
-                for comparison in comparison_entities:
-                    if reference.id == comparison.id:
-                        continue
-                    reference_distance = (comparison.center - reference.center).length * self.value
-                    for entity in entities:
-                        if entity.id == reference.id or entity.id == comparison.id:
-                            continue
-                        if reference_distance - (entity.center - reference.center).length * self.value > Settings.min_distance:
-                            not_disagreeing_ids.add(entity.id)
-            return [entity for entity in entities if entity.id not in not_disagreeing_ids]
+            comparison = self.comparison.agreeing_mask(table=table, mask=mask, signature=signature[4])
+            distances = distances * self.value
+            differences = distances.T[np.newaxis, :, :] - distances[:, :, np.newaxis]
+            return mask & ~((differences > Settings.min_distance) & proximity_triples(reference=reference, comparison=comparison)).any(axis=(1, 2))
 
         elif self.reltype == 'size-rel':
-            return [entity for entity in entities if all(reference.shape.area * self.value - entity.shape.area * self.value > Settings.min_area for reference in reference_entities)]
+            return mask & ((table.area[np.newaxis, :] * self.value - table.area[:, np.newaxis] * self.value > Settings.min_area) | ~reference[np.newaxis, :]).all(axis=1)
 
         elif self.reltype == 'shade-rel':
-            return [entity for entity in entities if all(reference.color.shade * self.value - entity.color.shade * self.value > Settings.min_shade for reference in reference_entities)]
+            return mask & ((table.shade[np.newaxis, :] * self.value - table.shade[:, np.newaxis] * self.value > Settings.min_shade) | ~reference[np.newaxis, :]).all(axis=1)
+
+
+def proximity_triples(reference, comparison):
+    # [entity, reference, comparison] triples of distinct entities with reference and comparison agreeing
+    different = ~np.eye(len(reference), dtype=bool)
+    return (reference[:, np.newaxis] & comparison[np.newaxis, :] & different)[np.newaxis, :, :] & different[:, :, np.newaxis] & different[:, np.newaxis, :]
@@ -3,6 +3,7 @@ from random import choice, random
 from shapeworld import util
 from shapeworld.caption import Attribute, EntityType, Relation
 from shapeworld.captioners import WorldCaptioner
+from shapeworld.captioners.attributes_type import attributes_candidates
 
 
 class AttributesRelationCaptioner(WorldCaptioner):
@@ -19,8 +20,8 @@ class AttributesRelationCaptioner(WorldCaptioner):
     # 1: hypernym
     # 2: attribute
 
-    def __init__(self, shapes=None, colors=None, textures=None, attribute_distribution=None, existing_attribute_ratio=None, incorrect_distribution=None, trivial_acceptance_rate=None):
-        super(AttributesRelationCaptioner, self).__init__(trivial_acceptance_rate=trivial_acceptance_rate)
+    def __init__(self, shapes=None, colors=None, textures=None, attribute_distribution=None, existing_attribute_ratio=None, incorrect_distribution=None, trivial_acceptance_rate=None, enumerate_candidates=None):
+        super(AttributesRelationCaptioner, self).__init__(trivial_acceptance_rate=trivial_acceptance_rate, enumerate_candidates=enumerate_candidates)
         self.shapes = shapes
         self.colors = colors
         self.textures = textures
@@ -145,3 +146,15 @@ class AttributesRelationCaptioner(WorldCaptioner):
                 attributes = choice([comb for n in range(len(attributes)) for comb in combinations(attributes, n)])
             etype = EntityType(attributes=attributes)
             return Relation(reltype='type', value=etype)
+
+    def caption_candidates(self, entities, relevant_entities):
+        candidates = list()
+        for attributes, probability in attributes_candidates(captioner=self, entities=entities, relevant_entities=relevant_entities):
+            if self.attribute_mode == 2:  # attribute
+                candidates.extend((Relation(reltype='attribute', value=attribute), probability / len(attributes)) for attribute in attributes if (attribute.attrtype, attribute.value) in self.attributes)
+            elif self.attribute_mode == 0:  # full type
+                candidates.append((Relation(reltype='type', value=EntityType(attributes=attributes)), probability))
+            elif self.attribute_mode == 1:  # hypernym
+                hypernyms = [comb for n in range(len(attributes)) for comb in combinations(attributes, n)]
+                candidates.extend((Relation(reltype='type', value=EntityType(attributes=hypernym)), probability / len(hypernyms)) for hypernym in hypernyms)
+        return candidates
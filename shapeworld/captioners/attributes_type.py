@@ -1,10 +1,54 @@
-from itertools import combinations
+from itertools import combinations, product
 from random import choice, random
 from shapeworld import util
 from shapeworld.caption import Attribute, EntityType
 from shapeworld.captioners import WorldCaptioner
 
 
+def attributes_candidates(captioner, entities, relevant_entities):
+    # enumerates the attributes chosen by caption_world of AttributesTypeCaptioner and AttributesRelationCaptioner, as
+    # (attributes, probability) pairs
+    if captioner.correct and len(relevant_entities) == 0:
+        return []
+
+    if captioner.existing_attribute and captioner.incorrect_mode > 0:
+        shapes = set(entity.shape.name for entity in entities if entity.shape.name in captioner.shapes)
+        colors = set(entity.color.name for entity in entities if entity.color.name in captioner.colors)
+        textures = set(entity.texture.name for entity in entities if entity.texture.name in captioner.textures)
+    else:
+        shapes = captioner.shapes
+        colors = captioner.colors
+        textures = captioner.textures
+
+    if (len(shapes) <= 1 and captioner.incorrect_mode == 1) or (len(colors) <= 1 and captioner.incorrect_mode == 2) or (len(textures) <= 1 and captioner.incorrect_mode == 3):
+        return []
+    if captioner.incorrect_mode == 4 and len(shapes) <= 1 and len(colors) <= 1 and len(textures) <= 1:
+        return []
+
+    # probability per choice of (attrtype, value) pairs, in order of first occurrence
+    candidates = dict()
+    for entity in relevant_entities:
+        # per attribute, the (attrtype, value, probability) alternatives it is replaced with
+        alternatives = list()
+        for incorrect_mode, attrtype, all_values, values, value in ((1, 'shape', captioner.shapes, shapes, entity.shape.name), (2, 'color', captioner.colors, colors, entity.color.name), (3, 'texture', captioner.textures, textures, entity.texture.name)):
+            if len(all_values) <= 1:
+                continue
+            if captioner.incorrect_mode == incorrect_mode:  # random (existing) value
+                values = [other for other in values if other != value]
+            elif captioner.incorrect_mode == 4 and len(values) > 1:  # random (existing) values
+                values = list(values)
+            else:
+                values = [value]
+            alternatives.append([(attrtype, alternative, 1.0 / len(values)) for alternative in values])
+        for attribute_values in product(*alternatives):
+            probability = 1.0 / len(relevant_entities)
+            for _, _, value_probability in attribute_values:
+                probability *= value_probability
+            key = tuple((attrtype, value) for attrtype, value, _ in attribute_values)
+            candidates[key] = candidates.get(key, 0.0) + probability
+    return [([Attribute(attrtype=attrtype, value=value) for attrtype, value in key], probability) for key, probability in candidates.items()]
+
+
 class AttributesTypeCaptioner(WorldCaptioner):
 
     # incorrect modes
@@ -14,8 +58,8 @@ class AttributesTypeCaptioner(WorldCaptioner):
     # 3: incorrect texture
     # 4: incorrect attributes
 
-    def __init__(self, shapes=None, colors=None, textures=None, hypernym_ratio=None, existing_attribute_ratio=None, incorrect_distribution=None, trivial_acceptance_rate=None):
-        super(AttributesTypeCaptioner, self).__init__(trivial_acceptance_rate=trivial_acceptance_rate)
+    def __init__(self, shapes=None, colors=None, textures=None, hypernym_ratio=None, existing_attribute_ratio=None, incorrect_distribution=None, trivial_acceptance_rate=None, enumerate_candidates=None):
+        super(AttributesTypeCaptioner, self).__init__(trivial_acceptance_rate=trivial_acceptance_rate, enumerate_candidates=enumerate_candidates)
         self.shapes = shapes
         self.colors = colors
         self.textures = textures
@@ -127,3 +171,15 @@ class AttributesTypeCaptioner(WorldCaptioner):
             attributes = attributes
 
         return EntityType(attributes=attributes)
+
+    def caption_candidates(self, entities, relevant_entities):
+        candidates = list()
+        for attributes, probability in attributes_candidates(captioner=self, entities=entities, relevant_entities=relevant_entities):
+            if self.hypernym:
+                hypernyms = [comb for n in range(len(attributes)) for comb in combinations(attributes, n)]
+                if not hypernyms:
+                    continue
+                candidates.extend((EntityType(attributes=hypernym), probability / len(hypernyms)) for hypernym in hypernyms)
+            else:
+                candidates.append((EntityType(attributes=attributes), probability))
+        return candidates
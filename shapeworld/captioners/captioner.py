@@ -1,14 +1,38 @@
 from random import random
 from shapeworld import util
+from shapeworld.world import EntityTable
+
+
+def merge_candidates(candidates):
+    # sums the probabilities of candidates with the same caption, in order of first occurrence
+    merged = dict()
+    for caption, probability in candidates:
+        signature = caption.signature()
+        if signature in merged:
+            merged[signature][1] += probability
+        else:
+            merged[signature] = [caption, probability]
+    return [(caption, probability) for caption, probability in merged.values()]
+
+
+def sample_candidate(candidates):
+    # samples a caption from (caption, probability) pairs, None if there are none
+    if not candidates:
+        return None
+    return util.sample(util.cumulative_distribution([probability for _, probability in candidates]), [caption for caption, _ in candidates])
 
 
 class WorldCaptioner(object):
 
     MAX_ATTEMPTS = 3
+    MAX_CANDIDATES = 1000
 
-    def __init__(self, internal_captioners=None, trivial_acceptance_rate=None):
+    def __init__(self, internal_captioners=None, trivial_acceptance_rate=None, enumerate_candidates=None):
         self.internal_captioners = list(util.value_or_default(internal_captioners, ()))
         self.trivial_acceptance_rate = trivial_acceptance_rate
+        # enumerate all candidate captions for the world and sample among the acceptable ones, instead of sampling captions
+        # until one is acceptable, where supported by the captioner
+        self.enumerate_candidates = util.value_or_default(enumerate_candidates, False)
         if trivial_acceptance_rate is not None:
             captioners = list(self.internal_captioners)
             while captioners:
@@ -18,6 +42,7 @@ class WorldCaptioner(object):
                     captioners.extend(captioner.internal_captioners)
         self.realizer = None
         self.correct = None
+        self.enumerated = False
 
     def __str__(self):
         return self.__class__.__name__
@@ -61,19 +86,52 @@ class WorldCaptioner(object):
         if relevant_entities is None:
             relevant_entities = entities
 
+        if self.enumerate_candidates:
+            candidates = self.accepted_candidates(entities=entities, relevant_entities=relevant_entities)
+            # whether the caption was sampled from all acceptable candidates, so that no caption means none exists
+            self.enumerated = candidates is not None
+            if self.enumerated:
+                return sample_candidate(candidates=candidates)
+
         for _ in range(self.__class__.MAX_ATTEMPTS):
             caption = captioner(entities=entities, relevant_entities=relevant_entities)
             if caption is None:
                 continue
-            agreement = caption.agreement(entities=relevant_entities)
-            if agreement == 0.0:
-                continue
-            elif ((agreement == 2.0 and self.correct) or (agreement == -2.0 and not self.correct)) and not self.trivial_accepted:
-                continue
-            elif (agreement > 0.0 and self.correct) or (agreement < 0.0 and not self.correct):
+            if self.accepts(agreement=caption.agreement(entities=relevant_entities)):
                 return caption
         return None
 
+    def accepts(self, agreement):
+        if agreement == 0.0:
+            return False
+        elif ((agreement == 2.0 and self.correct) or (agreement == -2.0 and not self.correct)) and not self.trivial_accepted:
+            return False
+        else:
+            return (agreement > 0.0 and self.correct) or (agreement < 0.0 and not self.correct)
+
+    def accepted_candidates(self, entities, relevant_entities=None):
+        # the captions __call__ may return, with the probabilities that it returns them: conditioned on acceptance, times
+        # the probability that a caption is accepted within MAX_ATTEMPTS, which enclosing captioners depend on, None if
+        # the captioner does not enumerate its captions
+        if relevant_entities is None:
+            relevant_entities = entities
+        candidates = self.caption_candidates(entities=entities, relevant_entities=relevant_entities)
+        if candidates is None:
+            return None
+        table, indices = EntityTable.select(entities=relevant_entities)
+        mask = table.mask(indices=indices)
+        candidates = [(caption, probability) for caption, probability in merge_candidates(candidates=candidates) if self.accepts(agreement=caption.mask_agreement(table=table, mask=mask))]
+        if not candidates:
+            return candidates
+        total = sum(probability for _, probability in candidates)
+        success = 1.0 - (1.0 - min(total, 1.0)) ** self.__class__.MAX_ATTEMPTS
+        return [(caption, probability / total * success) for caption, probability in candidates]
+
+    def caption_candidates(self, entities, relevant_entities):
+        # all captions caption_world may return for the sampled values, as (caption, probability) pairs, None if not
+        # supported by the captioner or if there are more than MAX_CANDIDATES, in which case captions are sampled
+        return None
+
     def caption_world(self, entities, relevant_entities):
         raise NotImplementedError
 
@@ -89,12 +147,12 @@ class WorldCaptioner(object):
 
 class CaptionerMixer(WorldCaptioner):
 
-    def __init__(self, captioners, distribution=None, train_distribution=None, validation_distribution=None, test_distribution=None, trivial_acceptance_rate=None):
+    def __init__(self, captioners, distribution=None, train_distribution=None, validation_distribution=None, test_distribution=None, trivial_acceptance_rate=None, enumerate_candidates=None):
         assert len(captioners) >= 1
         assert not distribution or len(distribution) == len(captioners)
         assert bool(train_distribution) == bool(validation_distribution) == bool(test_distribution)
         assert not train_distribution or len(train_distribution) == len(validation_distribution) == len(test_distribution) == len(distribution)
-        super(CaptionerMixer, self).__init__(internal_captioners=captioners, trivial_acceptance_rate=trivial_acceptance_rate)
+        super(CaptionerMixer, self).__init__(internal_captioners=captioners, trivial_acceptance_rate=trivial_acceptance_rate, enumerate_candidates=enumerate_candidates)
         distribution = util.value_or_default(distribution, [1] * len(captioners))
         self.distribution = util.cumulative_distribution(distribution)
         self.train_distribution = util.cumulative_distribution(util.value_or_default(train_distribution, distribution))
@@ -124,6 +182,9 @@ class CaptionerMixer(WorldCaptioner):
     def caption_world(self, entities, relevant_entities):
         return self.captioner.caption_world(entities=entities, relevant_entities=relevant_entities)
 
+    def caption_candidates(self, entities, relevant_entities):
+        return self.captioner.caption_candidates(entities=entities, relevant_entities=relevant_entities)
+
     def caption_train_world(self, entities, relevant_entities):
         return self.captioner.caption_train_world(entities=entities, relevant_entities=relevant_entities)
 
@@ -14,10 +14,10 @@ class ComparisonRelationCaptioner(WorldCaptioner):
 
     comparison_reltypes = ('size-rel', 'shade-rel')
 
-    def __init__(self, reference_captioner=None, relations=None, incorrect_distribution=None, trivial_acceptance_rate=None):
+    def __init__(self, reference_captioner=None, relations=None, incorrect_distribution=None, trivial_acceptance_rate=None, enumerate_candidates=None):
         assert relations is None or all(reltype in ComparisonRelationCaptioner.comparison_reltypes for reltype in relations)
         self.reference_captioner = util.value_or_default(reference_captioner, AttributesTypeCaptioner())
-        super(ComparisonRelationCaptioner, self).__init__(internal_captioners=(self.reference_captioner,), trivial_acceptance_rate=trivial_acceptance_rate)
+        super(ComparisonRelationCaptioner, self).__init__(internal_captioners=(self.reference_captioner,), trivial_acceptance_rate=trivial_acceptance_rate, enumerate_candidates=enumerate_candidates)
         self.relations = relations
         self.incorrect_distribution = util.cumulative_distribution(util.value_or_default(incorrect_distribution, [1, 1, 1]))
 
@@ -74,3 +74,27 @@ class ComparisonRelationCaptioner(WorldCaptioner):
 
         else:
             return relation
+
+    def caption_candidates(self, entities, relevant_entities):
+        if self.correct and len(entities) <= 1:
+            return []
+
+        references = self.reference_captioner.accepted_candidates(entities=entities)
+        if references is None:
+            return None
+
+        candidates = list()
+        for reference, probability in references:
+            relation = Relation(reltype=self.reltype, value=self.value, reference=reference)
+
+            if self.incorrect_mode == 1:  # 1: incorrect comparison relation
+                if relation.agreement(entities=relevant_entities) > 0.0:
+                    candidates.extend((Relation(reltype=reltype, value=value, reference=reference), probability / len(self.incorrect_relations)) for reltype, value in self.incorrect_relations)
+
+            elif self.incorrect_mode == 2:  # 2: inverse comparison
+                if relation.agreement(entities=relevant_entities) > 0.0:
+                    candidates.append((Relation(reltype=self.reltype, value=-self.value, reference=reference), probability))
+
+            else:
+                candidates.append((relation, probability))
+        return candidates
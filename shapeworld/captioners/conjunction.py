@@ -12,8 +12,8 @@ class ConjunctionCaptioner(WorldCaptioner):
     # 2: incorrect (first incorrect)
     # 3: incorrect (both incorrect)
 
-    def __init__(self, captioners, incorrect_distribution=None, trivial_acceptance_rate=None):
-        super(ConjunctionCaptioner, self).__init__(internal_captioners=captioners, trivial_acceptance_rate=trivial_acceptance_rate)
+    def __init__(self, captioners, incorrect_distribution=None, trivial_acceptance_rate=None, enumerate_candidates=None):
+        super(ConjunctionCaptioner, self).__init__(internal_captioners=captioners, trivial_acceptance_rate=trivial_acceptance_rate, enumerate_candidates=enumerate_candidates)
         self.incorrect_distribution = util.cumulative_distribution(util.value_or_default(incorrect_distribution, [1, 1, 1]))
 
     def set_realizer(self, realizer):
@@ -58,3 +58,14 @@ class ConjunctionCaptioner(WorldCaptioner):
             return None
 
         return Proposition(proptype='conjunction', clauses=(clause1, clause2))
+
+    def caption_candidates(self, entities, relevant_entities):
+        candidates1 = self.captioner1.caption_candidates(entities=entities, relevant_entities=relevant_entities)
+        if candidates1 is None:
+            return None
+
+        candidates2 = self.captioner2.caption_candidates(entities=entities, relevant_entities=relevant_entities)
+        if candidates2 is None or len(candidates1) * len(candidates2) > self.__class__.MAX_CANDIDATES:
+            return None
+
+        return [(Proposition(proptype='conjunction', clauses=(clause1, clause2)), probability1 * probability2) for clause1, probability1 in candidates1 for clause2, probability2 in candidates2]
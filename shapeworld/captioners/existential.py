@@ -10,10 +10,10 @@ class ExistentialCaptioner(WorldCaptioner):
     # 1: incorrect restrictor
     # 2: incorrect body
 
-    def __init__(self, restrictor_captioner=None, body_captioner=None, incorrect_distribution=None, trivial_acceptance_rate=None):
+    def __init__(self, restrictor_captioner=None, body_captioner=None, incorrect_distribution=None, trivial_acceptance_rate=None, enumerate_candidates=None):
         self.restrictor_captioner = util.value_or_default(restrictor_captioner, AttributesTypeCaptioner())
         self.body_captioner = util.value_or_default(body_captioner, AttributesTypeCaptioner())
-        super(ExistentialCaptioner, self).__init__(internal_captioners=(self.restrictor_captioner, self.body_captioner), trivial_acceptance_rate=trivial_acceptance_rate)
+        super(ExistentialCaptioner, self).__init__(internal_captioners=(self.restrictor_captioner, self.body_captioner), trivial_acceptance_rate=trivial_acceptance_rate, enumerate_candidates=enumerate_candidates)
         self.incorrect_distribution = util.cumulative_distribution(util.value_or_default(incorrect_distribution, [1, 1]))
 
     def sample_values(self, mode, correct):
@@ -45,3 +45,22 @@ class ExistentialCaptioner(WorldCaptioner):
             return None
 
         return Existential(restrictor=restrictor, body=body)
+
+    def caption_candidates(self, entities, relevant_entities):
+        bodies = self.body_captioner.accepted_candidates(entities=entities, relevant_entities=relevant_entities)
+        if bodies is None:
+            return None
+
+        candidates = list()
+        for body, body_probability in bodies:
+            if self.incorrect_mode == 2:  # 2: incorrect body
+                relevant_entities_restrictor = body.disagreeing_entities(entities=relevant_entities)
+            else:
+                relevant_entities_restrictor = body.agreeing_entities(entities=relevant_entities)
+
+            restrictors = self.restrictor_captioner.accepted_candidates(entities=entities, relevant_entities=relevant_entities_restrictor)
+            if restrictors is None:
+                return None
+
+            candidates.extend((Existential(restrictor=restrictor, body=body), body_probability * restrictor_probability) for restrictor, restrictor_probability in restrictors)
+        return candidates
@@ -12,10 +12,10 @@ class RelativeQuantifierCaptioner(WorldCaptioner):
     # 2: incorrect restrictor
     # 3: incorrect body
 
-    def __init__(self, restrictor_captioner=None, body_captioner=None, incorrect_distribution=None, trivial_acceptance_rate=None):
+    def __init__(self, restrictor_captioner=None, body_captioner=None, incorrect_distribution=None, trivial_acceptance_rate=None, enumerate_candidates=None):
         self.restrictor_captioner = util.value_or_default(restrictor_captioner, AttributesTypeCaptioner())
         self.body_captioner = util.value_or_default(body_captioner, AttributesRelationCaptioner())
-        super(RelativeQuantifierCaptioner, self).__init__(internal_captioners=(self.restrictor_captioner, self.body_captioner), trivial_acceptance_rate=trivial_acceptance_rate)
+        super(RelativeQuantifierCaptioner, self).__init__(internal_captioners=(self.restrictor_captioner, self.body_captioner), trivial_acceptance_rate=trivial_acceptance_rate, enumerate_candidates=enumerate_candidates)
         self.incorrect_distribution = util.cumulative_distribution(util.value_or_default(incorrect_distribution, [2, 1, 1]))
 
     def set_realizer(self, realizer):
@@ -74,3 +74,31 @@ class RelativeQuantifierCaptioner(WorldCaptioner):
 
         else:
             return quantifier
+
+    def caption_candidates(self, entities, relevant_entities):
+        bodies = self.body_captioner.accepted_candidates(entities=entities, relevant_entities=relevant_entities)
+        if bodies is None:
+            return None
+
+        candidates = list()
+        for body, body_probability in bodies:
+            if self.incorrect_mode == 3:  # 3: incorrect body
+                relevant_entities_restrictor = body.disagreeing_entities(entities=relevant_entities)
+            else:
+                relevant_entities_restrictor = body.agreeing_entities(entities=relevant_entities)
+
+            restrictors = self.restrictor_captioner.accepted_candidates(entities=entities, relevant_entities=relevant_entities_restrictor)
+            if restrictors is None:
+                return None
+
+            for restrictor, restrictor_probability in restrictors:
+                probability = body_probability * restrictor_probability
+                quantifier = Quantifier(qtype='relative', qrange=self.qrange, quantity=self.quantity, restrictor=restrictor, body=body)
+
+                if self.incorrect_mode == 1:  # 1: incorrect quantifier
+                    if (quantifier.agreement(entities=relevant_entities) > 0.0 and self.correct) or (quantifier.agreement(entities=relevant_entities) < 0.0 and not self.correct):
+                        candidates.extend((Quantifier(qtype='relative', qrange=qrange, quantity=quantity, restrictor=restrictor, body=body), probability / len(self.incorrect_quantifiers)) for qrange, quantity in self.incorrect_quantifiers)
+
+                else:
+                    candidates.append((quantifier, probability))
+        return candidates
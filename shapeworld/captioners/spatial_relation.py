@@ -2,6 +2,7 @@ from random import choice
 from shapeworld import util
 from shapeworld.caption import Relation
 from shapeworld.captioners import WorldCaptioner, AttributesTypeCaptioner
+from shapeworld.captioners.captioner import sample_candidate
 
 
 class SpatialRelationCaptioner(WorldCaptioner):
@@ -15,11 +16,11 @@ class SpatialRelationCaptioner(WorldCaptioner):
 
     spatial_reltypes = ('x-rel', 'y-rel', 'z-rel', 'proximity-max', 'proximity-rel')
 
-    def __init__(self, reference_captioner=None, comparison_captioner=None, relations=None, incorrect_distribution=None, trivial_acceptance_rate=None):
+    def __init__(self, reference_captioner=None, comparison_captioner=None, relations=None, incorrect_distribution=None, trivial_acceptance_rate=None, enumerate_candidates=None):
         assert relations is None or all(reltype in SpatialRelationCaptioner.spatial_reltypes for reltype in relations)
         self.reference_captioner = util.value_or_default(reference_captioner, AttributesTypeCaptioner())
         self.comparison_captioner = util.value_or_default(comparison_captioner, AttributesTypeCaptioner())
-        super(SpatialRelationCaptioner, self).__init__(internal_captioners=(self.reference_captioner, self.comparison_captioner), trivial_acceptance_rate=trivial_acceptance_rate)
+        super(SpatialRelationCaptioner, self).__init__(internal_captioners=(self.reference_captioner, self.comparison_captioner), trivial_acceptance_rate=trivial_acceptance_rate, enumerate_candidates=enumerate_candidates)
         self.relations = relations
         self.incorrect_distribution = util.cumulative_distribution(util.value_or_default(incorrect_distribution, [1, 1, 1, 1]))
 
@@ -89,3 +90,36 @@ class SpatialRelationCaptioner(WorldCaptioner):
 
         else:
             return relation
+
+    def caption_candidates(self, entities, relevant_entities):
+        if self.correct and len(entities) <= 1 + (self.reltype in Relation.ternary_relations):
+            return []
+
+        references = self.reference_captioner.accepted_candidates(entities=entities)
+        comparisons = self.comparison_captioner.accepted_candidates(entities=entities)
+        if references is None or comparisons is None:
+            return None
+        elif not references or not comparisons:
+            return []
+
+        # the comparison only needs to be enumerated if it can affect the relation
+        if self.reltype not in Relation.ternary_relations and (self.incorrect_mode != 1 or all(reltype not in Relation.ternary_relations for reltype, _ in self.incorrect_relations)):
+            comparisons = [(sample_candidate(candidates=comparisons), sum(probability for _, probability in comparisons))]
+
+        candidates = list()
+        for reference, reference_probability in references:
+            for comparison, comparison_probability in comparisons:
+                probability = reference_probability * comparison_probability
+                relation = Relation(reltype=self.reltype, value=self.value, reference=reference, comparison=comparison)
+
+                if self.incorrect_mode == 1:  # 1: incorrect spatial relation
+                    if relation.agreement(entities=relevant_entities) > 0.0:
+                        candidates.extend((Relation(reltype=reltype, value=value, reference=reference, comparison=comparison), probability / len(self.incorrect_relations)) for reltype, value in self.incorrect_relations)
+
+                elif self.incorrect_mode == 2:  # 2: inverse direction
+                    if relation.agreement(entities=relevant_entities) > 0.0:
+                        candidates.append((Relation(reltype=self.reltype, value=-self.value, reference=reference, comparison=comparison), probability))
+
+                else:
+                    candidates.append((relation, probability))
+        return candidates
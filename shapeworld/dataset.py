@@ -1,3 +1,4 @@
+import asyncio
 from importlib import import_module
 from io import BytesIO
 import json
@@ -7,7 +8,10 @@ from random import random, randrange
 import numpy as np
 from PIL import Image
 from shapeworld import util
-from shapeworld.world import World
+from shapeworld.noise import add_noise
+from shapeworld.producer import BatchProducer
+from shapeworld import server
+from shapeworld.world import World, WorldRenderer
 from shapeworld.realizers import CaptionRealizer
 
 
@@ -16,6 +20,8 @@ def dataset(dtype=None, name=None, language=None, config=None):
     assert config is None or isinstance(config, dict) or isinstance(config, str)
     assert dtype is None or isinstance(dtype, str)
     assert name is None or isinstance(name, str)
+    if config is not None and isinstance(config, str) and config[:8] == 'connect(' and config[-1] == ')':
+        return ServedDataset(address=config[8:-1], dtype=dtype, name=name, language=language)
     load = mix = False
     if config is not None and isinstance(config, str):
         if config[:5] == 'load(' and config[-1] == ')':
@@ -74,14 +80,35 @@ def dataset(dtype=None, name=None, language=None, config=None):
     dclass = module.dataset
     if config is None:
         assert dclass.default_config is not None
-        config = dclass.default_config
+        config = dict(dclass.default_config)
     else:
+        # the given config is left unchanged, so that it can be reused, e.g. by worker processes
+        config = dict(config)
         for key, value in dclass.default_config.items():
             if key not in config:
                 config[key] = value
     if language is not None:
         config['language'] = language
+    # dataset-level options not passed to the dataset constructor
+    renderer = config.pop('renderer', None)
+    world_dtype = config.pop('world_dtype', 'float32')
+    assert world_dtype in Dataset.world_dtypes
+    enumerate_captions = config.pop('enumerate_captions', False)
+    captioner_resamples = config.pop('captioner_resamples', 0)
+    assert isinstance(captioner_resamples, int) and captioner_resamples >= 0
     dataset = dclass(**config)
+    dataset.config = config
+    dataset.renderer = WorldRenderer.from_config(renderer)
+    dataset.world_dtype = world_dtype
+    if enumerate_captions:
+        if not hasattr(dataset, 'world_captioner'):
+            raise ValueError('enumerate_captions only applies to caption agreement datasets, not {}'.format(dataset))
+        # captions are sampled among the acceptable candidates for a world instead of by rejection, and captioner values
+        # without any are resampled for the same world, so captioner values are conditioned on the world instead of the
+        # world on the captioner values
+        dataset.world_captioner.enumerate_candidates = True
+    if captioner_resamples > 0:
+        dataset.captioner_resamples = captioner_resamples
     return dataset
 
 
@@ -106,6 +133,7 @@ class Dataset(object):
     dataset_type = None
     dataset_values = {'world': 'world', 'world_model': 'model'}
     default_config = None
+    world_dtypes = ('float32', 'float16', 'uint8')
 
     def __init__(self, world_size, vectors=None, words=None, language=None):
         assert self.__class__.dataset_name
@@ -125,6 +153,11 @@ class Dataset(object):
             words['[UNKNOWN]'] = len(words)
         self.words = words
         self.language = language
+        self.config = None  # constructor options if created via dataset()
+        self.noise_bank = None
+        self.renderer = None
+        self.world_dtype = 'float32'
+        self.batch_arrays = None  # arrays used by zero_batch instead of new ones, e.g. shared memory views in workers
 
     def __str__(self):
         if self.language is None:
@@ -156,8 +189,21 @@ class Dataset(object):
             specification['words'] = self.words
         if self.language:
             specification['language'] = self.language
+        if self.world_dtype != 'float32':
+            specification['world_dtype'] = self.world_dtype
         return specification
 
+    def content_specification(self):
+        # options which determine the generated instances, hashed for their seeds: type and name with the constructor
+        # config, i.e. the generator and captioner options and the vocabulary (world_size, words, language), otherwise the
+        # specification, but in neither case the dataset-level options world_dtype and renderer, which only affect how the
+        # worlds are rendered and stored
+        if self.config is None:
+            specification = self.specification()
+            specification.pop('world_dtype', None)
+            return specification
+        return {'type': self.type, 'name': self.name, 'config': self.config}
+
     @property
     def world_shape(self):
         if isinstance(self.world_size, int):
@@ -176,6 +222,14 @@ class Dataset(object):
     def vocabulary(self):
         return list(self.words.keys())
 
+    def zero_array(self, value_name, shape, dtype):
+        if self.batch_arrays is not None:
+            array = self.batch_arrays.get(value_name)
+            if array is not None and array.shape == shape and array.dtype == dtype:
+                array[...] = 0
+                return array
+        return np.zeros(shape=shape, dtype=dtype)
+
     def zero_batch(self, n, include_model=False, alternatives=False):
         batch = dict()
         for value_name, value_type in self.values.items():
@@ -193,25 +247,68 @@ class Dataset(object):
                     batch[value_name] = [[] for _ in range(n)]
             else:
                 if value_type == 'int' and (value_name != 'alternatives' or alternatives):
-                    batch[value_name] = np.zeros(shape=(n,), dtype=np.int32)
+                    batch[value_name] = self.zero_array(value_name, shape=(n,), dtype=np.int32)
                 elif value_type == 'float':
-                    batch[value_name] = np.zeros(shape=(n,), dtype=np.float32)
+                    batch[value_name] = self.zero_array(value_name, shape=(n,), dtype=np.float32)
                 elif value_type == 'vector(int)' or value_type == 'text':
-                    batch[value_name] = np.zeros(shape=((n,) + self.vector_shape(value_name)), dtype=np.int32)
+                    batch[value_name] = self.zero_array(value_name, shape=((n,) + self.vector_shape(value_name)), dtype=np.int32)
                 elif value_type == 'vector(float)':
-                    batch[value_name] = np.zeros(shape=((n,) + self.vector_shape(value_name)), dtype=np.float32)
+                    batch[value_name] = self.zero_array(value_name, shape=((n,) + self.vector_shape(value_name)), dtype=np.float32)
                 elif value_type == 'world':
-                    batch[value_name] = np.zeros(shape=((n,) + self.world_shape), dtype=np.float32)
+                    batch[value_name] = self.zero_array(value_name, shape=((n,) + self.world_shape), dtype=self.world_dtype)
                 elif value_type == 'model' and include_model:
                     batch[value_name] = [None] * n
         return batch
 
-    def generate(self, n, mode=None, noise_range=None, include_model=False, alternatives=False):  # mode: None, 'train', 'validation', 'test'
+    def generate(self, n, mode=None, noise_range=None, include_model=False, alternatives=False, seed=None):  # mode: None, 'train', 'validation', 'test'
+        # seed: if not None, instance i is generated within util.random_context(self.instance_seeds(n, mode, seed)[i]),
+        # so it does not depend on other instances, batch size or process
         raise NotImplementedError
 
-    def iterate(self, n, mode=None, noise_range=None, include_model=False, alternatives=False):
+    @staticmethod
+    def noise_seeds(instance_seeds):
+        if instance_seeds[0] is None:
+            return None
+        return [util.instance_seed(instance_seed, 'noise') for instance_seed in instance_seeds]
+
+    def instance_seeds(self, n, mode, seed):
+        if seed is None:
+            return [None] * n
+        return util.instance_seeds(n, self.content_specification(), mode, seed)
+
+    def iterate(self, n, mode=None, noise_range=None, include_model=False, alternatives=False, seed=None, workers=None, prefetch=None, shared_memory=False):
+        # workers: number of worker processes generating batches ahead, at most prefetch batches pending
+        # shared_memory: batch arrays are generated by the workers directly into shared memory and returned as zero-copy
+        # views, which are only valid until the next batch is requested, as their memory is then overwritten by a
+        # following batch, so batches which are kept have to be copied, the last batch remains valid after closing
+        if workers:
+            with BatchProducer(dataset=self, num_workers=workers, prefetch=prefetch, seed=seed, shared_memory=shared_memory, n=n, mode=mode, noise_range=noise_range, include_model=include_model, alternatives=alternatives) as producer:
+                for batch in producer:
+                    yield batch
+        else:
+            batch = 0
+            while True:
+                yield self.generate(n=n, mode=mode, noise_range=noise_range, include_model=include_model, alternatives=alternatives, seed=(None if seed is None else [seed, batch]))
+                batch += 1
+
+    async def agenerate(self, n, mode=None, noise_range=None, include_model=False, alternatives=False, seed=None):
+        # datasets which wait on external processes override this to await them instead of blocking the event loop
+        return self.generate(n=n, mode=mode, noise_range=noise_range, include_model=include_model, alternatives=alternatives, seed=seed)
+
+    async def aiterate(self, n, mode=None, noise_range=None, include_model=False, alternatives=False, seed=None):
+        # the next batch is scheduled before awaiting the current one, so its generation overlaps with the current
+        # batch waiting on caption realization
+        batch = 0
+        pending = asyncio.ensure_future(self.agenerate(n=n, mode=mode, noise_range=noise_range, include_model=include_model, alternatives=alternatives, seed=(None if seed is None else [seed, batch])))
         while True:
-            yield self.generate(n=n, mode=mode, noise_range=noise_range, include_model=include_model, alternatives=alternatives)
+            batch += 1
+            following = asyncio.ensure_future(self.agenerate(n=n, mode=mode, noise_range=noise_range, include_model=include_model, alternatives=alternatives, seed=(None if seed is None else [seed, batch])))
+            try:
+                yield await pending
+            except BaseException:
+                following.cancel()
+                raise
+            pending = following
 
     def get_html(self, generated, id2word=None):
         return None
@@ -289,7 +386,7 @@ class Dataset(object):
             write_file(value_name + '.json', value)
 
     @staticmethod
-    def deserialize_value(value_name, value_type, read_file, num_concat_worlds=0, word2id=None):
+    def deserialize_value(value_name, value_type, read_file, num_concat_worlds=0, word2id=None, world_dtype=None):
         value_type, alts = alternatives_type(value_type=value_type)
         if value_type == 'int':
             value = read_file(value_name + '.txt')
@@ -334,7 +431,7 @@ class Dataset(object):
                 assert image_bytes is not None
                 image_bytes = BytesIO(image_bytes)
                 image = Image.open(image_bytes)
-                worlds = World.from_image(image)
+                worlds = World.from_image(image, dtype=world_dtype)
                 height = worlds.shape[0] // ceil(num_concat_worlds / size)
                 assert worlds.shape[0] % ceil(num_concat_worlds / size) == 0
                 width = worlds.shape[1] // size
@@ -352,7 +449,7 @@ class Dataset(object):
                         break
                     image_bytes = BytesIO(image_bytes)
                     image = Image.open(image_bytes)
-                    value.append(World.from_image(image))
+                    value.append(World.from_image(image, dtype=world_dtype))
                     n += 1
             return value
         elif value_type == 'model':
@@ -375,6 +472,8 @@ class LoadedDataset(Dataset):
         self.archive = specification.pop('archive', None)
         self.include_model = specification.pop('include_model', False)
         self.num_concat_worlds = specification.pop('num_concat_worlds', 0)
+        self.world_dtype = specification.pop('world_dtype', 'float32')
+        assert self.world_dtype in Dataset.world_dtypes
         self._specification = specification
         self.per_part = True
         self.part_once = False
@@ -423,7 +522,8 @@ class LoadedDataset(Dataset):
         assert 'tf-records' in self.parts
         return self.parts['tf-records']
 
-    def generate(self, n, mode=None, noise_range=None, include_model=False, alternatives=False):
+    def generate(self, n, mode=None, noise_range=None, include_model=False, alternatives=False, seed=None):
+        # instances are sampled from the stored data, seed is ignored
         assert not include_model or self.include_model
         if not self.per_part:
             self.mode = None if mode else 'train'
@@ -437,7 +537,7 @@ class LoadedDataset(Dataset):
             self.num_instances = 0
             with util.Archive(path=path, mode='r', archive=self.archive) as read_file:
                 for value_name, value in self.loaded.items():
-                    value.extend(Dataset.deserialize_value(value_name=value_name, value_type=self.values[value_name], read_file=read_file, num_concat_worlds=self.num_concat_worlds, word2id=self.words))
+                    value.extend(Dataset.deserialize_value(value_name=value_name, value_type=self.values[value_name], read_file=read_file, num_concat_worlds=self.num_concat_worlds, word2id=self.words, world_dtype=self.world_dtype))
                     if self.num_instances:
                         assert len(value) == self.num_instances
                     else:
@@ -458,15 +558,7 @@ class LoadedDataset(Dataset):
         if noise_range is not None and noise_range > 0.0:
             for value_name, value_type in self.values.items():
                 if value_type == 'world':
-                    noise = np.random.normal(loc=0.0, scale=noise_range, size=((n,) + self.world_shape))
-                    mask = (noise < -2.0 * noise_range) + (noise > 2.0 * noise_range)
-                    while np.any(a=mask):
-                        noise -= mask * noise
-                        noise += mask * np.random.normal(loc=0.0, scale=noise_range, size=((n,) + self.world_shape))
-                        mask = (noise < -2.0 * noise_range) + (noise > 2.0 * noise_range)
-                    worlds = batch[value_name]
-                    worlds += noise
-                    np.clip(worlds, a_min=0.0, a_max=1.0, out=worlds)
+                    add_noise(world_arrays=batch[value_name], noise_range=noise_range, noise_bank=self.noise_bank)
         return batch
 
     def get_html(self, generated, id2word=None):
@@ -475,6 +567,56 @@ class LoadedDataset(Dataset):
         return dclass.get_html(self, generated=generated, id2word=id2word)
 
 
+class ServedDataset(Dataset):
+
+    # client of a dataset generated by a DatasetServer (see serve.py)
+
+    dataset_name = 'served'
+    dataset_type = 'served'
+
+    def __init__(self, address, dtype, name, language=None, config=None):
+        self.address = address
+        self.connection = server.connect(address=address)
+        self.request = {'dtype': dtype, 'name': name, 'language': language, 'config': config}
+        specification = self.send(command='specification')[0]['specification']
+        super(ServedDataset, self).__init__(world_size=specification.pop('world_size'), vectors=specification.pop('vectors', None), words=specification.pop('words', None), language=specification.pop('language', None))
+        self._type = specification.pop('type')
+        self._name = specification.pop('name')
+        self._values = specification.pop('values')
+        self.world_dtype = specification.pop('world_dtype', 'float32')
+        self._specification = specification
+
+    @property
+    def type(self):
+        return self._type
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def values(self):
+        return self._values
+
+    def send(self, command, **arguments):
+        server.send_message(connection=self.connection, message={'command': command, 'dataset': self.request, 'arguments': arguments})
+        message, arrays = server.receive_message(connection=self.connection)
+        if message is None:
+            raise EOFError('connection to {} closed'.format(self.address))
+        if 'error' in message:
+            raise RuntimeError('dataset server: ' + message['error'])
+        return message, arrays
+
+    def generate(self, n, mode=None, noise_range=None, include_model=False, alternatives=False, seed=None):
+        message, arrays = self.send(command='generate', n=n, mode=mode, noise_range=noise_range, include_model=include_model, alternatives=alternatives, seed=seed)
+        batch = message['values']
+        batch.update(arrays)
+        return batch
+
+    def close(self):
+        self.connection.close()
+
+
 class DatasetMixer(Dataset):
 
     dataset_name = 'mixer'
@@ -490,6 +632,7 @@ class DatasetMixer(Dataset):
         assert all(dataset.language == datasets[0].language for dataset in datasets)
         assert all(dataset.values == datasets[0].values for dataset in datasets)
         assert all(dataset.world_size == datasets[0].world_size for dataset in datasets)
+        assert all(dataset.world_dtype == datasets[0].world_dtype for dataset in datasets)
         assert all(sorted(dataset.vectors) == sorted(datasets[0].vectors) for dataset in datasets)
         assert all((dataset.words is None) == (datasets[0].words is None) for dataset in datasets)
         # combine vectors and words information
@@ -498,6 +641,7 @@ class DatasetMixer(Dataset):
         words = {words[n]: n for n in range(len(words))}
         language = datasets[0].language
         super(DatasetMixer, self).__init__(None, vectors=vectors, words=words, language=language)
+        self.world_dtype = datasets[0].world_dtype
         for dataset in datasets:
             dataset.vectors = self.vectors
             dataset.words = self.words
@@ -528,7 +672,7 @@ class DatasetMixer(Dataset):
     def world_size(self):
         return self.datasets[0].world_size
 
-    def generate(self, n, mode=None, noise_range=None, include_model=False, alternatives=False):
+    def generate(self, n, mode=None, noise_range=None, include_model=False, alternatives=False, seed=None):
         if mode is None:
             distribution = self.distribution
         if mode == 'train':
@@ -538,13 +682,15 @@ class DatasetMixer(Dataset):
         elif mode == 'test':
             distribution = self.test_distribution
         if self.consistent_batches:
-            dataset = util.sample(distribution, self.datasets)
-            return dataset.generate(n=n, mode=mode, noise_range=noise_range, include_model=include_model, alternatives=alternatives)
+            with util.random_context(None if seed is None else util.instance_seed(self.content_specification(), mode, seed)):
+                dataset = util.sample(distribution, self.datasets)
+            return dataset.generate(n=n, mode=mode, noise_range=noise_range, include_model=include_model, alternatives=alternatives, seed=seed)
         else:
             batch = self.zero_batch(n, include_model=include_model, alternatives=alternatives)
-            for i in range(n):
-                dataset = util.sample(distribution, self.datasets)
-                generated = dataset.generate(n=1, mode=mode, noise_range=noise_range, include_model=include_model, alternatives=alternatives)
+            for i, instance_seed in enumerate(self.instance_seeds(n=n, mode=mode, seed=seed)):
+                with util.random_context(instance_seed):
+                    dataset = util.sample(distribution, self.datasets)
+                generated = dataset.generate(n=1, mode=mode, noise_range=noise_range, include_model=include_model, alternatives=alternatives, seed=(None if seed is None else [seed, i]))
                 for value_name, value_type in self.values.items():
                     value = generated[value_name][0]
                     if value_type == 'text':
@@ -577,17 +723,20 @@ class ClassificationDataset(Dataset):
     def get_classes(self, world):  # iterable of classes
         raise NotImplementedError
 
-    def generate(self, n, mode=None, noise_range=None, include_model=False, alternatives=False):
+    def generate(self, n, mode=None, noise_range=None, include_model=False, alternatives=False, seed=None):
         batch = self.zero_batch(n, include_model=include_model, alternatives=alternatives)
+        worlds = [None] * n
+        instance_seeds = self.instance_seeds(n=n, mode=mode, seed=seed)
         for i in range(n):
-            self.world_generator.sample_values(mode=mode)
+            with util.random_context(instance_seeds[i]):
+                self.world_generator.sample_values(mode=mode)
 
-            while True:
-                world = self.world_generator()
-                if world is not None:
-                    break
+                while True:
+                    world = self.world_generator()
+                    if world is not None:
+                        break
 
-            batch['world'][i] = world.get_array(noise_range=noise_range)
+            worlds[i] = world
             if include_model:
                 batch['world_model'][i] = world.model()
             c = None
@@ -598,6 +747,8 @@ class ClassificationDataset(Dataset):
                     batch['classification'][i][c] = 1.0
             if not self.multi_class:
                 assert c is not None
+
+        World.get_arrays(worlds=worlds, world_arrays=batch['world'], noise_range=noise_range, noise_bank=self.noise_bank, renderer=self.renderer, random_seeds=Dataset.noise_seeds(instance_seeds))
         return batch
 
     def get_html(self, generated, id2word=None):
@@ -651,8 +802,65 @@ class CaptionAgreementDataset(Dataset):
             assert caption_realizer is None or isinstance(caption_realizer, str)
             self.caption_realizer = CaptionRealizer.from_name(name=util.value_or_default(caption_realizer, 'dmrs'), language=util.value_or_default(language, 'english'))
         self.world_captioner.set_realizer(self.caption_realizer)
+        # clause evaluations memoized by the entity tables of generated worlds
+        self.evaluation_hits = 0
+        self.evaluation_misses = 0
+        # captioner values resampled against a world before it is discarded, instances thereby captioned, and worlds
+        # generated, accepted or discarded, whose difference to a run without resamples are the world generations avoided
+        self.captioner_resamples = 0
+        self.num_resampled_captions = 0
+        self.num_generated_worlds = 0
+
+    @property
+    def evaluation_hit_rate(self):
+        if self.evaluation_hits + self.evaluation_misses == 0:
+            return 0.0
+        return self.evaluation_hits / (self.evaluation_hits + self.evaluation_misses)
+
+    def content_specification(self):
+        # plus the dataset-level options enumerate_captions and captioner_resamples if set, as they change how captions
+        # and worlds are sampled
+        specification = super(CaptionAgreementDataset, self).content_specification()
+        if self.world_captioner.enumerate_candidates:
+            specification['enumerate_captions'] = True
+        if self.captioner_resamples > 0:
+            specification['captioner_resamples'] = self.captioner_resamples
+        return specification
+
+    def statistics(self):
+        return {'evaluation_hits': self.evaluation_hits, 'evaluation_misses': self.evaluation_misses, 'evaluation_hit_rate': self.evaluation_hit_rate, 'generated_worlds': self.num_generated_worlds, 'resampled_captions': self.num_resampled_captions}
+
+    def record_evaluations(self, world):
+        # counts the memoized clause evaluations of a world which is accepted or discarded
+        if world.table is not None:
+            self.evaluation_hits += world.table.hits
+            self.evaluation_misses += world.table.misses
+
+    def sample_caption(self, world, mode, correct):
+        # None if the captioner fails MAX_ATTEMPTS times for the world, where the captioner enumerates its candidates and
+        # none is acceptable for the world, further attempts with the same values cannot succeed, so instead new captioner
+        # values are sampled for the world
+        for _ in range(self.__class__.MAX_ATTEMPTS):
+            caption = self.world_captioner(entities=world.entities)
+            if caption is not None:
+                return caption
+            elif self.world_captioner.enumerate_candidates and self.world_captioner.enumerated:
+                self.world_captioner.sample_values(mode=mode, correct=correct)
+        return None
 
-    def generate(self, n, mode=None, noise_range=None, include_model=False, alternatives=False):
+    def generate(self, n, mode=None, noise_range=None, include_model=False, alternatives=False, seed=None):
+        batch, captions = self.generate_unrealized(n=n, mode=mode, noise_range=noise_range, include_model=include_model, alternatives=alternatives, seed=seed)
+        captions = self.caption_realizer.realize(captions=captions)
+        return self.insert_captions(batch=batch, captions=captions)
+
+    async def agenerate(self, n, mode=None, noise_range=None, include_model=False, alternatives=False, seed=None):
+        # worlds are generated and rendered synchronously, caption realization is awaited
+        batch, captions = self.generate_unrealized(n=n, mode=mode, noise_range=noise_range, include_model=include_model, alternatives=alternatives, seed=seed)
+        captions = await self.caption_realizer.arealize(captions=captions)
+        return self.insert_captions(batch=batch, captions=captions)
+
+    def generate_unrealized(self, n, mode=None, noise_range=None, include_model=False, alternatives=False, seed=None):
+        # batch without captions, plus the caption objects to be realized
         if mode == 'train':
             correct_ratio = self.train_correct_ratio
         elif mode == 'validation':
@@ -663,42 +871,57 @@ class CaptionAgreementDataset(Dataset):
             correct_ratio = self.correct_ratio
 
         batch = self.zero_batch(n, include_model=include_model, alternatives=alternatives)
+        worlds = [None] * n
         captions = [None] * n
+        instance_seeds = self.instance_seeds(n=n, mode=mode, seed=seed)
         for i in range(n):
-            correct = random() < correct_ratio
-            resample = 0
-            while resample >= 0:
-                self.world_generator.sample_values(mode=mode)
-                if resample % self.__class__.RESAMPLE_CAPTIONER == 0:
-                    # if resample > 0:
-                    #     print(self.world_captioner.correct, self.world_captioner.model())
-                    #     exit(0)
-                    self.world_captioner.sample_values(mode=mode, correct=correct)
-                resample += 1
-
-                while True:
-                    world = self.world_generator()
-                    if world is not None:
-                        break
-
-                for attempt in range(self.__class__.MAX_ATTEMPTS):
-                    caption = self.world_captioner(entities=world.entities)
-                    if caption is not None:
-                        # print('captioner successful:', resample, attempt, self.world_captioner.correct)
+            with util.random_context(instance_seeds[i]):
+                correct = random() < correct_ratio
+                resample = 0
+                while resample >= 0:
+                    self.world_generator.sample_values(mode=mode)
+                    if resample % self.__class__.RESAMPLE_CAPTIONER == 0:
+                        # if resample > 0:
+                        #     print(self.world_captioner.correct, self.world_captioner.model())
+                        #     exit(0)
+                        self.world_captioner.sample_values(mode=mode, correct=correct)
+                    resample += 1
+
+                    while True:
+                        world = self.world_generator()
+                        if world is not None:
+                            break
+                    self.num_generated_worlds += 1
+
+                    caption = self.sample_caption(world=world, mode=mode, correct=correct)
+                    for _ in range(self.captioner_resamples):
+                        if caption is not None:
+                            break
+                        # new captioner values for the same world, instead of generating a new one
+                        self.world_captioner.sample_values(mode=mode, correct=correct)
+                        caption = self.sample_caption(world=world, mode=mode, correct=correct)
+                        if caption is not None:
+                            self.num_resampled_captions += 1
+
+                    if caption is None:
+                        self.record_evaluations(world=world)
+                    else:
                         resample = -1
-                        break
-                # else:
-                #     print('captioner failed')
 
             assert (caption.agreement(entities=world.entities) > 0.0 and correct) or (caption.agreement(entities=world.entities) < 0.0 and not correct)
-            batch['world'][i] = world.get_array(noise_range=noise_range)
+            self.record_evaluations(world=world)
+            worlds[i] = world
             captions[i] = caption
             batch['agreement'][i] = float(correct)
             if include_model:
                 batch['world_model'][i] = world.model()
                 batch['caption_model'][i] = caption.model()
 
-        captions = self.caption_realizer.realize(captions=captions)
+        World.get_arrays(worlds=worlds, world_arrays=batch['world'], noise_range=noise_range, noise_bank=self.noise_bank, renderer=self.renderer, random_seeds=Dataset.noise_seeds(instance_seeds))
+        return batch, captions
+
+    def insert_captions(self, batch, captions):
+        # realized captions as word ids into the batch
         unknown = self.words['[UNKNOWN]']
         missing_words = set()  # for assert
         max_caption_size = self.caption_size  # for assert
@@ -2,6 +2,7 @@ from random import randrange
 from shapeworld import util
 from shapeworld.dataset import Dataset
 from shapeworld.datasets import clevr_util
+from shapeworld.world import World
 
 
 class CLEVRDataset(Dataset):
@@ -32,7 +33,8 @@ class CLEVRDataset(Dataset):
         specification['answers'] = self.answers
         return specification
 
-    def generate(self, n, mode=None, noise_range=None, include_model=False, alternatives=False):
+    def generate(self, n, mode=None, noise_range=None, include_model=False, alternatives=False, seed=None):
+        # instances are read in order from the stored data, seed is ignored
         assert noise_range is None or noise_range == 0.0
         batch = self.zero_batch(n, include_model=include_model, alternatives=alternatives)
         unknown = self.words['[UNKNOWN]']
@@ -44,7 +46,7 @@ class CLEVRDataset(Dataset):
                     return {key: value[:i] for key, value in batch.items()}
                 else:
                     return None
-            batch['world'][i] = world
+            batch['world'][i] = World.convert_array(world_array=world, dtype=self.world_dtype)
             if include_model:
                 batch['world_model'][i] = world_model
             if alternatives:
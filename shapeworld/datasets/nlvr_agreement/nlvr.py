@@ -1,6 +1,7 @@
 from shapeworld import util
 from shapeworld.dataset import Dataset
 from shapeworld.datasets import nlvr_util
+from shapeworld.world import World
 
 
 class NLVRDataset(Dataset):
@@ -21,7 +22,8 @@ class NLVRDataset(Dataset):
         super(NLVRDataset, self).__init__(world_size=world_size, vectors=dict(description=self.description_size), words=words)
         self.nlvr = {mode: nlvr_util.nlvr(directory=directory, mode=mode) for mode in ('train', 'validation', 'test')}
 
-    def generate(self, n, mode=None, noise_range=None, include_model=False, alternatives=False):
+    def generate(self, n, mode=None, noise_range=None, include_model=False, alternatives=False, seed=None):
+        # instances are read in order from the stored data, seed is ignored
         assert noise_range is None or noise_range == 0.0
         batch = self.zero_batch(n, include_model=include_model, alternatives=alternatives)
         unknown = self.words['[UNKNOWN]']
@@ -33,7 +35,7 @@ class NLVRDataset(Dataset):
                     return {key: value[:i] for key, value in batch.items()}
                 else:
                     return None
-            batch['world1'][i], batch['world2'][i], batch['world3'][i] = worlds
+            batch['world1'][i], batch['world2'][i], batch['world3'][i] = (World.convert_array(world_array=world, dtype=self.world_dtype) for world in worlds)
             if include_model:
                 batch['world_model1'][i], batch['world_model2'][i], batch['world_model3'][i] = world_models
             description = description.split()
@@ -1,3 +1,4 @@
+from __future__ import division
 from shapeworld import util
 from shapeworld.world import all_shapes, all_colors, all_textures
 
@@ -20,6 +21,8 @@ class WorldGenerator(object):
         self.shade_range = util.value_or_default(shade_range, 0.33)
         self.collision_tolerance = util.value_or_default(collision_tolerance, 0.25)
         self.boundary_tolerance = util.value_or_default(boundary_tolerance, 0.25)
+        self.num_worlds = 0
+        self.num_failed_worlds = 0
 
     def __str__(self):
         return self.__class__.__name__
@@ -39,8 +42,20 @@ class WorldGenerator(object):
             generator = self.generate_test_world
 
         world = generator()
+        self.num_worlds += 1
+        if world is None:
+            self.num_failed_worlds += 1
         return world
 
+    @property
+    def world_acceptance_rate(self):
+        if self.num_worlds == 0:
+            return 0.0
+        return 1.0 - self.num_failed_worlds / self.num_worlds
+
+    def statistics(self):
+        return {'worlds': self.num_worlds, 'failed_worlds': self.num_failed_worlds, 'world_acceptance_rate': self.world_acceptance_rate}
+
     def generate_world(self):
         raise NotImplementedError
 
@@ -1,5 +1,8 @@
+from __future__ import division
 from random import choice, random
+import numpy as np
 from shapeworld import util
+from shapeworld.util import Point
 from shapeworld.world import Entity, World
 from shapeworld.generators import WorldGenerator
 
@@ -8,7 +11,7 @@ class GenericGenerator(WorldGenerator):
 
     MAX_ATTEMPTS = 5
 
-    def __init__(self, entity_counts, world_size=None, world_color=None, shapes=None, colors=None, textures=None, rotation=None, size_range=None, distortion_range=None, shade_range=None, collision_tolerance=None, boundary_tolerance=None, train_entity_counts=None, validation_entity_counts=None, test_entity_counts=None, validation_combinations=None, test_combinations=None, shapes_range=None, colors_range=None, textures_range=None, max_provoke_collision_rate=None):
+    def __init__(self, entity_counts, world_size=None, world_color=None, shapes=None, colors=None, textures=None, rotation=None, size_range=None, distortion_range=None, shade_range=None, collision_tolerance=None, boundary_tolerance=None, train_entity_counts=None, validation_entity_counts=None, test_entity_counts=None, validation_combinations=None, test_combinations=None, shapes_range=None, colors_range=None, textures_range=None, max_provoke_collision_rate=None, free_space_sampling=None, max_repairs=None):
         super(GenericGenerator, self).__init__(world_size, world_color, shapes, colors, textures, rotation, size_range, distortion_range, shade_range, collision_tolerance, boundary_tolerance)
 
         # assert world_color not random
@@ -51,6 +54,115 @@ class GenericGenerator(WorldGenerator):
         assert max_provoke_collision_rate is None or (isinstance(max_provoke_collision_rate, float) and 0.0 <= max_provoke_collision_rate <= 1.0)
         self.max_provoke_collision_rate = max_provoke_collision_rate if max_provoke_collision_rate is not None else 0.5
 
+        # propose entity locations only where the entity fits into the remaining free space of the world, mostly useful
+        # without collision tolerance where otherwise many worlds fail to be generated, off by default as it changes the
+        # placement distribution
+        self.free_space_sampling = util.value_or_default(free_space_sampling, False)
+        self.num_proposals = 0
+        self.num_prefiltered = 0
+        self.num_accepted = 0
+
+        # when the attempt budget is exhausted, keep the placed entities and continue with a new budget, after removing the
+        # most obstructive entity if the last round placed none, instead of discarding the world, off by default as this
+        # changes the world distribution: backtracking removes obstructive, mostly large entities, and repaired worlds
+        # favour entities which fit in the remaining space
+        assert max_repairs is None or (isinstance(max_repairs, int) and max_repairs >= 0)
+        self.max_repairs = max_repairs if max_repairs is not None else 0
+        self.num_repairs = 0
+        self.num_backtracks = 0
+        self.num_repaired_worlds = 0
+
+    @property
+    def acceptance_rate(self):
+        if self.num_proposals == 0:
+            return 0.0
+        return self.num_accepted / self.num_proposals
+
+    def statistics(self):
+        statistics = super(GenericGenerator, self).statistics()
+        statistics.update(proposals=self.num_proposals, prefiltered=self.num_prefiltered, accepted=self.num_accepted, acceptance_rate=self.acceptance_rate, repairs=self.num_repairs, backtracks=self.num_backtracks, repaired_worlds=self.num_repaired_worlds)
+        if self.num_worlds > 0:
+            statistics.update(repairs_per_world=(self.num_repairs / self.num_worlds), backtracks_per_world=(self.num_backtracks / self.num_worlds))
+        return statistics
+
+    def random_block(self, num_entities, combinations=None):
+        if combinations:
+            block = Entity.random_block(num_entities=num_entities, rotation=self.rotation, size_range=self.size_range, distortion_range=self.distortion_range, shade_range=self.shade_range, combinations=combinations)
+        else:
+            block = Entity.random_block(num_entities=num_entities, shapes=self.selected_shapes, size_range=self.size_range, distortion_range=self.distortion_range, rotation=self.rotation, colors=self.selected_colors, shade_range=self.shade_range, textures=self.selected_textures)
+        # whether the candidates at their sampled centers are certain to be rejected for exceeding the boundary tolerance
+        block['outside'] = self.outside_block(block=block, centers=block['centers'])
+        return block
+
+    def outside_block(self, block, centers, indices=slice(None)):
+        world_size = Point(self.world_size, self.world_size)
+        return World.outside_block(world_size=world_size, topleft=(centers + block['relative_topleft'][indices]), bottomright=(centers + block['relative_bottomright'][indices]), areas=block['areas'][indices], boundary_tolerance=self.boundary_tolerance)
+
+    def add_entity(self, world, block, n, provoke_collision):
+        # proposes the n-th entity of the block, rejected on the block arrays where that is certain, otherwise instantiated
+        # and decided by World.add_entity
+        self.num_proposals += 1
+        if self.free_space_sampling:
+            entity = Entity.from_block(block, n)
+            center = world.random_free_location(entity, boundary_tolerance=self.boundary_tolerance, collision_tolerance=self.collision_tolerance, provoke_collision=provoke_collision)
+            if center is None:
+                return False
+            entity.set_center(center)
+        else:
+            if provoke_collision:
+                center = world.random_location(provoke_collision=provoke_collision)
+                outside = self.outside_block(block=block, centers=np.array([[center.x, center.y]]), indices=slice(n, n + 1))[0]
+            else:
+                center = Point(float(block['centers'][n, 0]), float(block['centers'][n, 1]))
+                outside = block['outside'][n]
+            if outside or (self.collision_tolerance == 0.0 and world.occupied(center)):
+                self.num_prefiltered += 1
+                return False
+            entity = Entity.from_block(block, n, center=center)
+        if world.add_entity(entity, boundary_tolerance=self.boundary_tolerance, collision_tolerance=self.collision_tolerance):
+            self.num_accepted += 1
+            return True
+        return False
+
+    def place_combination_entity(self, world, combinations):
+        provoke_collision = random() < self.provoke_collision_rate
+        while True:
+            block = self.random_block(num_entities=self.__class__.MAX_ATTEMPTS, combinations=combinations)
+            for k in range(self.__class__.MAX_ATTEMPTS):
+                if self.add_entity(world, block, k, provoke_collision):
+                    return
+
+    def place_entities(self, world, exclude_combinations=False):
+        # places entities until num_entities, entities already placed are kept, returns whether successful
+        num_protected = len(world.entities)
+        if num_protected >= self.num_entities:
+            return True
+        num_attempts = self.num_entities * self.__class__.MAX_ATTEMPTS
+        provoke_collision = random() < self.provoke_collision_rate
+        for repair in range(self.max_repairs + 1):
+            if repair > 0:
+                self.num_repairs += 1
+                if len(world.entities) == num_placed and len(world.entities) > num_protected:
+                    # backtrack: remove the unprotected entity which most other entities collided with, otherwise the largest
+                    entity = max(world.entities[num_protected:], key=(lambda entity: (world.obstructions[entity.id], entity.shape.area)))
+                    world.remove_entity(entity)
+                    self.num_backtracks += 1
+                num_attempts = (self.num_entities - len(world.entities)) * self.__class__.MAX_ATTEMPTS
+            num_placed = len(world.entities)
+            block = self.random_block(num_entities=num_attempts)
+            for k in range(num_attempts):
+                if exclude_combinations:
+                    combination = (block['shapes'][k], block['colors'][k], block['textures'][k])
+                    if combination in self.validation_combinations or combination in self.test_combinations:
+                        continue
+                if self.add_entity(world, block, k, provoke_collision):
+                    if len(world.entities) == self.num_entities:
+                        if repair > 0:
+                            self.num_repaired_worlds += 1
+                        return True
+                    provoke_collision = random() < self.provoke_collision_rate
+        return False
+
     def sample_values(self, mode):
         super(GenericGenerator, self).sample_values(mode=mode)
 
@@ -89,17 +201,7 @@ class GenericGenerator(WorldGenerator):
         world = World(self.world_size, self.world_color)
         if self.num_entities == 0:
             return world
-        n = 0
-        provoke_collision = random() < self.provoke_collision_rate
-        for _ in range(self.num_entities * self.__class__.MAX_ATTEMPTS):
-            center = world.random_location(provoke_collision=provoke_collision)
-            entity = Entity.random_instance(center=center, shapes=self.selected_shapes, size_range=self.size_range, distortion_range=self.distortion_range, rotation=self.rotation, colors=self.selected_colors, shade_range=self.shade_range, textures=self.selected_textures)
-            if world.add_entity(entity, boundary_tolerance=self.boundary_tolerance, collision_tolerance=self.collision_tolerance):
-                n += 1
-                provoke_collision = random() < self.provoke_collision_rate
-            if n == self.num_entities:
-                break
-        else:
+        if not self.place_entities(world):
             return None
         if self.collision_tolerance:
             world.sort_entities()
@@ -109,20 +211,7 @@ class GenericGenerator(WorldGenerator):
         world = World(self.world_size, self.world_color)
         if self.num_entities == 0:
             return world
-        n = 0
-        provoke_collision = random() < self.provoke_collision_rate
-        for _ in range(self.num_entities * self.__class__.MAX_ATTEMPTS):
-            center = world.random_location(provoke_collision=provoke_collision)
-            entity = Entity.random_instance(center=center, shapes=self.selected_shapes, size_range=self.size_range, distortion_range=self.distortion_range, rotation=self.rotation, colors=self.selected_colors, shade_range=self.shade_range, textures=self.selected_textures)
-            combination = (entity.shape.name, entity.color.name, entity.texture.name)
-            if combination in self.validation_combinations or combination in self.test_combinations:
-                continue
-            if world.add_entity(entity, boundary_tolerance=self.boundary_tolerance, collision_tolerance=self.collision_tolerance):
-                n += 1
-                provoke_collision = random() < self.provoke_collision_rate
-            if n == self.num_entities:
-                break
-        else:
+        if not self.place_entities(world, exclude_combinations=True):
             return None
         if self.collision_tolerance:
             world.sort_entities()
@@ -133,25 +222,8 @@ class GenericGenerator(WorldGenerator):
         if self.num_entities == 0:
             return world
         if self.validation_combinations:
-            provoke_collision = random() < self.provoke_collision_rate
-            while True:
-                center = world.random_location(provoke_collision=provoke_collision)
-                entity = Entity.random_instance(center=center, rotation=self.rotation, size_range=self.size_range, distortion_range=self.distortion_range, shade_range=self.shade_range, combinations=self.validation_combinations)
-                if world.add_entity(entity, boundary_tolerance=self.boundary_tolerance, collision_tolerance=self.collision_tolerance):
-                    break
-            n = 1
-        else:
-            n = 0
-        provoke_collision = random() < self.provoke_collision_rate
-        for _ in range(self.num_entities * self.__class__.MAX_ATTEMPTS):
-            center = world.random_location(provoke_collision=provoke_collision)
-            entity = Entity.random_instance(center=center, shapes=self.selected_shapes, size_range=self.size_range, distortion_range=self.distortion_range, rotation=self.rotation, colors=self.selected_colors, shade_range=self.shade_range, textures=self.selected_textures)
-            if world.add_entity(entity, boundary_tolerance=self.boundary_tolerance, collision_tolerance=self.collision_tolerance):
-                n += 1
-                provoke_collision = random() < self.provoke_collision_rate
-            if n == self.num_entities:
-                break
-        else:
+            self.place_combination_entity(world, combinations=self.validation_combinations)
+        if not self.place_entities(world):
             return None
         if self.collision_tolerance:
             world.sort_entities()
@@ -162,25 +234,8 @@ class GenericGenerator(WorldGenerator):
         if self.num_entities == 0:
             return world
         if self.test_combinations:
-            provoke_collision = random() < self.provoke_collision_rate
-            while True:
-                center = world.random_location(provoke_collision=provoke_collision)
-                entity = Entity.random_instance(center=center, rotation=self.rotation, size_range=self.size_range, distortion_range=self.distortion_range, shade_range=self.shade_range, combinations=self.test_combinations)
-                if world.add_entity(entity, boundary_tolerance=self.boundary_tolerance, collision_tolerance=self.collision_tolerance):
-                    break
-            n = 1
-        else:
-            n = 0
-        provoke_collision = random() < self.provoke_collision_rate
-        for _ in range(self.num_entities * self.__class__.MAX_ATTEMPTS):
-            center = world.random_location(provoke_collision=provoke_collision)
-            entity = Entity.random_instance(center=center, shapes=self.selected_shapes, size_range=self.size_range, distortion_range=self.distortion_range, rotation=self.rotation, colors=self.selected_colors, shade_range=self.shade_range, textures=self.selected_textures)
-            if world.add_entity(entity, boundary_tolerance=self.boundary_tolerance, collision_tolerance=self.collision_tolerance):
-                n += 1
-                provoke_collision = random() < self.provoke_collision_rate
-            if n == self.num_entities:
-                break
-        else:
+            self.place_combination_entity(world, combinations=self.test_combinations)
+        if not self.place_entities(world):
             return None
         if self.collision_tolerance:
             world.sort_entities()
@@ -0,0 +1,82 @@
+from math import erf, sqrt
+from random import random, randrange
+import numpy as np
+from shapeworld import util
+
+
+# pixel noise is normally distributed and truncated at two standard deviations
+truncation = 2.0
+num_quantiles = 4097
+
+
+def standard_quantiles():
+    # inverse cumulative distribution function of the truncated standard normal distribution, tabulated at evenly spaced probabilities
+    values = np.linspace(start=-truncation, stop=truncation, num=(4 * num_quantiles))
+    cdf = np.array([erf(value / sqrt(2.0)) for value in values])
+    cdf = (cdf - cdf[0]) / (cdf[-1] - cdf[0])
+    return np.interp(np.linspace(start=0.0, stop=1.0, num=num_quantiles), cdf, values)
+
+
+quantiles = standard_quantiles()
+
+
+def truncated_normal(shape, scale):
+    # one vectorized inverse-CDF pass instead of rejection sampling
+    scaled_quantiles = (quantiles * scale).astype(dtype=np.float32)
+    differences = np.diff(scaled_quantiles)
+    uniform = np.random.random_sample(size=shape)
+    uniform *= num_quantiles - 1
+    indices = uniform.astype(dtype=np.intp)
+    uniform -= indices
+    noise = scaled_quantiles[indices]
+    noise += differences[indices] * uniform
+    return noise
+
+
+def add_noise(world_arrays, noise_range, noise_bank=None):
+    # adds pixel noise in place to a world array or a batch of world arrays
+    if world_arrays.dtype == np.uint8:
+        float_arrays = world_arrays * np.float32(1.0 / 255.0)
+        add_noise(world_arrays=float_arrays, noise_range=noise_range, noise_bank=noise_bank)
+        float_arrays *= 255.0
+        world_arrays[:] = np.rint(float_arrays)
+        return world_arrays
+    if noise_bank is None:
+        world_arrays += truncated_normal(shape=world_arrays.shape, scale=noise_range)
+    else:
+        assert noise_bank.noise_range == noise_range
+        noise_bank.add_noise(world_arrays=world_arrays)
+    np.clip(world_arrays, a_min=0.0, a_max=1.0, out=world_arrays)
+    return world_arrays
+
+
+class NoiseBank(object):
+
+    # precomputed noise images of twice the world size, sampled with random offsets and flips
+
+    def __init__(self, world_shape, noise_range, size=None):
+        assert len(world_shape) == 3
+        assert noise_range > 0.0
+        self.world_shape = tuple(world_shape)
+        self.noise_range = noise_range
+        self.size = util.value_or_default(size, 16)
+        height, width, channels = self.world_shape
+        self.bank = truncated_normal(shape=(self.size, 2 * height, 2 * width, channels), scale=noise_range)
+
+    def sample(self):
+        height, width, _ = self.world_shape
+        y = randrange(height)
+        x = randrange(width)
+        noise = self.bank[randrange(self.size), y: y + height, x: x + width]
+        if random() < 0.5:
+            noise = noise[::-1, :]
+        if random() < 0.5:
+            noise = noise[:, ::-1]
+        return noise
+
+    def add_noise(self, world_arrays):
+        if world_arrays.ndim == 3:
+            world_arrays = world_arrays[np.newaxis]
+        assert world_arrays.shape[1:] == self.world_shape
+        for world_array in world_arrays:
+            world_array += self.sample()
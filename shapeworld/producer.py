@@ -0,0 +1,203 @@
+from __future__ import division
+from math import ceil
+import multiprocessing
+import random
+import traceback
+import numpy as np
+
+
+def produce(dataset, queue, worker, num_workers, seed, kwargs, ring=None, free_slots=None):
+    # worker process loop: generates batches worker, worker + num_workers, ... and puts them in order on its queue, if a
+    # ring is given the batch arrays are generated directly into a free slot, via the batch_arrays of the dataset, and
+    # only the slot index and the values not stored in the slot are put on the queue
+    if seed is None:
+        # forked workers would otherwise share the random state of the parent
+        random.seed()
+        np.random.seed()
+    index = worker
+    try:
+        while True:
+            if ring is None:
+                batch = dataset.generate(seed=(None if seed is None else [seed, index]), **kwargs)
+                queue.put(batch)
+            else:
+                slot = free_slots.get()
+                dataset.batch_arrays = ring.views(slot=slot)
+                batch = dataset.generate(seed=(None if seed is None else [seed, index]), **kwargs)
+                queue.put((slot, ring.fill(slot=slot, batch=batch, views=dataset.batch_arrays)))
+            index += num_workers
+    except Exception:
+        queue.put(WorkerError(worker, traceback.format_exc()))
+
+
+class WorkerError(object):
+
+    def __init__(self, worker, traceback):
+        self.worker = worker
+        self.traceback = traceback
+
+    def __str__(self):
+        return 'batch producer worker {} failed:\n{}'.format(self.worker, self.traceback)
+
+
+class SharedSlot(object):
+
+    # shared memory block as base of the numpy views of a slot, exposed by address instead of as exported buffer, so
+    # the block stays mapped as long as any view references it and is closed without BufferError once none does
+
+    def __init__(self, size):
+        from multiprocessing import shared_memory
+        self.memory = shared_memory.SharedMemory(create=True, size=size)
+
+    @property
+    def __array_interface__(self):
+        # the address differs per process, the temporary array releases its export of the buffer when discarded
+        address = np.frombuffer(self.memory.buf, dtype=np.uint8).ctypes.data
+        return {'shape': (self.memory.size,), 'typestr': '|u1', 'data': (address, False), 'version': 3}
+
+    def unlink(self):
+        self.memory.unlink()
+
+
+class SharedBatchRing(object):
+
+    # preallocated batch slots, each a shared memory block laid out like the arrays of the template batch (as returned
+    # by Dataset.zero_batch), other values are passed on separately
+
+    def __init__(self, template, num_slots):
+        self.layout = list()
+        size = 0
+        for value_name, value in sorted(template.items()):
+            if isinstance(value, np.ndarray):
+                self.layout.append((value_name, value.shape, value.dtype.str, size))
+                # aligned to 64 bytes
+                size += -(-value.nbytes // 64) * 64
+        self.slots = [SharedSlot(size=max(size, 1)) for _ in range(num_slots)]
+
+    def __len__(self):
+        return len(self.slots)
+
+    def views(self, slot):
+        # the views reference the slot, so it cannot be unmapped under them
+        memory = np.asarray(self.slots[slot])
+        return {value_name: memory[offset: offset + int(np.prod(shape)) * np.dtype(dtype).itemsize].view(dtype=dtype).reshape(shape) for value_name, shape, dtype, offset in self.layout}
+
+    def fill(self, slot, batch, views=None):
+        # copies the batch arrays into the slot unless they already are the given views of it, returns the remaining
+        # values
+        if views is None:
+            views = self.views(slot=slot)
+        remaining = dict(batch)
+        for value_name, view in views.items():
+            value = remaining.get(value_name)
+            if value is view:
+                remaining.pop(value_name)
+            elif isinstance(value, np.ndarray) and value.shape == view.shape and value.dtype == view.dtype:
+                view[...] = value
+                remaining.pop(value_name)
+        return remaining
+
+    def batch(self, slot, remaining):
+        # zero-copy views of the slot, only valid until the slot is filled again
+        batch = self.views(slot=slot)
+        batch.update(remaining)
+        return batch
+
+    def close(self):
+        # the blocks are unlinked, and unmapped once no view references them anymore
+        for slot in self.slots:
+            slot.unlink()
+        self.slots = list()
+
+
+class BatchProducer(object):
+
+    # runs dataset.generate in worker processes, each with its own copy of the dataset (and hence of its generator,
+    # captioner and realizer), batches are returned round-robin, so seeded batches come back in the same order as from
+    # dataset.iterate on the calling process, with shared_memory the batch arrays are views of a SharedBatchRing slot
+    # which is returned to its worker, and hence overwritten, when the next batch is requested, so batches which are kept
+    # have to be copied, the views of the last batch remain valid after closing
+
+    def __init__(self, dataset, num_workers, prefetch=None, seed=None, shared_memory=False, **kwargs):
+        assert num_workers >= 1
+        self.dataset = dataset
+        self.num_workers = num_workers
+        self.prefetch = prefetch or 2 * num_workers
+        self.seed = seed
+        self.shared_memory = shared_memory
+        self.kwargs = kwargs
+        self.queues = None
+        self.workers = None
+        self.rings = None
+        self.free_slots = None
+        self.held_slot = None
+        self.index = 0
+
+    def start(self):
+        assert self.workers is None
+        # bounded per worker so that at most prefetch batches are pending
+        maxsize = int(ceil(self.prefetch / self.num_workers))
+        self.queues = [multiprocessing.Queue(maxsize=maxsize) for _ in range(self.num_workers)]
+        if self.shared_memory:
+            # slots per worker, so that a worker only ever waits for its own slots, plus one held by the consumer
+            template = self.dataset.zero_batch(n=self.kwargs['n'], include_model=self.kwargs.get('include_model', False), alternatives=self.kwargs.get('alternatives', False))
+            self.rings = [SharedBatchRing(template=template, num_slots=(maxsize + 1)) for _ in range(self.num_workers)]
+            self.free_slots = [multiprocessing.Queue() for _ in range(self.num_workers)]
+            for ring, free_slots in zip(self.rings, self.free_slots):
+                for slot in range(len(ring)):
+                    free_slots.put(slot)
+            self.workers = [multiprocessing.Process(target=produce, args=(self.dataset, self.queues[worker], worker, self.num_workers, self.seed, self.kwargs, self.rings[worker], self.free_slots[worker])) for worker in range(self.num_workers)]
+        else:
+            self.workers = [multiprocessing.Process(target=produce, args=(self.dataset, self.queues[worker], worker, self.num_workers, self.seed, self.kwargs)) for worker in range(self.num_workers)]
+        for worker in self.workers:
+            worker.daemon = True
+            worker.start()
+
+    def close(self):
+        if self.workers is None:
+            return
+        for worker in self.workers:
+            worker.terminate()
+        for worker in self.workers:
+            worker.join()
+        for queue in self.queues:
+            queue.close()
+        if self.rings is not None:
+            for ring, free_slots in zip(self.rings, self.free_slots):
+                ring.close()
+                free_slots.close()
+        self.queues = None
+        self.workers = None
+        self.rings = None
+        self.free_slots = None
+        self.held_slot = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.workers is None:
+            self.start()
+        if self.held_slot is not None:
+            self.free_slots[self.held_slot[0]].put(self.held_slot[1])
+            self.held_slot = None
+        worker = self.index % self.num_workers
+        batch = self.queues[worker].get()
+        if isinstance(batch, WorkerError):
+            self.close()
+            raise RuntimeError(str(batch))
+        if self.rings is not None:
+            slot, remaining = batch
+            batch = self.rings[worker].batch(slot=slot, remaining=remaining)
+            self.held_slot = (worker, slot)
+        self.index += 1
+        return batch
+
+    next = __next__
@@ -1,3 +1,4 @@
+import asyncio
 import copy
 import json
 import os
@@ -131,14 +132,37 @@ class DmrsRealizer(CaptionRealizer):
 
     def realize(self, captions):
         try:
-            ace = subprocess.Popen([self.ace_path, '-g', self.erg_path, '-1Te', '-r', 'root_strict'], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            ace = subprocess.Popen(self.ace_arguments(), stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         except Exception as e:
-            import sys
-            from datetime import datetime
-            print(datetime.now().strftime('%H:%M:%S'))
-            print(e.strerror)
-            print(sys.exc_info()[0])
+            self.ace_error(e)
             raise
+        dmrs_list, mrs_list = self.ace_input(captions=captions)
+        stdout_data, stderr_data = ace.communicate(''.join(mrs_list).encode())
+        return self.ace_output(captions=captions, dmrs_list=dmrs_list, mrs_list=mrs_list, stdout_data=stdout_data, stderr_data=stderr_data)
+
+    async def arealize(self, captions):
+        # as realize, but awaits the ACE process without blocking the event loop
+        try:
+            ace = await asyncio.create_subprocess_exec(*self.ace_arguments(), stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        except Exception as e:
+            self.ace_error(e)
+            raise
+        dmrs_list, mrs_list = self.ace_input(captions=captions)
+        stdout_data, stderr_data = await ace.communicate(''.join(mrs_list).encode())
+        return self.ace_output(captions=captions, dmrs_list=dmrs_list, mrs_list=mrs_list, stdout_data=stdout_data, stderr_data=stderr_data)
+
+    def ace_arguments(self):
+        return [self.ace_path, '-g', self.erg_path, '-1Te', '-r', 'root_strict']
+
+    def ace_error(self, exception):
+        # reports a failure to start the ACE process, before the exception is re-raised
+        import sys
+        from datetime import datetime
+        print(datetime.now().strftime('%H:%M:%S'))
+        print(getattr(exception, 'strerror', exception))
+        print(sys.exc_info()[0])
+
+    def ace_input(self, captions):
         dmrs_list = list()
         mrs_list = list()
         for caption in captions:
@@ -147,7 +171,9 @@ class DmrsRealizer(CaptionRealizer):
             dmrs.remove_underspecifications()
             dmrs_list.append(dmrs)
             mrs_list.append(dmrs.get_mrs() + '\n')
-        stdout_data, stderr_data = ace.communicate(''.join(mrs_list).encode())
+        return dmrs_list, mrs_list
+
+    def ace_output(self, captions, dmrs_list, mrs_list, stdout_data, stderr_data):
         stderr_data = stderr_data.decode('utf-8').splitlines()
         stdout_data = stdout_data.decode('utf-8').splitlines()
         assert all(self.regex.match(line) for line in stderr_data), '\n\n' + '\n'.join('{}\n{}\n{}\n'.format(line, dmrs.dumps_xml().decode(), mrs) for line, dmrs, mrs in zip(stderr_data, dmrs_list, mrs_list) if not self.regex.match(line)) + '\nFailures: {}\n'.format(len(captions) - int(stderr_data[-2][16:stderr_data[-2].index(' ', 16)]))  # self.proposition_dmrs(caption).dumps_xml()
@@ -19,3 +19,7 @@ class CaptionRealizer(object):
 
     def realize(self, captions):
         raise NotImplementedError
+
+    async def arealize(self, captions):
+        # realizers running external processes override this to await them
+        return self.realize(captions=captions)
@@ -0,0 +1,195 @@
+from copy import deepcopy
+import json
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import socketserver
+import struct
+import traceback
+import numpy as np
+
+
+# messages are framed as the length of a JSON header followed by the header, which lists the arrays whose raw buffers
+# follow it, in order
+
+
+def encode_json(value):
+    if isinstance(value, np.ndarray):
+        return {'__ndarray__': value.tolist(), 'dtype': value.dtype.str}
+    elif isinstance(value, np.integer):
+        return int(value)
+    elif isinstance(value, np.floating):
+        return float(value)
+    elif isinstance(value, np.bool_):
+        return bool(value)
+    raise TypeError('not JSON serializable: {}'.format(type(value)))
+
+
+def decode_json(value):
+    if '__ndarray__' in value:
+        return np.array(value['__ndarray__'], dtype=value['dtype'])
+    return value
+
+
+def send_message(connection, message, arrays=()):
+    arrays = [(name, np.ascontiguousarray(array)) for name, array in arrays]
+    header = {'message': message, 'arrays': [[name, array.dtype.str, array.shape] for name, array in arrays]}
+    header = json.dumps(header, default=encode_json).encode('utf-8')
+    connection.sendall(struct.pack('!Q', len(header)) + header)
+    for _, array in arrays:
+        if array.size > 0:
+            connection.sendall(memoryview(array).cast('B'))
+
+
+def receive_into(connection, buffer):
+    view = memoryview(buffer)
+    while len(view) > 0:
+        num_bytes = connection.recv_into(view)
+        if num_bytes == 0:
+            raise EOFError('connection closed within message')
+        view = view[num_bytes:]
+
+
+def receive_message(connection):
+    # returns (None, None) if the connection was closed between messages
+    size = bytearray(8)
+    num_bytes = connection.recv_into(size)
+    if num_bytes == 0:
+        return None, None
+    receive_into(connection, memoryview(size)[num_bytes:])
+    header = bytearray(struct.unpack('!Q', size)[0])
+    receive_into(connection, header)
+    header = json.loads(header.decode('utf-8'), object_hook=decode_json)
+    arrays = dict()
+    for name, dtype, shape in header['arrays']:
+        array = np.empty(shape=shape, dtype=dtype)
+        if array.size > 0:
+            receive_into(connection, memoryview(array).cast('B'))
+        arrays[name] = array
+    return header['message'], arrays
+
+
+def parse_address(address):
+    # 'host:port' for localhost TCP, otherwise the path of a Unix domain socket
+    if ':' in address and not address.startswith('/'):
+        host, port = address.rsplit(':', 1)
+        return socket.AF_INET, (host, int(port))
+    return socket.AF_UNIX, address
+
+
+def connect(address):
+    family, address = parse_address(address)
+    connection = socket.socket(family, socket.SOCK_STREAM)
+    connection.connect(address)
+    return connection
+
+
+# datasets of a worker process, by request key, and the configs of the preloaded datasets, by dtype, name and language
+datasets = dict()
+preloaded = dict()
+
+
+def dataset_key(request):
+    return json.dumps([request.get('dtype'), request.get('name'), request.get('language')])
+
+
+def get_dataset(request):
+    # requests without config are served the preloaded dataset of the same dtype, name and language, if any, requests
+    # with a different config for it are rejected instead of served a different dataset
+    config = request.get('config')
+    name = dataset_key(request=request)
+    if name in preloaded:
+        if config is not None and config != preloaded[name]:
+            raise ValueError('dataset {} is served with config {}, not {}'.format(name, json.dumps(preloaded[name]), json.dumps(config)))
+        config = preloaded[name]
+    key = json.dumps(dict(request, config=config), sort_keys=True)
+    if key not in datasets:
+        from shapeworld.dataset import dataset
+        datasets[key] = dataset(dtype=request.get('dtype'), name=request.get('name'), language=request.get('language'), config=deepcopy(config))
+    return datasets[key]
+
+
+def init_worker(preload):
+    # interrupts are handled by the server, which terminates the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # forked workers would otherwise share the random state of the parent
+    random.seed()
+    np.random.seed()
+    for request in preload:
+        preloaded[dataset_key(request=request)] = request.get('config')
+        get_dataset(request=request)
+
+
+def process_request(request):
+    # returns (message, arrays) as sent back to the client
+    try:
+        dataset = get_dataset(request=request['dataset'])
+        if request['command'] == 'specification':
+            return {'specification': dataset.specification()}, []
+        elif request['command'] == 'generate':
+            generated = dataset.generate(**request['arguments'])
+            arrays = [(value_name, value) for value_name, value in generated.items() if isinstance(value, np.ndarray)]
+            values = {value_name: value for value_name, value in generated.items() if not isinstance(value, np.ndarray)}
+            return {'values': values}, arrays
+        else:
+            return {'error': 'unknown command: {}'.format(request['command'])}, []
+    except Exception:
+        return {'error': traceback.format_exc()}, []
+
+
+class RequestHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        while True:
+            try:
+                request, _ = receive_message(connection=self.request)
+            except (EOFError, ConnectionError):
+                return
+            if request is None:
+                return
+            message, arrays = self.server.pool.apply(process_request, (request,))
+            try:
+                send_message(connection=self.request, message=message, arrays=arrays)
+            except ConnectionError:
+                return
+
+
+class UnixServer(socketserver.ThreadingUnixStreamServer):
+
+    daemon_threads = True
+
+
+class TCPServer(socketserver.ThreadingTCPServer):
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class DatasetServer(object):
+
+    # serves datasets to any number of clients, one thread per connection, with generation in a shared pool of worker
+    # processes which keep their datasets (and hence generators, captioners and realizers) warm across requests
+
+    def __init__(self, address, num_workers=None, preload=()):
+        family, address = parse_address(address)
+        if family == socket.AF_UNIX:
+            server_class = UnixServer
+            if os.path.exists(address):  # left over from a previous server
+                os.remove(address)
+        else:
+            server_class = TCPServer
+        self.pool = multiprocessing.Pool(processes=num_workers, initializer=init_worker, initargs=(list(preload),))
+        self.server = server_class(address, RequestHandler)
+        self.server.pool = self.pool
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def close(self):
+        self.server.server_close()
+        if isinstance(self.server.server_address, str) and os.path.exists(self.server.server_address):
+            os.remove(self.server.server_address)
+        self.pool.terminate()
+        self.pool.join()
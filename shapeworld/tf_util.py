@@ -1,3 +1,4 @@
+import numpy as np
 import tensorflow as tf
 from shapeworld.dataset import alternatives_type
 
@@ -31,10 +32,19 @@ def read_record(dataset, serialized_record):
             else:
                 features[value_name] = tf.FixedLenFeature(shape=dataset.vector_shape(value_name=value_name), dtype=tf.float32)
         elif value_type == 'world':
-            features[value_name] = tf.FixedLenFeature(shape=dataset.world_shape, dtype=tf.float32)
+            if dataset.world_dtype == 'uint8':
+                features[value_name] = tf.FixedLenFeature(shape=(), dtype=tf.string)
+            else:
+                features[value_name] = tf.FixedLenFeature(shape=dataset.world_shape, dtype=tf.float32)
         else:
             pass
     record = tf.parse_single_sequence_example(serialized=serialized_record, context_features=features, sequence_features=feature_lists)
+    if dataset.world_dtype == 'uint8':
+        # uint8 worlds are converted to float only here, at the model boundary
+        for value_name, value_type in dataset.values.items():
+            if value_type == 'world':
+                world = tf.reshape(tensor=tf.decode_raw(bytes=record[0][value_name], out_type=tf.uint8), shape=dataset.world_shape)
+                record[0][value_name] = tf.cast(x=world, dtype=tf.float32) / 255.0
     return record
 
 
@@ -104,7 +114,10 @@ def write_record(dataset, record):
             else:
                 features[value_name] = tf.train.Feature(float_list=tf.train.FloatList(value=record[value_name]))
         elif value_type == 'world':
-            features[value_name] = tf.train.Feature(float_list=tf.train.FloatList(value=record[value_name].flatten()))
+            if record[value_name].dtype == np.uint8:
+                features[value_name] = tf.train.Feature(bytes_list=tf.train.BytesList(value=(record[value_name].tobytes(),)))
+            else:
+                features[value_name] = tf.train.Feature(float_list=tf.train.FloatList(value=record[value_name].astype(dtype=np.float32).flatten()))
     record = tf.train.SequenceExample(context=tf.train.Features(feature=features), feature_lists=tf.train.FeatureLists(feature_list=feature_lists))
     serialized_record = record.SerializeToString()
     return serialized_record
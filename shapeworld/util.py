@@ -1,14 +1,18 @@
 from __future__ import division
 from collections import Counter, namedtuple
+from contextlib import contextmanager
+import hashlib
 from itertools import chain, combinations
 import json
 from math import ceil, cos, floor, pi, sin, sqrt, trunc
 from operator import __truediv__
 import os
-from random import randint, random, randrange, uniform
+from random import getstate, randint, random, randrange, seed as random_seed, setstate, uniform
 import tarfile
+import tempfile
 import time
 import zipfile
+import numpy as np
 
 
 def value_or_default(value, default):
@@ -124,6 +128,37 @@ def toposort(partial_order):
     return result
 
 
+def instance_seed(*keys):
+    # seed from JSON-serializable keys, stable across processes and platforms unlike hash()
+    digest = hashlib.sha256(json.dumps(keys, sort_keys=True).encode('utf-8')).hexdigest()
+    return int(digest[:16], 16)
+
+
+def instance_seeds(n, *keys):
+    # seeds of instances 0 to n - 1 as instance_seed, but the keys are serialized and hashed once and the seed of
+    # instance i is derived from their digest and i
+    digest = hashlib.sha256(json.dumps(keys, sort_keys=True).encode('utf-8')).digest()
+    return [int(hashlib.sha256(digest + i.to_bytes(8, 'little')).hexdigest()[:16], 16) for i in range(n)]
+
+
+@contextmanager
+def random_context(seed):
+    # all samplers draw from the random module and numpy.random, which within the context are seeded by seed (unless
+    # None), their previous states are restored afterwards
+    if seed is None:
+        yield
+        return
+    python_state = getstate()
+    numpy_state = np.random.get_state()
+    random_seed(seed)
+    np.random.seed(seed % 2 ** 32)
+    try:
+        yield
+    finally:
+        setstate(python_state)
+        np.random.set_state(numpy_state)
+
+
 def cumulative_distribution(values):
     if isinstance(values, int):
         assert values > 0
@@ -445,9 +480,12 @@ class Archive(object):
         self.archive = path
         self.mode = mode
         if not os.path.isdir('/tmp/shapeworld'):
-            os.makedirs('/tmp/shapeworld')
-        self.temp_directory = os.path.join('/tmp/shapeworld', str(time.time()))
-        os.mkdir(self.temp_directory)
+            try:
+                os.makedirs('/tmp/shapeworld')
+            except OSError:  # created concurrently by another process
+                assert os.path.isdir('/tmp/shapeworld')
+        # unique also across concurrently running processes
+        self.temp_directory = tempfile.mkdtemp(prefix=str(time.time()), dir='/tmp/shapeworld')
         if archive is None:
             self.archive_type = None
             if not os.path.isdir(self.archive):
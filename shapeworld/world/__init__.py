@@ -2,12 +2,15 @@ from shapeworld.world.shape import Shape
 from shapeworld.world.color import Color
 from shapeworld.world.texture import Texture
 from shapeworld.world.entity import Entity
+from shapeworld.world.table import EntityTable
 from shapeworld.world.world import World
+from shapeworld.world.renderer import WorldRenderer
 
 
 all_shapes = Shape.shapes
 all_colors = Color.colors
 all_textures = Texture.textures
+all_renderers = WorldRenderer.renderers
 
 
-__all__ = ['World', 'Entity', 'Shape', 'Color', 'Texture', 'all_shapes', 'all_colors', 'all_textures']
+__all__ = ['World', 'Entity', 'EntityTable', 'Shape', 'Color', 'Texture', 'WorldRenderer', 'all_shapes', 'all_colors', 'all_textures', 'all_renderers']
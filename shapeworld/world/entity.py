@@ -1,30 +1,80 @@
 from __future__ import division
 from math import cos, pi, sin
 from random import choice, random
+import numpy as np
 from shapeworld.util import Point
 from shapeworld.world import Shape, Color, Texture
+from shapeworld.world.renderer import SdfRenderer
 
 
 default_resolution = Point(100, 100)
+default_renderer = SdfRenderer()
+
+
+def grid_points(topleft, bottomright, resolution):
+    # array of shape (height, width, 2) with the same points as Point.range(topleft, bottomright, resolution)
+    topleft = topleft.__floor__()
+    bottomright = bottomright.__ceil__()
+    points = np.empty(shape=(max(bottomright.y - topleft.y, 0), max(bottomright.x - topleft.x, 0), 2))
+    points[:, :, 0] = np.arange(topleft.x, bottomright.x) / (resolution.x - 1)
+    points[:, :, 1] = (np.arange(topleft.y, bottomright.y) / (resolution.y - 1))[:, np.newaxis]
+    return points
+
+
+def separation(part1, part2):
+    # largest gap between two convex polygons along their edge normals: a lower bound of their distance, <= 0.0 iff they intersect
+    vertices1, normals1 = part1
+    vertices2, normals2 = part2
+    max_gap = float('-inf')
+    for normals in (normals1, normals2):
+        projections1 = np.dot(vertices1, normals.T)
+        projections2 = np.dot(vertices2, normals.T)
+        gaps = np.maximum(projections2.min(axis=0) - projections1.max(axis=0), projections1.min(axis=0) - projections2.max(axis=0))
+        max_gap = max(max_gap, float(gaps.max()))
+    return max_gap
+
+
+def point_distance(point, part):
+    # distance of a point to a convex polygon
+    vertices, normals = part
+    edges = np.concatenate([vertices[1:], vertices[:1]]) - vertices
+    offsets = point - vertices
+    if np.all(np.sum(offsets * normals, axis=1) <= 0.0) or np.all(np.sum(offsets * normals, axis=1) >= 0.0):
+        return 0.0
+    linear = np.clip(np.sum(offsets * edges, axis=1) / np.sum(edges * edges, axis=1), 0.0, 1.0)
+    distances = offsets - linear[:, np.newaxis] * edges
+    return float(np.hypot(distances[:, 0], distances[:, 1]).min())
 
 
 class Entity(object):
 
-    __slots__ = ('id', 'shape', 'color', 'texture', 'center', 'rotation', 'rotation_sin', 'rotation_cos', 'relative_topleft', 'relative_bottomright', 'topleft', 'bottomright', 'collisions')
+    __slots__ = ('id', 'world', 'shape', 'color', 'texture', 'center', 'rotation', 'rotation_sin', 'rotation_cos', 'relative_topleft', 'relative_bottomright', 'topleft', 'bottomright', 'collisions', 'parts')
 
-    def __init__(self, shape, color, texture, center, rotation):
+    def __init__(self, shape, color, texture, center, rotation, relative_bounds=None):
         assert isinstance(shape, Shape)
         assert isinstance(color, Color)
         assert isinstance(texture, Texture)
         assert isinstance(center, Point)
         assert isinstance(rotation, float) and 0.0 <= rotation < 1.0
         self.id = None
+        self.world = None  # set while the entity is part of a world
         self.shape = shape
         self.color = color
         self.texture = texture
         self.rotation = rotation
         self.rotation_sin = sin(-rotation * 2.0 * pi)
         self.rotation_cos = cos(-rotation * 2.0 * pi)
+        if relative_bounds is None:
+            inv_rot_sin = sin(rotation * 2.0 * pi)
+            inv_rot_cos = cos(rotation * 2.0 * pi)
+            topleft = Point.one
+            bottomright = Point.zero
+            for point in self.shape.polygon():
+                point = point.rotate(inv_rot_sin, inv_rot_cos)
+                topleft = topleft.min(point)
+                bottomright = bottomright.max(point)
+            relative_bounds = (topleft, bottomright)
+        self.relative_topleft, self.relative_bottomright = relative_bounds
         self.set_center(center=center)
         self.collisions = dict()
 
@@ -52,60 +102,69 @@ class Entity(object):
     def __contains__(self, offset):
         return self.rotate(offset) in self.shape
 
+    def contains_array(self, offsets):
+        return self.shape.contains_array(self.rotate_array(offsets))
+
     def distance(self, offset):
         return self.shape.distance(self.rotate(offset))
 
+    def rotate_array(self, offsets):
+        rotated = np.empty_like(offsets)
+        rotated[..., 0] = offsets[..., 0] * self.rotation_cos - offsets[..., 1] * self.rotation_sin
+        rotated[..., 1] = offsets[..., 0] * self.rotation_sin + offsets[..., 1] * self.rotation_cos
+        return rotated
+
+    def distance_array(self, offsets):
+        return self.shape.distance_array(self.rotate_array(offsets))
+
+    def convex_parts(self):
+        # shape outline as convex polygons in world coordinates: vertices and edge normals, arrays of shape (n, 2)
+        if self.parts is None:
+            self.parts = []
+            for vertices in self.shape.convex_parts():
+                rotated = np.empty_like(vertices)
+                rotated[:, 0] = vertices[:, 0] * self.rotation_cos + vertices[:, 1] * self.rotation_sin + self.center.x
+                rotated[:, 1] = -vertices[:, 0] * self.rotation_sin + vertices[:, 1] * self.rotation_cos + self.center.y
+                edges = np.concatenate([rotated[1:], rotated[:1]]) - rotated
+                normals = np.empty_like(edges)
+                normals[:, 0] = edges[:, 1]
+                normals[:, 1] = -edges[:, 0]
+                normals /= np.hypot(edges[:, 0], edges[:, 1])[:, np.newaxis]
+                self.parts.append((rotated, normals))
+        return self.parts
+
+    def analytic_collides(self, other, min_distance):
+        # whether some point is within min_distance of both entities, or None if too close to decide geometrically
+        if (self.center - other.center).length > self.shape.size.length + other.shape.size.length + 2.0 * min_distance:
+            return False  # bounding circles
+        elif self.shape.name == 'circle' and other.shape.name == 'circle':
+            distance = (self.center - other.center).length - self.shape.size.x - other.shape.size.x
+            max_distance = 2.0 * min_distance
+        elif self.shape.name == 'circle' or other.shape.name == 'circle':
+            circle, polygon = (self, other) if self.shape.name == 'circle' else (other, self)
+            center = np.array(circle.center)
+            distance = min(point_distance(center, part) for part in polygon.convex_parts()) - circle.shape.size.x
+            max_distance = 2.0 * min_distance + polygon.shape.outline_error
+        else:
+            distance = min(separation(part1, part2) for part1 in self.convex_parts() for part2 in other.convex_parts())
+            max_distance = 2.0 * min_distance + self.shape.outline_error + other.shape.outline_error
+        if distance <= 0.0:
+            return True
+        elif distance > max_distance:
+            return False
+        else:
+            return None
+
     def set_center(self, center):
         self.center = center
-        inv_rot_sin = sin(self.rotation * 2.0 * pi)
-        inv_rot_cos = cos(self.rotation * 2.0 * pi)
-        topleft = Point.one
-        bottomright = Point.zero
-        for point in self.shape.polygon():
-            point = point.rotate(inv_rot_sin, inv_rot_cos)
-            topleft = topleft.min(point)
-            bottomright = bottomright.max(point)
-        self.relative_topleft = topleft
-        self.relative_bottomright = bottomright
-        self.topleft = topleft + center
-        self.bottomright = bottomright + center
-
-    def draw(self, world_array, world_size, bounding_box=False):
-        shift = Point(2.0 / world_size.x, 2.0 / world_size.y)
-        scale = 1.0 + 2.0 * shift
-        topleft = (((self.topleft + 0.5 * shift) / scale) * world_size).max(Point.izero)
-        bottomright = (((self.bottomright + 1.5 * shift) / scale) * world_size).min(world_size)
-        color = self.color.get_color()
-
-        for (x, y), point in Point.range(topleft, bottomright, world_size):
-            point = point * scale - shift
-            offset = point - self.center
-            distance = self.distance(offset)
-            if distance == 0.0:
-                # assert offset in self
-                world_array[y, x] = self.texture.get_color(color, offset)
-            else:
-                # assert offset not in self
-                distance = max(1.0 - distance * min(*world_size), 0.0)
-                world_array[y, x] = distance * self.texture.get_color(color, offset) + (1.0 - distance) * world_array[y, x]
-
-        if bounding_box:  # draw bounding box
-            x1 = world_size + 1
-            x2 = -1
-            y1 = world_size + 1
-            y2 = -1
-            for (x, y), point in Point.range(topleft, bottomright, world_size):
-                if x < x1:
-                    x1 = x
-                if x > x2:
-                    x2 = x
-                if y < y1:
-                    y1 = y
-                if y > y2:
-                    y2 = y
-            for (x, y), point in Point.range(topleft, bottomright, world_size):
-                if x == x1 or x == x2 or y == y1 or y == y2:
-                    world_array[y, x] = color
+        self.parts = None
+        self.topleft = self.relative_topleft + center
+        self.bottomright = self.relative_bottomright + center
+
+    def draw(self, world_array, world_size, bounding_box=False, renderer=None):
+        if renderer is None:
+            renderer = default_renderer
+        renderer.draw_entity(entity=self, world_array=world_array, world_size=world_size, bounding_box=bounding_box)
 
     def collides(self, other, ratio=False, symmetric=False, resolution=None):
         if other.id in self.collisions and self.id in other.collisions:
@@ -136,18 +195,30 @@ class Entity(object):
 
         if resolution is None:
             resolution = default_resolution
+        average_resolution = 0.5 * (resolution.x + resolution.y)
+        analytic_collision = self.analytic_collides(other, min_distance=(1.0 / average_resolution))
+        if not ratio and analytic_collision is not None:
+            return analytic_collision
+        elif analytic_collision is False:
+            # pixel integration only counts points within a fraction of min_distance of both entities
+            if other.id is not None:
+                self.collisions[other.id] = 0.0
+            if self.id is not None:
+                other.collisions[self.id] = 0.0
+            if symmetric:
+                return 0.0
+            else:
+                return (0.0, 0.0)
+
         topleft *= resolution
         bottomright *= resolution
-        average_resolution = 0.5 * (resolution.x + resolution.y)
+        points = grid_points(topleft, bottomright, resolution)
         if ratio:
             granularity = 1.0 / resolution.x / resolution.y
-            collision = 0.0
-            for _, point in Point.range(topleft, bottomright, resolution):
-                distance1 = max(1.0 - average_resolution * self.distance(point - self.center), 0.0)
-                distance2 = max(1.0 - average_resolution * other.distance(point - other.center), 0.0)
-                average_distance = 0.5 * (distance1 + distance2)
-                if average_distance > 0.95:
-                    collision += granularity * average_distance
+            distances1 = np.maximum(1.0 - average_resolution * self.distance_array(points - self.center), 0.0)
+            distances2 = np.maximum(1.0 - average_resolution * other.distance_array(points - other.center), 0.0)
+            average_distances = 0.5 * (distances1 + distances2)
+            collision = granularity * float(np.sum(average_distances[average_distances > 0.95]))
             collision1 = collision / self.shape.area
             collision2 = collision / other.shape.area
             if other.id is not None:
@@ -160,9 +231,7 @@ class Entity(object):
                 return (collision1, collision2)
         else:
             min_distance = 1.0 / average_resolution
-            for _, point in Point.range(topleft, bottomright, resolution):
-                if (self.distance(point - self.center) <= min_distance) and (other.distance(point - other.center) <= min_distance):
-                    return True
+            return bool(np.any((self.distance_array(points - self.center) <= min_distance) & (other.distance_array(points - other.center) <= min_distance)))
 
     def not_collides(self, other, ratio=False, symmetric=False, resolution=None):
         if resolution is None:
@@ -186,29 +255,25 @@ class Entity(object):
         topleft *= resolution
         bottomright *= resolution
         average_resolution = 0.5 * (resolution.x + resolution.y)
+        points = grid_points(topleft, bottomright, resolution)
         if ratio:
             granularity = 1.0 / resolution.x / resolution.y
-            collision = 0.0
-            for _, point in Point.range(topleft, bottomright, resolution):
-                distance1 = min(average_resolution * self.distance(point - self.center), 1.0)
-                distance2 = max(1.0 - average_resolution * other.distance(point - other.center), 0.0)
-                average_distance = 0.5 * (distance1 + distance2)
-                if average_distance > 0.95:
-                    collision += granularity * average_distance
+            distances1 = np.minimum(average_resolution * self.distance_array(points - self.center), 1.0)
+            distances2 = np.maximum(1.0 - average_resolution * other.distance_array(points - other.center), 0.0)
+            average_distances = 0.5 * (distances1 + distances2)
+            collision = granularity * float(np.sum(average_distances[average_distances > 0.95]))
             if symmetric:
                 return min(collision / self.shape.area, collision / other.shape.area)
             else:
                 return (collision / self.shape.area, collision / other.shape.area)
         else:
             min_distance = 1.0 / average_resolution
-            for c, point in Point.range(topleft, bottomright, resolution):
-                if (self.distance(point - self.center) > min_distance) and (other.distance(point - other.center) <= min_distance):
-                    return True
+            return bool(np.any((self.distance_array(points - self.center) > min_distance) & (other.distance_array(points - other.center) <= min_distance)))
 
     @staticmethod
     def random_instance(center, rotation, size_range, distortion_range, shade_range, shapes=None, colors=None, textures=None, combinations=None):
         # random color in texture
-        assert (shapes and colors and textures) != bool(combinations)
+        assert bool(shapes and colors and textures) != bool(combinations)
         rotation = random() if rotation else 0.0
         if combinations:
             shape, color, texture = choice(combinations)
@@ -220,3 +285,70 @@ class Entity(object):
             color = Color.random_instance(colors, shade_range)
             texture = Texture.random_instance(textures, [c for c in Color.colors if c != color.name], shade_range)
         return Entity(shape, color, texture, center, rotation)
+
+    @staticmethod
+    def random_block(num_entities, rotation, size_range, distortion_range, shade_range, shapes=None, colors=None, textures=None, combinations=None):
+        # attributes of num_entities random entities as arrays, distributed as random_instance, see from_block
+        assert bool(shapes and colors and textures) != bool(combinations)
+        if combinations:
+            indices = np.random.randint(len(combinations), size=num_entities)
+            shape_names = [combinations[n][0] for n in indices]
+            color_names = [combinations[n][1] for n in indices]
+            texture_names = [combinations[n][2] for n in indices]
+        else:
+            shape_names = [shapes[n] for n in np.random.randint(len(shapes), size=num_entities)]
+            color_names = [colors[n] for n in np.random.randint(len(colors), size=num_entities)]
+            texture_names = [textures[n] for n in np.random.randint(len(textures), size=num_entities)]
+        sizes = np.random.uniform(size_range[0], size_range[1], size=num_entities)
+        distortions = np.random.uniform(distortion_range[0], distortion_range[1], size=num_entities)
+        rotations = np.random.random_sample(size=num_entities) if rotation else np.zeros(shape=(num_entities,))
+        shades = np.zeros(shape=(num_entities,))
+        if shade_range > 0.0:
+            resample = np.ones(shape=(num_entities,), dtype=np.bool_)
+            while resample.any():
+                shades[resample] = np.random.normal(loc=0.0, scale=shade_range, size=int(resample.sum()))
+                resample = np.abs(shades) > shade_range
+        centers = np.random.random_sample(size=(num_entities, 2))
+
+        # bounding boxes relative to the center, as in __init__
+        relative_topleft = np.empty(shape=(num_entities, 2))
+        relative_bottomright = np.empty(shape=(num_entities, 2))
+        areas = np.empty(shape=(num_entities,))
+        shape_names_array = np.array(shape_names)
+        for name in set(shape_names):
+            indices = np.flatnonzero(shape_names_array == name)
+            scales = np.empty(shape=(len(indices), 1, 2))
+            scales[:, 0, 0] = sizes[indices]
+            if Shape.shapes[name].distorted:
+                scales[:, 0, 1] = sizes[indices] / distortions[indices]
+            else:
+                scales[:, 0, 1] = sizes[indices]
+            vertices = Shape.polygon_prototype(name)[np.newaxis] * scales
+            inv_rot_sin = np.sin(rotations[indices] * 2.0 * pi)[:, np.newaxis]
+            inv_rot_cos = np.cos(rotations[indices] * 2.0 * pi)[:, np.newaxis]
+            xs = vertices[:, :, 0] * inv_rot_cos - vertices[:, :, 1] * inv_rot_sin
+            ys = vertices[:, :, 0] * inv_rot_sin + vertices[:, :, 1] * inv_rot_cos
+            relative_topleft[indices, 0] = np.minimum(xs.min(axis=1), 1.0)
+            relative_topleft[indices, 1] = np.minimum(ys.min(axis=1), 1.0)
+            relative_bottomright[indices, 0] = np.maximum(xs.max(axis=1), 0.0)
+            relative_bottomright[indices, 1] = np.maximum(ys.max(axis=1), 0.0)
+            areas[indices] = Shape.area_prototype(name) * scales[:, 0, 0] * scales[:, 0, 1]
+
+        texture_colors = {name: [color for color in Color.colors if color != name] for name in set(color_names)}
+        return {'shapes': shape_names, 'sizes': sizes, 'distortions': distortions, 'rotations': rotations, 'colors': color_names, 'shades': shades, 'textures': texture_names, 'texture_colors': texture_colors, 'shade_range': shade_range, 'centers': centers, 'relative_topleft': relative_topleft, 'relative_bottomright': relative_bottomright, 'areas': areas}
+
+    @staticmethod
+    def from_block(block, n, center=None):
+        shape_class = Shape.shapes[block['shapes'][n]]
+        size = float(block['sizes'][n])
+        if shape_class.distorted:
+            shape = shape_class(Point(size, size / float(block['distortions'][n])))
+        else:
+            shape = shape_class(size)
+        color = block['colors'][n]
+        color = Color(color, Color.colors[color], float(block['shades'][n]))
+        texture = Texture.textures[block['textures'][n]].random_instance(block['texture_colors'][color.name], block['shade_range'])
+        if center is None:
+            center = Point(float(block['centers'][n, 0]), float(block['centers'][n, 1]))
+        relative_bounds = (Point(float(block['relative_topleft'][n, 0]), float(block['relative_topleft'][n, 1])), Point(float(block['relative_bottomright'][n, 0]), float(block['relative_bottomright'][n, 1])))
+        return Entity(shape, color, texture, center, float(block['rotations'][n]), relative_bounds=relative_bounds)
@@ -0,0 +1,241 @@
+from __future__ import division
+from collections import OrderedDict
+from math import ceil, cos, pi, sin
+import numpy as np
+from PIL import Image, ImageDraw
+from shapeworld.util import Point
+from shapeworld.world.texture import SolidTexture
+
+
+class WorldRenderer(object):
+
+    # draws entities into a world array of shape (height, width, 3)
+
+    def __init__(self):
+        pass
+
+    @staticmethod
+    def from_config(config):
+        # accepts WorldRenderer, name, or dict with 'name' and keyword arguments
+        if config is None or isinstance(config, WorldRenderer):
+            return config
+        if isinstance(config, str):
+            return WorldRenderer.renderers[config]()
+        assert isinstance(config, dict) and 'name' in config
+        config = dict(config)
+        return WorldRenderer.renderers[config.pop('name')](**config)
+
+    @staticmethod
+    def pixel_bounds(entity, world_size):
+        # pixel bounding box of the entity, as used for drawing
+        shift = Point(2.0 / world_size.x, 2.0 / world_size.y)
+        scale = 1.0 + 2.0 * shift
+        topleft = (((entity.topleft + 0.5 * shift) / scale) * world_size).max(Point.izero).__floor__()
+        bottomright = (((entity.bottomright + 1.5 * shift) / scale) * world_size).min(world_size).__ceil__()
+        return shift, scale, topleft, bottomright
+
+    def draw(self, entities, world_array, world_size):
+        for entity in entities:
+            self.draw_entity(entity=entity, world_array=world_array, world_size=world_size)
+
+    def draw_entity(self, entity, world_array, world_size, bounding_box=False):
+        shift, scale, topleft, bottomright = WorldRenderer.pixel_bounds(entity=entity, world_size=world_size)
+        if not topleft < bottomright:
+            return
+
+        # pixel grid of the bounding box as offsets relative to the entity center
+        xs = np.arange(topleft.x, bottomright.x) * (scale.x / (world_size.x - 1)) - shift.x - entity.center.x
+        ys = np.arange(topleft.y, bottomright.y) * (scale.y / (world_size.y - 1)) - shift.y - entity.center.y
+        offsets = np.empty(shape=(len(ys), len(xs), 2))
+        offsets[:, :, 0] = xs
+        offsets[:, :, 1] = ys[:, np.newaxis]
+
+        alpha = self.coverage(entity=entity, offsets=offsets, world_size=world_size, shift=shift, scale=scale, topleft=topleft)[:, :, np.newaxis]
+        colors = entity.texture.get_color_array(entity.color.get_color(), offsets)
+        region = world_array[topleft.y: bottomright.y, topleft.x: bottomright.x]
+        region += (alpha * (colors - region)).astype(dtype=region.dtype)
+
+        if bounding_box:  # draw bounding box
+            color = entity.color.get_color()
+            region[0, :] = color
+            region[-1, :] = color
+            region[:, 0] = color
+            region[:, -1] = color
+
+    def coverage(self, entity, offsets, world_size, shift, scale, topleft):
+        # array of shape (height, width) with values in [0, 1]
+        raise NotImplementedError
+
+
+class SdfRenderer(WorldRenderer):
+
+    # exact rendering via the signed distance of every pixel to the entity shape
+
+    def coverage(self, entity, offsets, world_size, shift, scale, topleft):
+        distances = entity.distance_array(offsets)
+        return np.maximum(1.0 - distances * min(*world_size), 0.0)
+
+
+class PolygonRenderer(WorldRenderer):
+
+    # rendering by filling the shape outlines with PIL.ImageDraw, optionally supersampled for antialiasing, edges are
+    # hard instead of the one-pixel falloff of SdfRenderer, without supersampling all entities of a world are filled
+    # into one image of entity labels in drawing order, so later entities cover earlier ones as with sequential
+    # drawing, which is faster than SdfRenderer (about 50us vs 85us per entity for 64x64 worlds, 100us vs 130us for
+    # 128x128), with supersampling entities are filled one by one, which is slower than SdfRenderer for 64x64 worlds
+    # (about 125us per entity) and on par for 256x256
+
+    def __init__(self, supersampling=None):
+        super(PolygonRenderer, self).__init__()
+        self.supersampling = int(supersampling or 1)
+        assert self.supersampling >= 1
+
+    def fill(self, entity, draw, fill, world_size, shift, scale, topleft):
+        # world coordinates to supersampled pixel coordinates relative to topleft, where pixel n covers [n, n + 1),
+        # computed on scalars since the outlines are small
+        s = self.supersampling
+        factor_x = (world_size.x - 1) / scale.x * s
+        factor_y = (world_size.y - 1) / scale.y * s
+        center_x = (entity.center.x + shift.x) * factor_x - (topleft.x - 0.5) * s
+        center_y = (entity.center.y + shift.y) * factor_y - (topleft.y - 0.5) * s
+        if entity.shape.name == 'circle' or (entity.shape.name == 'ellipse' and entity.rotation in (0.0, 0.5)):
+            # analytic ellipse fill
+            size_x = entity.shape.size.x * factor_x
+            size_y = entity.shape.size.y * factor_y
+            draw.ellipse(xy=[(center_x - size_x, center_y - size_y), (center_x + size_x, center_y + size_y)], fill=fill)
+        else:
+            # inverse of entity.rotate_array
+            rotation_sin = entity.rotation_sin
+            rotation_cos = entity.rotation_cos
+            draw.polygon(xy=[(center_x + (point.x * rotation_cos + point.y * rotation_sin) * factor_x, center_y + (point.y * rotation_cos - point.x * rotation_sin) * factor_y) for point in entity.shape.outline()], fill=fill)
+
+    def coverage(self, entity, offsets, world_size, shift, scale, topleft):
+        height, width = offsets.shape[:2]
+        s = self.supersampling
+        mask = Image.new(mode='L', size=(width * s, height * s), color=0)
+        self.fill(entity=entity, draw=ImageDraw.Draw(im=mask), fill=255, world_size=world_size, shift=shift, scale=scale, topleft=topleft)
+        if s > 1:
+            mask = mask.resize(size=(width, height), resample=Image.BOX)
+        return np.asarray(mask, dtype=np.float32) / 255.0
+
+    def draw(self, entities, world_array, world_size):
+        if self.supersampling > 1 or not all(isinstance(entity.texture, SolidTexture) for entity in entities):
+            return super(PolygonRenderer, self).draw(entities=entities, world_array=world_array, world_size=world_size)
+        shift = Point(2.0 / world_size.x, 2.0 / world_size.y)
+        scale = 1.0 + 2.0 * shift
+        labels = Image.new(mode=('L' if len(entities) < 256 else 'I'), size=(world_size.x, world_size.y), color=0)
+        draw = ImageDraw.Draw(im=labels)
+        for n, entity in enumerate(entities, 1):
+            self.fill(entity=entity, draw=draw, fill=n, world_size=world_size, shift=shift, scale=scale, topleft=Point.izero)
+        labels = np.asarray(labels)
+        # label 0 keeps the world array
+        colors = np.array([(0.0, 0.0, 0.0)] + [entity.color.get_color() for entity in entities], dtype=world_array.dtype)
+        covered = labels > 0
+        world_array[covered] = colors[labels[covered]]
+
+
+class SpriteRenderer(WorldRenderer):
+
+    # stamps cached alpha masks, with shape size, rotation and center quantized to the given granularities and to whole pixels
+
+    def __init__(self, size_granularity=None, rotation_granularity=None, max_memory=None):
+        super(SpriteRenderer, self).__init__()
+        self.size_granularity = size_granularity or 0.005
+        self.rotation_granularity = rotation_granularity or (1.0 / 128.0)
+        self.max_memory = int(max_memory or 2 ** 26)  # bytes
+        self.sprites = OrderedDict()  # least recently used first
+        self.memory = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def hit_rate(self):
+        if self.hits + self.misses == 0:
+            return 0.0
+        return self.hits / (self.hits + self.misses)
+
+    def statistics(self):
+        return {'sprites': len(self.sprites), 'memory': self.memory, 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'hit_rate': self.hit_rate}
+
+    def sprite(self, entity, world_size):
+        size_bucket = (int(round(entity.shape.size.x / self.size_granularity)), int(round(entity.shape.size.y / self.size_granularity)))
+        num_rotation_buckets = int(round(1.0 / self.rotation_granularity))
+        rotation_bucket = int(round(entity.rotation * num_rotation_buckets)) % num_rotation_buckets
+        key = (entity.shape.name, size_bucket, rotation_bucket, world_size.x, world_size.y)
+        if key in self.sprites:
+            self.hits += 1
+            self.sprites[key] = sprite = self.sprites.pop(key)
+            return sprite
+        self.misses += 1
+
+        shape = entity.shape.copy()
+        shape.size = Point(size_bucket[0] * self.size_granularity, size_bucket[1] * self.size_granularity)
+        rotation = rotation_bucket / num_rotation_buckets
+        rotation_sin = sin(-rotation * 2.0 * pi)
+        rotation_cos = cos(-rotation * 2.0 * pi)
+        extent = Point.zero
+        for point in shape.polygon():
+            extent = extent.max(abs(point.rotate(-rotation_sin, rotation_cos)))
+        shift = Point(2.0 / world_size.x, 2.0 / world_size.y)
+        scale = 1.0 + 2.0 * shift
+        step = scale / (world_size - 1)
+        radius = Point(int(ceil(extent.x / step.x)) + 2, int(ceil(extent.y / step.y)) + 2)
+
+        # pixel grid around the center pixel as offsets relative to the entity center
+        xs = np.arange(-radius.x, radius.x + 1) * step.x
+        ys = np.arange(-radius.y, radius.y + 1) * step.y
+        offsets = np.empty(shape=(len(ys), len(xs), 2))
+        offsets[:, :, 0] = xs * rotation_cos - ys[:, np.newaxis] * rotation_sin
+        offsets[:, :, 1] = xs * rotation_sin + ys[:, np.newaxis] * rotation_cos
+        distances = shape.distance_array(offsets)
+        alpha = np.maximum(1.0 - distances * min(*world_size), 0.0).astype(dtype=np.float32)[:, :, np.newaxis]
+
+        sprite = ((radius.x, radius.y), alpha)
+        self.sprites[key] = sprite
+        self.memory += alpha.nbytes
+        while self.memory > self.max_memory and len(self.sprites) > 1:
+            _, (_, evicted) = self.sprites.popitem(last=False)
+            self.memory -= evicted.nbytes
+            self.evictions += 1
+        return sprite
+
+    def draw_entity(self, entity, world_array, world_size, bounding_box=False):
+        (rx, ry), alpha = self.sprite(entity=entity, world_size=world_size)
+        # nearest pixel to the entity center, computed on scalars since this is the hot path
+        cx = int(round((entity.center.x + 2.0 / world_size.x) * (world_size.x - 1) / (1.0 + 4.0 / world_size.x)))
+        cy = int(round((entity.center.y + 2.0 / world_size.y) * (world_size.y - 1) / (1.0 + 4.0 / world_size.y)))
+        left = max(cx - rx, 0)
+        top = max(cy - ry, 0)
+        right = min(cx + rx + 1, world_size.x)
+        bottom = min(cy + ry + 1, world_size.y)
+        if left >= right or top >= bottom:
+            return
+        alpha = alpha[top - cy + ry: bottom - cy + ry, left - cx + rx: right - cx + rx]
+
+        if isinstance(entity.texture, SolidTexture):
+            colors = entity.color.get_color()
+        else:
+            shift = Point(2.0 / world_size.x, 2.0 / world_size.y)
+            scale = 1.0 + 2.0 * shift
+            xs = np.arange(left, right) * (scale.x / (world_size.x - 1)) - shift.x - entity.center.x
+            ys = np.arange(top, bottom) * (scale.y / (world_size.y - 1)) - shift.y - entity.center.y
+            offsets = np.empty(shape=(len(ys), len(xs), 2))
+            offsets[:, :, 0] = xs
+            offsets[:, :, 1] = ys[:, np.newaxis]
+            colors = entity.texture.get_color_array(entity.color.get_color(), offsets)
+        region = world_array[top: bottom, left: right]
+        region += (alpha * (colors - region)).astype(dtype=region.dtype)
+
+        if bounding_box:  # draw bounding box
+            color = entity.color.get_color()
+            region[0, :] = color
+            region[-1, :] = color
+            region[:, 0] = color
+            region[:, -1] = color
+
+
+WorldRenderer.renderers = {
+    'sdf': SdfRenderer,
+    'polygon': PolygonRenderer,
+    'sprite': SpriteRenderer}
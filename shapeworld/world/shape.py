@@ -1,6 +1,7 @@
 from __future__ import division
-from math import cos, pi, sqrt
+from math import cos, pi, sin, sqrt
 from random import choice, uniform
+import numpy as np
 from shapeworld.util import Point
 
 
@@ -8,12 +9,20 @@ golden_ratio = sqrt(5.0) / 2.0 - 0.5
 sqrt34 = sqrt(0.75)
 cos18 = cos(0.1 * pi)
 cos45 = sqrt(2.0) / 2.0
+num_curve_points = 48
+
+
+def length_array(x, y):
+    # same rounding as Point.length, so that the array methods agree with the scalar ones on the boundary
+    return np.sqrt(x * x + y * y)
 
 
 class Shape(object):
 
     __slots__ = ('size',)
 
+    distorted = False  # whether random_instance samples a distortion, otherwise it is instantiated from a float size
+
     def __init__(self, size):
         assert isinstance(size, Point) and 0.0 < size < 1.0
         self.size = size / 2.0
@@ -38,9 +47,15 @@ class Shape(object):
     def __contains__(self, offset):
         raise NotImplementedError
 
+    def contains_array(self, offsets):  # offsets: array of shape (..., 2)
+        raise NotImplementedError
+
     def distance(self, offset):
         raise NotImplementedError
 
+    def distance_array(self, offsets):  # offsets: array of shape (..., 2)
+        raise NotImplementedError
+
     @property
     def area(self):
         raise NotImplementedError
@@ -48,13 +63,47 @@ class Shape(object):
     def polygon(self):
         return (Point(-self.size.x, -self.size.y),
                 Point(self.size.x, -self.size.y),
-                Point(-self.size.x, self.size.y),
-                Point(self.size.x, self.size.y))
+                Point(self.size.x, self.size.y),
+                Point(-self.size.x, self.size.y))
+
+    def outline(self):  # exact boundary in order, curves approximated by num_curve_points
+        return self.polygon()
+
+    @property
+    def outline_error(self):  # max distance of the shape boundary outside of its outline
+        return 0.0
+
+    def convex_parts(self):  # outline as union of convex polygons, arrays of shape (n, 2)
+        return (np.array([(point.x, point.y) for point in self.outline()]),)
 
     @staticmethod
     def random_instance(shapes, size_range, distortion_range):
         return choice([Shape.shapes[shape] for shape in shapes]).random_instance(size_range, distortion_range)
 
+    @staticmethod
+    def polygon_prototype(name):
+        # polygon as array of shape (n, 2), scaled by the float size, or per axis by the size point if distorted
+        if name not in Shape.prototypes:
+            shape_class = Shape.shapes[name]
+            if shape_class.distorted:
+                shape = shape_class(Point(0.5, 0.5))
+            else:
+                shape = shape_class(0.5)
+            Shape.prototypes[name] = np.array([(point.x, point.y) for point in shape.polygon()]) * 2.0
+        return Shape.prototypes[name]
+
+    @staticmethod
+    def area_prototype(name):
+        # area scaled by the product of the size per axis, see polygon_prototype
+        if name not in Shape.area_prototypes:
+            shape_class = Shape.shapes[name]
+            if shape_class.distorted:
+                shape = shape_class(Point(0.5, 0.5))
+            else:
+                shape = shape_class(0.5)
+            Shape.area_prototypes[name] = shape.area * 4.0
+        return Shape.area_prototypes[name]
+
 
 class WorldShape(Shape):
     __slots__ = ()
@@ -69,9 +118,16 @@ class WorldShape(Shape):
     def __contains__(self, offset):
         return abs(offset) < 0.5
 
+    def contains_array(self, offsets):
+        return np.all(np.abs(offsets) < 0.5, axis=-1)
+
     def distance(self, offset):
         return (abs(offset) - 0.5).positive().length
 
+    def distance_array(self, offsets):
+        offsets = np.maximum(np.abs(offsets) - 0.5, 0.0)
+        return length_array(offsets[..., 0], offsets[..., 1])
+
     @property
     def area(self):
         return 1.0
@@ -95,9 +151,16 @@ class SquareShape(Shape):
     def __contains__(self, offset):
         return abs(offset) <= self.size
 
+    def contains_array(self, offsets):
+        return np.all(np.abs(offsets) <= self.size, axis=-1)
+
     def distance(self, offset):
         return (abs(offset) - self.size).positive().length
 
+    def distance_array(self, offsets):
+        offsets = np.maximum(np.abs(offsets) - self.size, 0.0)
+        return length_array(offsets[..., 0], offsets[..., 1])
+
     @property
     def area(self):
         return 4.0 * self.size.x * self.size.y
@@ -105,8 +168,8 @@ class SquareShape(Shape):
     def polygon(self):
         return (Point(-self.size.x, -self.size.y),
                 Point(self.size.x, -self.size.y),
-                Point(-self.size.x, self.size.y),
-                self.size)
+                self.size,
+                Point(-self.size.x, self.size.y))
 
     @staticmethod
     def random_instance(size_range, distortion_range):
@@ -116,6 +179,8 @@ class SquareShape(Shape):
 class RectangleShape(Shape):
     __slots__ = ('size',)
 
+    distorted = True
+
     def __init__(self, size):
         return super(RectangleShape, self).__init__(size)
 
@@ -129,9 +194,16 @@ class RectangleShape(Shape):
     def __contains__(self, offset):
         return abs(offset) <= self.size
 
+    def contains_array(self, offsets):
+        return np.all(np.abs(offsets) <= self.size, axis=-1)
+
     def distance(self, offset):
         return (abs(offset) - self.size).positive().length
 
+    def distance_array(self, offsets):
+        offsets = np.maximum(np.abs(offsets) - self.size, 0.0)
+        return length_array(offsets[..., 0], offsets[..., 1])
+
     @property
     def area(self):
         return 4.0 * self.size.x * self.size.y
@@ -139,8 +211,8 @@ class RectangleShape(Shape):
     def polygon(self):
         return (Point(-self.size.x, -self.size.y),
                 Point(self.size.x, -self.size.y),
-                Point(-self.size.x, self.size.y),
-                self.size)
+                self.size,
+                Point(-self.size.x, self.size.y))
 
     @staticmethod
     def random_instance(size_range, distortion_range):
@@ -167,6 +239,9 @@ class TriangleShape(Shape):
     def __contains__(self, offset):
         return offset.y >= -self.size.y and 2.0 * abs(offset.x) / self.size.x + offset.y / self.size.y <= 1.0
 
+    def contains_array(self, offsets):
+        return (offsets[..., 1] >= -self.size.y) & (2.0 * np.abs(offsets[..., 0]) / self.size.x + offsets[..., 1] / self.size.y <= 1.0)
+
     def distance(self, offset):
         if offset.y < -self.size.y:
             return (abs(offset) - self.size).positive().length
@@ -175,6 +250,15 @@ class TriangleShape(Shape):
             linear = min(max(offset.y - offset.x + self.size.x, 0.0) / (self.size.x + 2.0 * self.size.y), 1.0)
             return Point(offset.x - (1.0 - linear) * self.size.x, offset.y - linear * 2.0 * self.size.y).positive().length
 
+    def distance_array(self, offsets):
+        x = np.abs(offsets[..., 0])
+        y = offsets[..., 1] + self.size.y
+        linear = np.clip((y - x + self.size.x) / (self.size.x + 2.0 * self.size.y), 0.0, 1.0)
+        distance = length_array(np.maximum(x - (1.0 - linear) * self.size.x, 0.0), np.maximum(y - linear * 2.0 * self.size.y, 0.0))
+        below = offsets[..., 1] < -self.size.y
+        below_distance = length_array(np.maximum(x - self.size.x, 0.0), np.maximum(np.abs(offsets[..., 1]) - self.size.y, 0.0))
+        return np.where(below, below_distance, distance)
+
     @property
     def area(self):
         return 2.0 * self.size.x * self.size.y
@@ -209,6 +293,13 @@ class PentagonShape(Shape):
                 (offset.y + self.size.y) >= ((abs(offset.x) - golden_ratio * self.size.x) / ((1.0 - golden_ratio) * self.size.x) * (golden_ratio * 2.0 * self.size.y)) and
                 (offset.y - (golden_ratio - 0.5) * 2.0 * self.size.y) <= ((1.0 - abs(offset.x) / self.size.x) * (1.0 - golden_ratio) * 2.0 * self.size.y))
 
+    def contains_array(self, offsets):
+        x = np.abs(offsets[..., 0])
+        y = offsets[..., 1]
+        return ((y >= -self.size.y) &
+                ((y + self.size.y) >= ((x - golden_ratio * self.size.x) / ((1.0 - golden_ratio) * self.size.x) * (golden_ratio * 2.0 * self.size.y))) &
+                ((y - (golden_ratio - 0.5) * 2.0 * self.size.y) <= ((1.0 - x / self.size.x) * (1.0 - golden_ratio) * 2.0 * self.size.y)))
+
     def distance(self, offset):
         offset = Point(abs(offset.x), offset.y + self.size.y - golden_ratio * 2.0 * self.size.y)
         if offset.y < 0.0:
@@ -225,6 +316,23 @@ class PentagonShape(Shape):
             linear = min(max(offset.y - offset.x + self.size.x, 0.0) / (self.size.x + y_length), 1.0)
             return Point(offset.x - (1.0 - linear) * self.size.x, offset.y - linear * y_length).positive().length
 
+    def distance_array(self, offsets):
+        x = np.abs(offsets[..., 0])
+        y = offsets[..., 1] + self.size.y - golden_ratio * 2.0 * self.size.y
+        # lower part
+        y_length = golden_ratio * 2.0 * self.size.y
+        lower_center_distance = np.maximum(-y - y_length, 0.0)
+        lower_x = x - golden_ratio * self.size.x
+        x_length = (1.0 - golden_ratio) * self.size.x
+        linear = np.clip((-y - lower_x + x_length) / (x_length + y_length), 0.0, 1.0)
+        lower_side_distance = length_array(np.maximum(lower_x - (1.0 - linear) * x_length, 0.0), np.maximum(-y - linear * y_length, 0.0))
+        lower_distance = np.where(x < golden_ratio * self.size.x, lower_center_distance, lower_side_distance)
+        # upper part
+        y_length = (1.0 - golden_ratio) * 2.0 * self.size.y
+        linear = np.clip((y - x + self.size.x) / (self.size.x + y_length), 0.0, 1.0)
+        upper_distance = length_array(np.maximum(x - (1.0 - linear) * self.size.x, 0.0), np.maximum(y - linear * y_length, 0.0))
+        return np.where(y < 0.0, lower_distance, upper_distance)
+
     @property
     def area(self):
         return (4.0 * golden_ratio * golden_ratio * self.size.x * self.size.y +
@@ -264,6 +372,10 @@ class CrossShape(Shape):
         offset = abs(offset)
         return offset <= self.size and not (offset - self.size.x / 3.0).positive() > 0.0
 
+    def contains_array(self, offsets):
+        offsets = np.abs(offsets)
+        return np.all(offsets <= self.size, axis=-1) & ~np.all(offsets > self.size.x / 3.0, axis=-1)
+
     def distance(self, offset):
         offset = abs(offset)
         if offset.x > offset.y:
@@ -271,6 +383,13 @@ class CrossShape(Shape):
         else:
             return (offset - Point(self.size.x / 3.0, self.size.y)).positive().length
 
+    def distance_array(self, offsets):
+        x = np.abs(offsets[..., 0])
+        y = np.abs(offsets[..., 1])
+        horizontal_distance = length_array(np.maximum(x - self.size.x, 0.0), np.maximum(y - self.size.y / 3.0, 0.0))
+        vertical_distance = length_array(np.maximum(x - self.size.x / 3.0, 0.0), np.maximum(y - self.size.y, 0.0))
+        return np.where(x > y, horizontal_distance, vertical_distance)
+
     @property
     def area(self):
         return 20.0 * self.size.x * self.size.y / 9.0
@@ -285,6 +404,28 @@ class CrossShape(Shape):
                 Point(-self.size.x / 3.0, self.size.y),
                 Point(-self.size.x, self.size.y / 3.0))
 
+    def outline(self):
+        x = self.size.x / 3.0
+        y = self.size.y / 3.0
+        return (Point(-self.size.x, -y),
+                Point(-x, -y),
+                Point(-x, -self.size.y),
+                Point(x, -self.size.y),
+                Point(x, -y),
+                Point(self.size.x, -y),
+                Point(self.size.x, y),
+                Point(x, y),
+                Point(x, self.size.y),
+                Point(-x, self.size.y),
+                Point(-x, y),
+                Point(-self.size.x, y))
+
+    def convex_parts(self):
+        x = self.size.x / 3.0
+        y = self.size.y / 3.0
+        return (np.array([(-self.size.x, -y), (self.size.x, -y), (self.size.x, y), (-self.size.x, y)]),
+                np.array([(-x, -self.size.y), (x, -self.size.y), (x, self.size.y), (-x, self.size.y)]))
+
     @staticmethod
     def random_instance(size_range, distortion_range):
         return CrossShape(uniform(*size_range))
@@ -308,9 +449,15 @@ class CircleShape(Shape):
     def __contains__(self, offset):
         return offset.length <= self.size.x
 
+    def contains_array(self, offsets):
+        return length_array(offsets[..., 0], offsets[..., 1]) <= self.size.x
+
     def distance(self, offset):
         return max(offset.length - self.size.x, 0.0)
 
+    def distance_array(self, offsets):
+        return np.maximum(length_array(offsets[..., 0], offsets[..., 1]) - self.size.x, 0.0)
+
     @property
     def area(self):
         return pi * self.size.x * self.size.y
@@ -326,6 +473,17 @@ class CircleShape(Shape):
                 Point(-curve_size, self.size.y),
                 Point(-self.size.x, curve_size))
 
+    def outline(self):
+        return tuple(Point(self.size.x * cos(2.0 * pi * n / num_curve_points), self.size.x * sin(2.0 * pi * n / num_curve_points)) for n in range(num_curve_points))
+
+    @property
+    def outline_error(self):
+        return self.size.x * (1.0 - cos(pi / num_curve_points))
+
+    def convex_parts(self):
+        angles = np.arange(num_curve_points) * (2.0 * pi / num_curve_points)
+        return (np.stack([self.size.x * np.cos(angles), self.size.x * np.sin(angles)], axis=1),)
+
     @staticmethod
     def random_instance(size_range, distortion_range):
         return CircleShape(uniform(*size_range))
@@ -350,6 +508,10 @@ class SemicircleShape(Shape):
         offset += Point(0.0, self.size.y)
         return offset.length <= self.size.x and offset.y >= 0.0
 
+    def contains_array(self, offsets):
+        y = offsets[..., 1] + self.size.y
+        return (length_array(offsets[..., 0], y) <= self.size.x) & (y >= 0.0)
+
     def distance(self, offset):
         offset += Point(0.0, self.size.y)
         if offset.y < 0.0:
@@ -357,6 +519,13 @@ class SemicircleShape(Shape):
         else:
             return max(offset.length - self.size.x, 0.0)
 
+    def distance_array(self, offsets):
+        x = offsets[..., 0]
+        y = offsets[..., 1] + self.size.y
+        below_distance = length_array(np.maximum(np.abs(x) - self.size.x, 0.0), np.abs(y))
+        above_distance = np.maximum(length_array(x, y) - self.size.x, 0.0)
+        return np.where(y < 0.0, below_distance, above_distance)
+
     @property
     def area(self):
         return pi * self.size.x * self.size.y
@@ -370,6 +539,17 @@ class SemicircleShape(Shape):
                 Point(-curve_size, self.size.y),
                 Point(-self.size.x, -self.size.y + curve_size))
 
+    def outline(self):
+        return tuple(Point(self.size.x * cos(pi * n / num_curve_points), self.size.x * sin(pi * n / num_curve_points) - self.size.y) for n in range(num_curve_points + 1))
+
+    @property
+    def outline_error(self):
+        return self.size.x * (1.0 - cos(0.5 * pi / num_curve_points))
+
+    def convex_parts(self):
+        angles = np.arange(num_curve_points + 1) * (pi / num_curve_points)
+        return (np.stack([self.size.x * np.cos(angles), self.size.x * np.sin(angles) - self.size.y], axis=1),)
+
     @staticmethod
     def random_instance(size_range, distortion_range):
         return SemicircleShape(uniform(*size_range))
@@ -378,6 +558,8 @@ class SemicircleShape(Shape):
 class EllipseShape(Shape):
     __slots__ = ('size',)
 
+    distorted = True
+
     def __init__(self, size):
         return super(EllipseShape, self).__init__(size)
 
@@ -391,6 +573,10 @@ class EllipseShape(Shape):
     def __contains__(self, offset):
         return (offset / self.size).length <= 1.0
 
+    def contains_array(self, offsets):
+        offsets = offsets / self.size
+        return length_array(offsets[..., 0], offsets[..., 1]) <= 1.0
+
     def distance(self, offset):
         direction = offset / self.size
         direction_length = direction.length
@@ -398,6 +584,12 @@ class EllipseShape(Shape):
             return 0.0
         return ((direction - direction / direction_length) * self.size).length
 
+    def distance_array(self, offsets):
+        directions = offsets / self.size
+        direction_lengths = length_array(directions[..., 0], directions[..., 1])
+        scale = 1.0 - 1.0 / np.maximum(direction_lengths, 1.0)
+        return np.where(direction_lengths <= 1.0, 0.0, length_array(directions[..., 0] * scale * self.size.x, directions[..., 1] * scale * self.size.y))
+
     @property
     def area(self):
         return pi * self.size.x * self.size.y
@@ -413,6 +605,17 @@ class EllipseShape(Shape):
                 Point(-curve_size.x, self.size.y),
                 Point(-self.size.x, curve_size.y))
 
+    def outline(self):
+        return tuple(Point(self.size.x * cos(2.0 * pi * n / num_curve_points), self.size.y * sin(2.0 * pi * n / num_curve_points)) for n in range(num_curve_points))
+
+    @property
+    def outline_error(self):
+        return max(self.size.x, self.size.y) * (1.0 - cos(pi / num_curve_points))
+
+    def convex_parts(self):
+        angles = np.arange(num_curve_points) * (2.0 * pi / num_curve_points)
+        return (np.stack([self.size.x * np.cos(angles), self.size.y * np.sin(angles)], axis=1),)
+
     @staticmethod
     def random_instance(size_range, distortion_range):
         size = uniform(*size_range)
@@ -430,3 +633,6 @@ Shape.shapes = {
     'semicircle': SemicircleShape,
     'ellipse': EllipseShape
 }
+
+Shape.prototypes = dict()
+Shape.area_prototypes = dict()
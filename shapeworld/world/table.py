@@ -0,0 +1,111 @@
+from __future__ import division
+import numpy as np
+from shapeworld.world import Shape, Color, Texture
+
+
+class EntityTable(object):
+
+    # struct-of-arrays view of a list of entities, one row per entity, for evaluating captions as boolean masks over the
+    # rows, the table of a world is built on demand by World.entity_table and its rows are the entity ids, clause
+    # evaluations are memoized by the table and hence discarded together with it whenever the world changes
+
+    __slots__ = ('entities', 'x', 'y', 'area', 'shade', 'shape', 'color', 'texture', 'z', 'collision', 'dx', 'dy', 'distance', 'cache', 'hits', 'misses')
+
+    shape_ids = {name: n for n, name in enumerate(sorted(Shape.shapes))}
+    color_ids = {name: n for n, name in enumerate(sorted(Color.colors))}
+    texture_ids = {name: n for n, name in enumerate(sorted(Texture.textures))}
+
+    def __init__(self, entities, overlaps=None):
+        # overlaps as World.overlaps, otherwise computed from the entities
+        self.entities = list(entities)
+        self.x = np.array([entity.center.x for entity in self.entities], dtype=np.float64)
+        self.y = np.array([entity.center.y for entity in self.entities], dtype=np.float64)
+        self.area = np.array([entity.shape.area for entity in self.entities], dtype=np.float64)
+        self.shade = np.array([entity.color.shade for entity in self.entities], dtype=np.float64)
+        self.shape = np.array([EntityTable.shape_ids.get(entity.shape.name, -1) for entity in self.entities], dtype=np.int64)
+        self.color = np.array([EntityTable.color_ids.get(entity.color.name, -1) for entity in self.entities], dtype=np.int64)
+        self.texture = np.array([EntityTable.texture_ids.get(entity.texture.name, -1) for entity in self.entities], dtype=np.int64)
+        # z-index, entities are drawn in id order
+        self.z = np.array([-1 if entity.id is None else entity.id for entity in self.entities], dtype=np.int64)
+        # collision[n, k]: symmetric overlap ratio of entities n and k, zero on the diagonal
+        num_entities = len(self.entities)
+        if overlaps is None:
+            self.collision = np.zeros(shape=(num_entities, num_entities))
+            for n, entity in enumerate(self.entities):
+                for k, other in enumerate(self.entities[:n]):
+                    self.collision[n, k] = self.collision[k, n] = entity.collides(other, ratio=True, symmetric=True)
+        else:
+            assert overlaps.shape == (num_entities, num_entities)
+            self.collision = np.minimum(overlaps, overlaps.T)
+        # pairwise offsets and distances, computed on demand by geometry
+        self.dx = None
+        self.dy = None
+        self.distance = None
+        self.cache = dict()  # (evaluation, clause signature, mask bytes) -> mask or agreement
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entities)
+
+    def geometry(self):
+        # dx[n, k], dy[n, k]: offset of the center of entity n from the center of entity k, distance[n, k]: their length
+        if self.distance is None:
+            self.dx = self.x[:, np.newaxis] - self.x[np.newaxis, :]
+            self.dy = self.y[:, np.newaxis] - self.y[np.newaxis, :]
+            self.distance = np.sqrt(self.dx * self.dx + self.dy * self.dy)
+        return self.dx, self.dy, self.distance
+
+    @property
+    def hit_rate(self):
+        if self.hits + self.misses == 0:
+            return 0.0
+        return self.hits / (self.hits + self.misses)
+
+    def statistics(self):
+        return {'evaluations': len(self.cache), 'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hit_rate}
+
+    def memoize(self, evaluation, clause, mask, compute, signature=None):
+        # cached masks are shared between evaluations and must not be modified, the signature of the clause is passed
+        # on to compute, which passes the signatures of nested clauses on in turn, so it is built once per evaluation
+        if signature is None:
+            signature = clause.signature()
+        key = (evaluation, signature, mask.tobytes())
+        if key in self.cache:
+            self.hits += 1
+            return self.cache[key]
+        self.misses += 1
+        result = self.cache[key] = compute(table=self, mask=mask, signature=signature)
+        return result
+
+    @staticmethod
+    def select(entities):
+        # table and row indices of the entities, the table of their world if they all belong to the same one
+        world = entities[0].world if entities else None
+        if world is not None and entities is world.entities:
+            return world.entity_table(), np.arange(len(entities))
+        elif world is not None and all(entity.world is world for entity in entities):
+            return world.entity_table(), np.array([entity.id for entity in entities], dtype=np.int64)
+        return EntityTable(entities=entities), np.arange(len(entities))
+
+    def mask(self, indices):
+        mask = np.zeros(shape=(len(self.entities),), dtype=bool)
+        mask[indices] = True
+        return mask
+
+    @staticmethod
+    def name_id(name, ids):
+        # -1 for unknown names, so they do not match any entity
+        return ids.get(name, -1)
+
+    @staticmethod
+    def names_lookup(names, ids):
+        # boolean array indexed by id, whether the id is one of the given names, with a last entry for id -1
+        lookup = np.zeros(shape=(len(ids) + 1,), dtype=bool)
+        for name in names:
+            if name in ids:
+                lookup[ids[name]] = True
+        return lookup
+
+    def combinations(self):
+        return [(entity.shape.name, entity.color.name, entity.texture.name) for entity in self.entities]
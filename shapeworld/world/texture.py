@@ -25,6 +25,9 @@ class Texture(object):
     def get_color(self, color, offset):
         raise NotImplementedError
 
+    def get_color_array(self, color, offsets):  # offsets: array of shape (..., 2)
+        raise NotImplementedError
+
     @staticmethod
     def random_instance(textures, colors, shade_range):
         return choice([Texture.textures[texture] for texture in textures]).random_instance(colors, shade_range)
@@ -46,6 +49,9 @@ class SolidTexture(Texture):
     def get_color(self, color, offset):
         return color
 
+    def get_color_array(self, color, offsets):
+        return color
+
     @staticmethod
     def random_instance(colors, shade_range):
         return SolidTexture()
@@ -1,15 +1,22 @@
-from random import choice, random
+from __future__ import division
+from math import ceil
+from random import choice, random, randrange
 import numpy as np
 from PIL import Image
+from shapeworld import util
+from shapeworld.noise import add_noise
 from shapeworld.util import toposort, Point
-from shapeworld.world import Entity, Color
+from shapeworld.world import Entity, Color, EntityTable
+from shapeworld.world.entity import default_renderer, grid_points
 from shapeworld.world.shape import WorldShape
 from shapeworld.world.texture import SolidTexture
 
 
 class World(Entity):
 
-    __slots__ = ('size', 'entities', 'shape', 'color', 'texture', 'center', 'rotation', 'rotation_sin', 'rotation_cos', 'relative_topleft', 'relative_bottomright', 'topleft', 'bottomright')
+    __slots__ = ('size', 'entities', 'grid', 'masks', 'overlaps', 'obstructions', 'occupancy', 'num_occupied', 'spectrum', 'table', 'shape', 'color', 'texture', 'center', 'rotation', 'rotation_sin', 'rotation_cos', 'relative_topleft', 'relative_bottomright', 'topleft', 'bottomright')
+
+    GRID_SIZE = 16
 
     def __init__(self, size, color):
         assert isinstance(size, int) and size > 0
@@ -21,6 +28,14 @@ class World(Entity):
         self.bottomright = Point.one
         self.size = Point(size, size)
         self.entities = []
+        self.grid = dict()  # uniform grid over entity bounding boxes: cell -> entities
+        self.masks = []  # per entity, computed on demand: pixel topleft, closeness 1 - resolution * distance over its bounding box
+        self.overlaps = np.zeros(shape=(0, 0))  # overlaps[n, k]: ratio of entity n covered by entity k
+        self.obstructions = []  # per entity, number of entities rejected by add_entity because of colliding with it
+        self.occupancy = None  # per pixel maximum closeness of the first num_occupied entities, computed on demand from their masks
+        self.num_occupied = 0
+        self.spectrum = None  # number of entities and FFT of the padded pixels close to them
+        self.table = None  # entity table, computed on demand
 
     def __eq__(self, other):
         raise NotImplementedError
@@ -32,28 +47,38 @@ class World(Entity):
     def from_model(model):
         world = World(size=model['size'], color=Color.from_model(model['color']))
         for entity_model in model['entities']:
-            world.entities.append(Entity.from_model(entity_model))
+            world.insert_entity(Entity.from_model(entity_model))
         return world
 
     def copy(self, include_entities=True):
         copy = World(size=self.size.x, color=str(self.color))
         if include_entities:
             for entity in self.entities:
-                copy.entities.append(entity.copy())
+                copy.insert_entity(entity.copy())
         return copy
 
     def rotate(self, offset):
         return offset
 
+    def rotate_array(self, offsets):
+        return offsets
+
     def __contains__(self, offset):
         return offset in self.shape
 
+    def contains_array(self, offsets):
+        return self.shape.contains_array(offsets)
+
     def distance(self, offset):
         return self.shape.distance(offset)
 
-    def draw(self, world_array, world_size):
-        for entity in self.entities:
-            entity.draw(world_array=world_array, world_size=world_size)
+    def distance_array(self, offsets):
+        return self.shape.distance_array(offsets)
+
+    def draw(self, world_array, world_size, renderer=None):
+        if renderer is None:
+            renderer = default_renderer
+        renderer.draw(entities=self.entities, world_array=world_array, world_size=world_size)
 
     def random_location(self, provoke_collision=False):
         if provoke_collision and self.entities:
@@ -63,6 +88,148 @@ class World(Entity):
         else:
             return Point.random_instance(Point.zero, Point.one)
 
+    def update_occupancy(self):
+        if self.occupancy is None:
+            self.occupancy = np.full(shape=(self.size.y, self.size.x), fill_value=-np.inf)
+            self.num_occupied = 0
+        for entity in self.entities[self.num_occupied:]:
+            topleft, closeness = self.entity_mask(entity)
+            left = max(topleft.x, 0)
+            top = max(topleft.y, 0)
+            right = min(topleft.x + closeness.shape[1], self.size.x)
+            bottom = min(topleft.y + closeness.shape[0], self.size.y)
+            if left < right and top < bottom:
+                region = self.occupancy[top: bottom, left: right]
+                np.maximum(region, closeness[top - topleft.y: bottom - topleft.y, left - topleft.x: right - topleft.x], out=region)
+        self.num_occupied = len(self.entities)
+        return self.occupancy
+
+    def occupied(self, location):
+        # whether the pixel closest to the location is close to some entity, so that without collision tolerance every
+        # entity centered at the location collides
+        if not self.entities or not (0.0 <= location.x <= 1.0 and 0.0 <= location.y <= 1.0):
+            return False
+        x = int(round(location.x * (self.size.x - 1)))
+        y = int(round(location.y * (self.size.y - 1)))
+        return bool(self.update_occupancy()[y, x] >= 0.0)
+
+    @staticmethod
+    def outside_block(world_size, topleft, bottomright, areas, boundary_tolerance=0.0):
+        # boolean array over entities given as arrays of absolute bounding boxes and areas, whether add_entity is certain to
+        # reject them for exceeding the boundary tolerance: at most the part of their bounding box within the world, with a
+        # margin of two pixels, is inside it, and the pixel integration may further miss a one-pixel band along their
+        # outline, bounded by the perimeter of the bounding box, and a tenth of their area
+        average_resolution = 0.5 * (world_size.x + world_size.y)
+        widths = np.maximum(np.minimum(bottomright[:, 0], 1.0 + 2.0 / world_size.x) - np.maximum(topleft[:, 0], -2.0 / world_size.x), 0.0)
+        heights = np.maximum(np.minimum(bottomright[:, 1], 1.0 + 2.0 / world_size.y) - np.maximum(topleft[:, 1], -2.0 / world_size.y), 0.0)
+        band = 2.0 * ((bottomright[:, 0] - topleft[:, 0]) + (bottomright[:, 1] - topleft[:, 1])) / average_resolution
+        return areas - widths * heights - band > (boundary_tolerance + 0.1) * areas
+
+    def free_locations(self, entity, boundary_tolerance=0.0, collision_tolerance=0.0):
+        # boolean array over pixels, whether the entity centered there fits the boundary and, without collision tolerance, is
+        # clear of all other entities, or otherwise at least centered outside of them
+        resolution = self.size
+        radius = Point(int(ceil(max(-entity.relative_topleft.x, entity.relative_bottomright.x) * (resolution.x - 1))) + 1, int(ceil(max(-entity.relative_topleft.y, entity.relative_bottomright.y) * (resolution.y - 1))) + 1)
+        offsets = np.empty(shape=(2 * radius.y + 1, 2 * radius.x + 1, 2))
+        offsets[:, :, 0] = np.arange(-radius.x, radius.x + 1) / (resolution.x - 1)
+        offsets[:, :, 1] = (np.arange(-radius.y, radius.y + 1) / (resolution.y - 1))[:, np.newaxis]
+        distances = entity.distance_array(offsets)
+
+        # footprint pixels within the world for all centers, as rectangle sums of the footprint
+        inside = np.zeros(shape=(2 * radius.y + 2, 2 * radius.x + 2))
+        inside[1:, 1:] = np.cumsum(np.cumsum(distances == 0.0, axis=0), axis=1)
+        ys = radius.y - np.arange(resolution.y)
+        xs = radius.x - np.arange(resolution.x)
+        rows = inside[np.clip(ys + resolution.y, 0, 2 * radius.y + 1)] - inside[np.clip(ys, 0, 2 * radius.y + 1)]
+        within = rows[:, np.clip(xs + resolution.x, 0, 2 * radius.x + 1)] - rows[:, np.clip(xs, 0, 2 * radius.x + 1)]
+        free = inside[-1, -1] - within <= boundary_tolerance * inside[-1, -1] + 0.5
+        if not self.entities:
+            return free
+
+        if collision_tolerance > 0.0:
+            return free & (self.update_occupancy() < 1.0)
+
+        # same criterion as add_entity: no pixel within min_distance of both entities, counted for all centers as
+        # correlation of the footprint with the padded world via FFT
+        min_distance = 2.0 / (resolution.x + resolution.y)  # closeness 0.0
+        padding = Point(resolution.x // 2, resolution.y // 2).max(radius)
+        shape = (resolution.y + 2 * padding.y, resolution.x + 2 * padding.x)
+        if self.spectrum is None or self.spectrum[0] != len(self.entities) or self.spectrum[1].shape[0] != shape[0]:
+            occupied = np.zeros(shape=shape)
+            occupied[padding.y: padding.y + resolution.y, padding.x: padding.x + resolution.x] = self.update_occupancy() >= 0.0
+            self.spectrum = (len(self.entities), np.fft.rfft2(occupied))
+        correlation = np.fft.irfft2(self.spectrum[1] * np.conj(np.fft.rfft2(distances <= min_distance, s=shape)), s=shape)
+        return free & (correlation[padding.y - radius.y: padding.y - radius.y + resolution.y, padding.x - radius.x: padding.x - radius.x + resolution.x] < 0.5)
+
+    def random_free_location(self, entity, boundary_tolerance=0.0, collision_tolerance=0.0, provoke_collision=False):
+        # uniform over pixels where the entity fits, jittered within the pixel, or None if there are none
+        free = self.free_locations(entity, boundary_tolerance=boundary_tolerance, collision_tolerance=collision_tolerance)
+        if provoke_collision and self.entities:
+            # same neighbourhood as random_location
+            other = choice(self.entities)
+            xs = (np.arange(self.size.x) / (self.size.x - 1) - other.center.x) / other.shape.size.x
+            ys = (np.arange(self.size.y) / (self.size.y - 1) - other.center.y) / other.shape.size.y
+            distances = np.hypot(xs, ys[:, np.newaxis])
+            free &= (distances >= 0.75) & (distances <= 1.75)
+        free = np.flatnonzero(free)
+        if len(free) == 0:
+            return None
+        y, x = divmod(int(free[randrange(len(free))]), self.size.x)
+        x = min(max((x + random() - 0.5) / (self.size.x - 1), 0.0), 1.0)
+        y = min(max((y + random() - 0.5) / (self.size.y - 1), 0.0), 1.0)
+        return Point(x, y)
+
+    def grid_cells(self, entity):
+        topleft = (entity.topleft * World.GRID_SIZE).__floor__().max(0).min(World.GRID_SIZE - 1)
+        bottomright = (entity.bottomright * World.GRID_SIZE).__floor__().max(0).min(World.GRID_SIZE - 1)
+        return [(x, y) for x in range(topleft.x, bottomright.x + 1) for y in range(topleft.y, bottomright.y + 1)]
+
+    def grid_insert(self, entity):
+        for cell in self.grid_cells(entity):
+            self.grid.setdefault(cell, []).append(entity)
+
+    def grid_remove(self, entity):
+        for cell in self.grid_cells(entity):
+            self.grid[cell] = [other for other in self.grid[cell] if other is not entity]
+
+    def candidates(self, entity):
+        # entities whose bounding box overlaps the entity's, ordered by id
+        candidates = dict()
+        for cell in self.grid_cells(entity):
+            for other in self.grid.get(cell, ()):
+                if other.id not in candidates and other.bottomright.x >= entity.topleft.x and other.topleft.x <= entity.bottomright.x and other.bottomright.y >= entity.topleft.y and other.topleft.y <= entity.bottomright.y:
+                    candidates[other.id] = other
+        return [candidates[n] for n in sorted(candidates)]
+
+    def compute_mask(self, entity):
+        # same pixel grid as Entity.collides at world resolution
+        resolution = self.size
+        topleft = entity.topleft * resolution
+        bottomright = entity.bottomright * resolution
+        points = grid_points(topleft, bottomright, resolution)
+        closeness = 1.0 - 0.5 * (resolution.x + resolution.y) * entity.distance_array(points - entity.center)
+        return topleft.__floor__(), closeness
+
+    def entity_mask(self, entity):
+        if self.masks[entity.id] is None:
+            self.masks[entity.id] = self.compute_mask(entity)
+        return self.masks[entity.id]
+
+    def overlap(self, entity1, mask1, entity2, mask2):
+        # returns overlap ratios of both entities, as Entity.collides(ratio=True), and whether they collide at all
+        topleft1, closeness1 = mask1
+        topleft2, closeness2 = mask2
+        topleft = topleft1.max(topleft2)
+        bottomright = Point(min(topleft1.x + closeness1.shape[1], topleft2.x + closeness2.shape[1]), min(topleft1.y + closeness1.shape[0], topleft2.y + closeness2.shape[0]))
+        if not topleft < bottomright:
+            return 0.0, 0.0, False
+        closeness1 = closeness1[topleft.y - topleft1.y: bottomright.y - topleft1.y, topleft.x - topleft1.x: bottomright.x - topleft1.x]
+        closeness2 = closeness2[topleft.y - topleft2.y: bottomright.y - topleft2.y, topleft.x - topleft2.x: bottomright.x - topleft2.x]
+        collides = bool(np.any((closeness1 >= 0.0) & (closeness2 >= 0.0)))
+        average_closeness = 0.5 * (np.maximum(closeness1, 0.0) + np.maximum(closeness2, 0.0))
+        collision = float(np.sum(average_closeness[average_closeness > 0.95])) / self.size.x / self.size.y
+        return collision / entity1.shape.area, collision / entity2.shape.area, collides
+
     def add_entity(self, entity, boundary_tolerance=0.0, collision_tolerance=0.0):
         entity.id = len(self.entities)
         if boundary_tolerance > 0.0:
@@ -71,61 +238,170 @@ class World(Entity):
         else:
             if self.not_collides(entity, resolution=self.size):
                 return False
-        if collision_tolerance > 0.0:
-            for other in self.entities:
-                collision = entity.collides(other, ratio=True, symmetric=True, resolution=self.size)
+        min_distance = 2.0 / (self.size.x + self.size.y)
+        mask = None
+        overlaps = []
+        for other in self.candidates(entity):
+            if collision_tolerance == 0.0:
+                # exact geometric test first, pixel integration only if the result is borderline
+                analytic_collision = entity.analytic_collides(other, min_distance=min_distance)
+                if analytic_collision is True:
+                    self.obstructions[other.id] += 1
+                    return False
+                elif analytic_collision is False:
+                    overlaps.append((other.id, 0.0, 0.0))
+                    continue
+            if mask is None:
+                mask = self.compute_mask(entity)
+            collision1, collision2, collides = self.overlap(entity, mask, other, self.entity_mask(other))
+            if collision_tolerance > 0.0:
+                collision = min(collision1, collision2)
                 if collision > collision_tolerance or (collision > 0.0 and entity.color.name == other.color.name):
+                    self.obstructions[other.id] += 1
                     return False
-        else:
-            if any(entity.collides(other, resolution=self.size) for other in self.entities):
+            elif collides:
+                self.obstructions[other.id] += 1
                 return False
-        self.entities.append(entity)
+            overlaps.append((other.id, collision1, collision2))
+        self.insert_entity(entity, mask=mask, overlaps=overlaps)
         return True
 
+    def insert_entity(self, entity, mask=None, overlaps=None):
+        # adds the entity unconditionally and records its overlaps with all other entities
+        n = len(self.entities)
+        entity.id = n
+        entity.world = self
+        if overlaps is None:
+            mask = self.compute_mask(entity)
+            overlaps = [(other.id,) + self.overlap(entity, mask, other, self.entity_mask(other))[:2] for other in self.candidates(entity)]
+        self.entities.append(entity)
+        self.grid_insert(entity)
+        self.masks.append(mask)
+        self.obstructions.append(0)
+        matrix = np.zeros(shape=(n + 1, n + 1))
+        matrix[:n, :n] = self.overlaps
+        for k, collision1, collision2 in overlaps:
+            matrix[n, k] = collision1
+            matrix[k, n] = collision2
+        self.overlaps = matrix
+        self.table = None
+        # cached collisions are kept in sync with the overlap matrix for all pairs
+        entity.collisions = {k: float(matrix[n, k]) for k in range(n)}
+        for other in self.entities[:n]:
+            other.collisions[n] = float(matrix[other.id, n])
+
+    def remove_entity(self, entity):
+        # removes an added entity, reassigns ids and updates overlaps accordingly
+        assert self.entities[entity.id] is entity
+        self.grid_remove(entity)
+        self.entities.pop(entity.id)
+        self.masks.pop(entity.id)
+        self.obstructions.pop(entity.id)
+        self.overlaps = np.delete(np.delete(self.overlaps, entity.id, axis=0), entity.id, axis=1)
+        self.occupancy = None
+        self.spectrum = None
+        self.table = None
+        for other in self.entities:
+            other.collisions = {(n if n < entity.id else n - 1): c for n, c in other.collisions.items() if n != entity.id}
+            if other.id > entity.id:
+                other.id -= 1
+        entity.id = None
+        entity.world = None
+        entity.collisions = dict()
+
     def sort_entities(self):
         contained = {n: set() for n in range(len(self.entities))}
-        for n in range(len(self.entities)):
-            entity1 = self.entities[n]
-            for k in range(n + 1, len(self.entities)):
-                entity2 = self.entities[k]
-                c1, c2 = entity1.collides(entity2, ratio=True, symmetric=False, resolution=self.size)
-                if c2 > c1:
-                    contained[n].add(k)
-                elif c1 > c2 or c1 != 0.0:
-                    contained[k].add(n)
+        for n, k in zip(*np.nonzero(np.triu(self.overlaps + self.overlaps.T, k=1))):
+            n = int(n)
+            k = int(k)
+            c1 = self.overlaps[n, k]
+            c2 = self.overlaps[k, n]
+            if c2 > c1:
+                contained[n].add(k)
+            elif c1 > c2 or c1 != 0.0:
+                contained[k].add(n)
         sort_indices = toposort(partial_order=contained)
+        new_ids = {i: n for n, i in enumerate(sort_indices)}
         self.entities = [self.entities[n] for n in sort_indices]
+        self.masks = [self.masks[n] for n in sort_indices]
+        self.obstructions = [self.obstructions[n] for n in sort_indices]
+        self.overlaps = self.overlaps[np.ix_(sort_indices, sort_indices)]
+        self.occupancy = None
+        self.spectrum = None
+        self.table = None
         for n, entity in enumerate(self.entities):
             entity.id = n
-            entity.collisions = {sort_indices.index(i): c for i, c in entity.collisions.items()}
+            entity.collisions = {new_ids[i]: c for i, c in entity.collisions.items()}
 
-    def get_array(self, noise_range=None):
-        color = self.color.get_color()
-        if not color.any():
-            world_array = np.zeros(shape=(self.size.y, self.size.x, 3), dtype=np.float32)
-        else:
-            world_array = np.tile(A=np.array(object=color, dtype=np.float32), reps=(self.size.x, self.size.y, 1))
-        self.draw(world_array=world_array, world_size=self.size)
+    def entity_table(self):
+        # rows are entity ids, invalidated whenever entities are inserted, removed or reordered
+        if self.table is None:
+            self.table = EntityTable(entities=self.entities, overlaps=self.overlaps)
+        return self.table
+
+    def get_array(self, noise_range=None, world_array=None, noise_bank=None, renderer=None, random_seed=None):
+        if world_array is None:
+            world_array = np.empty(shape=(self.size.y, self.size.x, 3), dtype=np.float32)
+        world_array[:] = self.color.get_color()
+        self.draw(world_array=world_array, world_size=self.size, renderer=renderer)
         if noise_range is not None and noise_range > 0.0:
-            noise = np.random.normal(loc=0.0, scale=noise_range, size=(self.size.y, self.size.x, 3))
-            mask = (noise < -2.0 * noise_range) + (noise > 2.0 * noise_range)
-            while np.any(a=mask):
-                noise -= mask * noise
-                noise += mask * np.random.normal(loc=0.0, scale=noise_range, size=(self.size.y, self.size.x, 3))
-                mask = (noise < -2.0 * noise_range) + (noise > 2.0 * noise_range)
-            world_array += noise
-            np.clip(world_array, a_min=0.0, a_max=1.0, out=world_array)
+            with util.random_context(random_seed):
+                add_noise(world_arrays=world_array, noise_range=noise_range, noise_bank=noise_bank)
         return world_array
 
+    @staticmethod
+    def get_arrays(worlds, world_arrays, noise_range=None, noise_bank=None, renderer=None, random_seeds=None):
+        # renders worlds directly into the (n, height, width, 3) buffer world_arrays, noise per world seeded by random_seeds if given
+        assert len(worlds) == len(world_arrays)
+        assert random_seeds is None or len(random_seeds) == len(worlds)
+        if not worlds:
+            return world_arrays
+        if world_arrays.dtype != np.float32:
+            # render the batch at full precision and convert it at once
+            float_arrays = np.empty(shape=world_arrays.shape, dtype=np.float32)
+            World.get_arrays(worlds=worlds, world_arrays=float_arrays, noise_range=noise_range, noise_bank=noise_bank, renderer=renderer, random_seeds=random_seeds)
+            world_arrays[:] = World.convert_array(world_array=float_arrays, dtype=world_arrays.dtype)
+            return world_arrays
+        color = worlds[0].color.get_color()
+        if all(world.color.name == worlds[0].color.name and world.color.shade == worlds[0].color.shade for world in worlds):
+            world_arrays[:] = color
+        else:
+            for world, world_array in zip(worlds, world_arrays):
+                world_array[:] = world.color.get_color()
+        for world, world_array in zip(worlds, world_arrays):
+            world.draw(world_array=world_array, world_size=world.size, renderer=renderer)
+        if noise_range is not None and noise_range > 0.0:
+            if random_seeds is None:
+                add_noise(world_arrays=world_arrays, noise_range=noise_range, noise_bank=noise_bank)
+            else:
+                for world_array, random_seed in zip(world_arrays, random_seeds):
+                    with util.random_context(random_seed):
+                        add_noise(world_arrays=world_array, noise_range=noise_range, noise_bank=noise_bank)
+        return world_arrays
+
+    @staticmethod
+    def convert_array(world_array, dtype):
+        # float worlds have values in [0, 1], uint8 worlds in [0, 255]
+        dtype = np.dtype(dtype)
+        if world_array.dtype == dtype:
+            return world_array
+        elif dtype == np.uint8:
+            # rounded, truncation would darken every pixel by half a level on average
+            return np.rint(world_array * 255.0).astype(dtype=np.uint8)
+        elif world_array.dtype == np.uint8:
+            return (world_array * np.float32(1.0 / 255.0)).astype(dtype=dtype)
+        else:
+            return world_array.astype(dtype=dtype)
+
     @staticmethod
     def get_image(world_array):
-        image = Image.fromarray(obj=(world_array * 255.0).astype(dtype=np.uint8), mode='RGB')
+        image = Image.fromarray(obj=World.convert_array(world_array=world_array, dtype=np.uint8), mode='RGB')
         return image
 
     @staticmethod
-    def from_image(image):
-        world_array = (np.array(object=image, dtype=np.float32) / 255.0)
+    def from_image(image, dtype=None):
+        world_array = np.array(object=image, dtype=np.uint8)
         if world_array.shape[2] == 4:
             world_array = world_array[:, :, :3]
         assert world_array.shape[2] == 3
-        return world_array
+        return World.convert_array(world_array=world_array, dtype=(np.float32 if dtype is None else dtype))
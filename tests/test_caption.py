@@ -0,0 +1,299 @@
+import random
+import unittest
+import numpy as np
+from shapeworld.caption import Attribute, EntityType, Relation, Settings
+from shapeworld.generators import GenericGenerator
+
+
+# list-based reference semantics of the predicates, evaluated entity by entity in list order
+
+def attribute_value(entity, attrtype):
+    if attrtype in ('shape', 'shapes'):
+        return entity.shape.name
+    elif attrtype in ('color', 'colors'):
+        return entity.color.name
+    elif attrtype in ('texture', 'textures'):
+        return entity.texture.name
+    elif attrtype == 'combinations':
+        return (entity.shape.name, entity.color.name, entity.texture.name)
+
+
+def extreme_value(entity, attrtype):
+    if attrtype == 'x-max':
+        return entity.center.x, Settings.min_distance
+    elif attrtype == 'y-max':
+        return entity.center.y, Settings.min_distance
+    elif attrtype == 'size-max':
+        return entity.shape.area, Settings.min_area
+    elif attrtype == 'shade-max':
+        return entity.color.shade, Settings.min_shade
+
+
+def reference_agreeing(predicate, entities):
+    if isinstance(predicate, EntityType):
+        for attribute in predicate.attributes:
+            entities = reference_agreeing(attribute, entities)
+        return entities
+
+    elif isinstance(predicate, Attribute):
+        attrtype = predicate.attrtype
+        if attrtype == 'relation':
+            return reference_agreeing(predicate.value, entities)
+        elif attrtype in ('shape', 'color', 'texture'):
+            return [entity for entity in entities if attribute_value(entity, attrtype) == predicate.value]
+        elif attrtype in ('shapes', 'colors', 'textures', 'combinations'):
+            return [entity for entity in entities if attribute_value(entity, attrtype) in predicate.value]
+        else:
+            return [entity for entity in entities if all((extreme_value(entity, attrtype)[0] - extreme_value(other, attrtype)[0]) * predicate.value > extreme_value(entity, attrtype)[1] for other in entities)]
+
+    reltype = predicate.reltype
+    value = predicate.value
+    if reltype in ('attribute', 'type'):
+        return reference_agreeing(value, entities)
+    references = reference_agreeing(predicate.reference, entities)
+
+    if reltype == 'x-rel':
+        return [entity for entity in entities if any((entity.center.x - reference.center.x) * value > max(Settings.min_distance, abs(entity.center.y - reference.center.y)) for reference in references)]
+
+    elif reltype == 'y-rel':
+        return [entity for entity in entities if any((entity.center.y - reference.center.y) * value > max(Settings.min_distance, abs(entity.center.x - reference.center.x)) for reference in references)]
+
+    elif reltype == 'z-rel':
+        return [entity for entity in entities if any(entity.collides(reference, ratio=True, symmetric=True) > 0.0 and entity.id * value > reference.id * value for reference in references)]
+
+    elif reltype == 'proximity-max':
+        # the running maximum has to exceed the one before by min distance
+        agreeing_ids = set()
+        for reference in references:
+            max_distance = -1.0
+            max_entity = None
+            significant = False
+            for entity in entities:
+                if entity.id == reference.id:
+                    continue
+                distance = (entity.center - reference.center).length * value
+                if distance > max_distance:
+                    significant = (distance - max_distance) > Settings.min_distance
+                    max_distance = distance
+                    max_entity = entity
+            if significant:
+                agreeing_ids.add(max_entity.id)
+        return [entity for entity in entities if entity.id in agreeing_ids]
+
+    elif reltype == 'proximity-rel':
+        comparisons = reference_agreeing(predicate.comparison, entities)
+        agreeing_ids = set()
+        for reference in references:
+            for comparison in comparisons:
+                if reference.id == comparison.id:
+                    continue
+                reference_distance = (comparison.center - reference.center).length * value
+                for entity in entities:
+                    if entity.id != reference.id and entity.id != comparison.id and (entity.center - reference.center).length * value - reference_distance > Settings.min_distance:
+                        agreeing_ids.add(entity.id)
+        return [entity for entity in entities if entity.id in agreeing_ids]
+
+    elif reltype == 'size-rel':
+        return [entity for entity in entities if any((entity.shape.area - reference.shape.area) * value > Settings.min_area for reference in references)]
+
+    elif reltype == 'shade-rel':
+        return [entity for entity in entities if any((entity.color.shade - reference.color.shade) * value > Settings.min_shade for reference in references)]
+
+
+def reference_disagreeing(predicate, entities):
+    if isinstance(predicate, EntityType):
+        disagreeing_ids = set()
+        for attribute in predicate.attributes:
+            disagreeing_ids.update(entity.id for entity in reference_disagreeing(attribute, entities))
+        return [entity for entity in entities if entity.id in disagreeing_ids]
+
+    elif isinstance(predicate, Attribute):
+        attrtype = predicate.attrtype
+        if attrtype == 'relation':
+            return reference_disagreeing(predicate.value, entities)
+        elif attrtype in ('shape', 'color', 'texture'):
+            return [entity for entity in entities if attribute_value(entity, attrtype) != predicate.value]
+        elif attrtype in ('shapes', 'colors', 'textures', 'combinations'):
+            return [entity for entity in entities if attribute_value(entity, attrtype) not in predicate.value]
+        else:
+            return [entity for entity in entities if any((extreme_value(other, attrtype)[0] - extreme_value(entity, attrtype)[0]) * predicate.value > extreme_value(entity, attrtype)[1] for other in entities)]
+
+    reltype = predicate.reltype
+    value = predicate.value
+    if reltype in ('attribute', 'type'):
+        return reference_disagreeing(value, entities)
+    references = reference_agreeing(predicate.reference, entities)
+
+    if reltype == 'x-rel':
+        return [entity for entity in entities if all((entity.center.x - reference.center.x) * value <= 0.0 for reference in references)]
+
+    elif reltype == 'y-rel':
+        return [entity for entity in entities if all((entity.center.y - reference.center.y) * value <= 0.0 for reference in references)]
+
+    elif reltype == 'z-rel':
+        not_disagreeing_ids = set()
+        for entity in entities:
+            for reference in references:
+                collision = entity.collides(reference, ratio=True, symmetric=True)
+                if collision > 0.0 and (collision <= Settings.min_overlap or entity.id * value > reference.id * value):
+                    not_disagreeing_ids.add(entity.id)
+        return [entity for entity in entities if entity.id not in not_disagreeing_ids]
+
+    elif reltype == 'proximity-max':
+        not_disagreeing_ids = set()
+        for reference in references:
+            max_distance = -1.0
+            max_entities = list()
+            for entity in entities:
+                if entity.id == reference.id:
+                    continue
+                distance = (entity.center - reference.center).length * value
+                if distance > max_distance:
+                    max_distance = distance
+                    max_entities = [(e, d) for e, d in max_entities if max_distance - d < Settings.min_distance]
+                if max_distance - distance < Settings.min_distance:
+                    max_entities.append((entity, distance))
+            not_disagreeing_ids.update(e.id for e, _ in max_entities)
+        return [entity for entity in entities if entity.id not in not_disagreeing_ids]
+
+    elif reltype == 'proximity-rel':
+        comparisons = reference_agreeing(predicate.comparison, entities)
+        not_disagreeing_ids = set()
+        for reference in references:
+            for comparison in comparisons:
+                if reference.id == comparison.id:
+                    continue
+                reference_distance = (comparison.center - reference.center).length * value
+                for entity in entities:
+                    if entity.id != reference.id and entity.id != comparison.id and reference_distance - (entity.center - reference.center).length * value > Settings.min_distance:
+                        not_disagreeing_ids.add(entity.id)
+        return [entity for entity in entities if entity.id not in not_disagreeing_ids]
+
+    elif reltype == 'size-rel':
+        return [entity for entity in entities if all((reference.shape.area - entity.shape.area) * value > Settings.min_area for reference in references)]
+
+    elif reltype == 'shade-rel':
+        return [entity for entity in entities if all((reference.color.shade - entity.color.shade) * value > Settings.min_shade for reference in references)]
+
+
+class PredicateMaskTest(unittest.TestCase):
+
+    shapes = ['square', 'circle', 'triangle']
+    colors = ['red', 'green', 'blue']
+    # without combination, whose string value never equals the combination tuple of an entity
+    attrtypes = ('shape', 'color', 'texture', 'shapes', 'colors', 'textures', 'combinations', 'x-max', 'y-max', 'size-max', 'shade-max')
+    reltypes = ('x-rel', 'y-rel', 'z-rel', 'proximity-max', 'proximity-rel', 'size-rel', 'shade-rel')
+
+    def random_attribute(self, attrtype):
+        if attrtype == 'shape':
+            return Attribute(attrtype=attrtype, value=random.choice(self.shapes))
+        elif attrtype == 'color':
+            return Attribute(attrtype=attrtype, value=random.choice(self.colors))
+        elif attrtype == 'texture':
+            return Attribute(attrtype=attrtype, value='solid')
+        elif attrtype == 'shapes':
+            return Attribute(attrtype=attrtype, value=random.sample(self.shapes, 2))
+        elif attrtype == 'colors':
+            return Attribute(attrtype=attrtype, value=random.sample(self.colors, 2))
+        elif attrtype == 'textures':
+            return Attribute(attrtype=attrtype, value=random.choice([[], ['solid']]))
+        elif attrtype == 'combinations':
+            return Attribute(attrtype=attrtype, value=[(random.choice(self.shapes), random.choice(self.colors), 'solid') for _ in range(2)])
+        else:
+            return Attribute(attrtype=attrtype, value=random.choice([-1, 1]))
+
+    def random_type(self):
+        attrtypes = random.sample(['shape', 'color', 'shapes', 'colors'], random.randint(0, 2))
+        return EntityType(attributes=[self.random_attribute(attrtype) for attrtype in attrtypes])
+
+    def random_relation(self, reltype):
+        comparison = self.random_type() if reltype in Relation.ternary_relations else None
+        return Relation(reltype=reltype, value=random.choice([-1, 1]), reference=self.random_type(), comparison=comparison)
+
+    def predicates(self):
+        for attrtype in self.attrtypes:
+            yield attrtype, self.random_attribute(attrtype)
+            # as part of a type, where disagreement is the union over the attributes
+            yield attrtype, EntityType(attributes=[self.random_attribute(attrtype), self.random_attribute(random.choice(['shape', 'color', 'x-max']))])
+        for reltype in self.reltypes:
+            relation = self.random_relation(reltype)
+            yield reltype, relation
+            yield reltype, Attribute(attrtype='relation', value=relation)
+
+    def test_masks_match_reference(self):
+        # on random worlds with overlapping entities and on random subsets of their entities, including the
+        # order-dependent running maximum of proximity-max, masks select the same entities as the list-based
+        # reference, which are returned in id order
+        random.seed(0)
+        np.random.seed(0)
+        generator = GenericGenerator(entity_counts=[4, 5, 6, 7, 8], shapes=self.shapes, colors=self.colors, textures=['solid'], collision_tolerance=0.5)
+        covered = set()
+        for _ in range(25):
+            generator.sample_values(mode=None)
+            world = generator()
+            if world is None:
+                continue
+            table = world.entity_table()
+            subsets = [world.entities] + [sorted(random.sample(world.entities, random.randint(0, len(world.entities))), key=(lambda entity: entity.id)) for _ in range(3)]
+            for name, predicate in self.predicates():
+                for entities in subsets:
+                    mask = table.mask(indices=[entity.id for entity in entities])
+                    agreeing = [entity.id for entity in reference_agreeing(predicate, entities)]
+                    self.assertEqual(list(np.flatnonzero(predicate.agreeing_mask(table=table, mask=mask))), agreeing, name)
+                    self.assertEqual([entity.id for entity in predicate.agreeing_entities(entities=entities)], agreeing, name)
+                    disagreeing = [entity.id for entity in reference_disagreeing(predicate, entities)]
+                    self.assertEqual(list(np.flatnonzero(predicate.disagreeing_mask(table=table, mask=mask))), disagreeing, name)
+                    self.assertEqual([entity.id for entity in predicate.disagreeing_entities(entities=entities)], disagreeing, name)
+                    # the maximum attributes also compare an entity with itself and hence never agree, as before
+                    if disagreeing and (agreeing or name.endswith('-max')):
+                        covered.add(name)
+        # every predicate type was checked where its masks are not trivial
+        self.assertEqual(covered, set(self.attrtypes + self.reltypes))
+
+
+class EntityTableCacheTest(unittest.TestCase):
+
+    def assert_evaluations(self, world, predicate):
+        # a first evaluation misses for the predicate and its nested predicates, a second one hits once
+        table = world.entity_table()
+        self.assertEqual(table.statistics(), {'evaluations': 0, 'hits': 0, 'misses': 0, 'hit_rate': 0.0})
+        expected = [entity.id for entity in reference_agreeing(predicate, world.entities)]
+        self.assertEqual([entity.id for entity in predicate.agreeing_entities(entities=world.entities)], expected)
+        self.assertGreater(table.misses, 1)
+        self.assertEqual(table.hits, 0)
+        self.assertEqual(len(table.cache), table.misses)
+        misses = table.misses
+        self.assertEqual([entity.id for entity in predicate.agreeing_entities(entities=world.entities)], expected)
+        self.assertEqual((table.hits, table.misses), (1, misses))
+        # the type of the reference is shared with other predicates
+        self.assertEqual(list(np.flatnonzero(predicate.value.reference.agreeing_mask(table=table, mask=table.mask(indices=range(len(world.entities)))))), [entity.id for entity in reference_agreeing(predicate.value.reference, world.entities)])
+        self.assertEqual((table.hits, table.misses), (2, misses))
+        return table
+
+    def test_invalidation(self):
+        # memoized evaluations are discarded with the table whenever entities are inserted, removed or reordered
+        random.seed(0)
+        np.random.seed(0)
+        generator = GenericGenerator(entity_counts=[6], shapes=['square', 'circle'], colors=['red', 'green'], textures=['solid'], collision_tolerance=0.5)
+        generator.sample_values(mode=None)
+        world = None
+        while world is None:
+            world = generator()
+        reference = EntityType(attributes=[Attribute(attrtype='shape', value='square'), Attribute(attrtype='color', value='red')])
+        predicate = Attribute(attrtype='relation', value=Relation(reltype='x-rel', value=1, reference=reference))
+
+        table = self.assert_evaluations(world=world, predicate=predicate)
+        entity = world.entities[2]
+        world.remove_entity(entity)
+        self.assertIsNot(world.entity_table(), table)
+        table = self.assert_evaluations(world=world, predicate=predicate)
+        world.insert_entity(entity)
+        self.assertIsNot(world.entity_table(), table)
+        table = self.assert_evaluations(world=world, predicate=predicate)
+        world.sort_entities()
+        self.assertIsNot(world.entity_table(), table)
+        self.assert_evaluations(world=world, predicate=predicate)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import random
+import unittest
+from collections import Counter
+from math import sqrt
+import numpy as np
+from shapeworld.captioners import AttributesRelationCaptioner, AttributesTypeCaptioner, ExistentialCaptioner, SpatialRelationCaptioner
+from shapeworld.generators import GenericGenerator
+
+
+class Vocabulary(object):
+
+    # stands in for a realizer, captioners only take their attributes and relations from it
+
+    attributes = {'shape': ['square', 'circle', 'triangle'], 'color': ['red', 'green', 'blue']}
+    relations = {'attribute': [], 'type': [], 'x-rel': [-1, 1], 'y-rel': [-1, 1], 'proximity-rel': [-1, 1]}
+
+
+class CaptionCandidatesTest(unittest.TestCase):
+
+    num_samples = 3000
+
+    def world(self):
+        generator = GenericGenerator(entity_counts=[6], shapes=['square', 'circle', 'triangle'], colors=['red', 'green', 'blue'], textures=['solid'])
+        generator.sample_values(mode=None)
+        while True:
+            world = generator()
+            if world is not None:
+                return world
+
+    def assert_candidates_match_rejection(self, captioner, entities):
+        candidates = captioner.accepted_candidates(entities=entities)
+        self.assertIsNotNone(candidates)
+        # conditioned on a caption being returned
+        total = sum(probability for _, probability in candidates)
+        probabilities = {caption.signature(): probability / total for caption, probability in candidates}
+        self.assertEqual(len(probabilities), len(candidates))
+        counts = Counter()
+        for _ in range(self.num_samples):
+            caption = captioner(entities=entities)
+            if caption is not None:
+                counts[caption.signature()] += 1
+        if not candidates:
+            self.assertEqual(sum(counts.values()), 0)
+            return
+        num_captions = sum(counts.values())
+        self.assertGreater(num_captions, 0)
+        self.assertTrue(set(counts) <= set(probabilities))
+        for signature, probability in probabilities.items():
+            # within about four and a half standard deviations of the frequency
+            self.assertAlmostEqual(counts[signature] / num_captions, probability, delta=(4.5 * sqrt(probability * (1.0 - probability) / num_captions) + 0.005))
+
+    def test_candidates(self):
+        # the probabilities of the acceptable candidates match the frequencies of captions sampled by rejection
+        random.seed(0)
+        np.random.seed(0)
+        world = self.world()
+        captioners = (ExistentialCaptioner(body_captioner=AttributesRelationCaptioner()), ExistentialCaptioner(body_captioner=SpatialRelationCaptioner()))
+        for captioner in captioners:
+            captioner.set_realizer(Vocabulary())
+            for correct in (True, False):
+                for _ in range(3):
+                    captioner.sample_values(mode=None, correct=correct)
+                    self.assert_candidates_match_rejection(captioner=captioner, entities=world.entities)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+import asyncio
+import unittest
+import numpy as np
+from shapeworld.captioners import AttributesRelationCaptioner, ExistentialCaptioner
+from shapeworld.dataset import dataset, CaptionAgreementDataset
+from shapeworld.generators import GenericGenerator
+from shapeworld.realizers import CaptionRealizer
+
+
+def entity_layout(world_model):
+    return [(entity['center'], entity['shape']['size'], entity['rotation']) for entity in world_model['entities']]
+
+
+class Vocabulary(CaptionRealizer):
+
+    # stands in for the dmrs realizer, captioners take their attributes and relations from it, captions are realized as
+    # a fixed sentence
+
+    def __init__(self):
+        super(Vocabulary, self).__init__(language='english')
+        self.attributes = {'shape': ['square', 'circle', 'triangle'], 'color': ['red', 'green', 'blue']}
+        self.relations = {'attribute': [], 'type': [], 'x-rel': [-1, 1], 'y-rel': [-1, 1]}
+
+    def realize(self, captions):
+        return [['a', 'shape', '.'] for _ in captions]
+
+
+class SlowVocabulary(Vocabulary):
+
+    # realizes captions after waiting as if on an external process, counting pending and cancelled realizations
+
+    def __init__(self):
+        super(SlowVocabulary, self).__init__()
+        self.pending = 0
+        self.cancelled = 0
+
+    async def arealize(self, captions):
+        self.pending += 1
+        try:
+            await asyncio.sleep(0.01)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        finally:
+            self.pending -= 1
+        return self.realize(captions=captions)
+
+
+class ExistentialDataset(CaptionAgreementDataset):
+
+    dataset_name = 'existential'
+
+    def __init__(self, caption_realizer):
+        world_generator = GenericGenerator(entity_counts=[4, 5], shapes=['square', 'circle', 'triangle'], colors=['red', 'green', 'blue'], textures=['solid'])
+        world_captioner = ExistentialCaptioner(body_captioner=AttributesRelationCaptioner())
+        super(ExistentialDataset, self).__init__(world_generator=world_generator, world_captioner=world_captioner, caption_size=4, words=['.', 'a', 'shape'], caption_realizer=caption_realizer)
+
+
+class DatasetTest(unittest.TestCase):
+
+    def test_seed_ignores_dataset_level_options(self):
+        # world_dtype and renderer do not change which instances are generated for a seed
+        float_dataset = dataset(dtype='classification', name='multishape')
+        uint8_dataset = dataset(dtype='classification', name='multishape', config={'world_dtype': 'uint8', 'renderer': 'polygon'})
+        float_batch = float_dataset.generate(n=4, mode='train', include_model=True, seed=0)
+        uint8_batch = uint8_dataset.generate(n=4, mode='train', include_model=True, seed=0)
+        for uint8_model, float_model in zip(uint8_batch['world_model'], float_batch['world_model']):
+            self.assertEqual(entity_layout(uint8_model), entity_layout(float_model))
+        self.assertTrue(np.array_equal(uint8_batch['classification'], float_batch['classification']))
+        self.assertEqual(uint8_dataset.instance_seeds(n=4, mode='train', seed=0), float_dataset.instance_seeds(n=4, mode='train', seed=0))
+
+    def test_seed_depends_on_config(self):
+        default_dataset = dataset(dtype='classification', name='multishape')
+        other_dataset = dataset(dtype='classification', name='multishape', config={'entity_counts': [2, 3]})
+        self.assertNotEqual(other_dataset.instance_seeds(n=4, mode='train', seed=0), default_dataset.instance_seeds(n=4, mode='train', seed=0))
+
+    def test_seeds_ignore_batch_size(self):
+        multishape_dataset = dataset(dtype='classification', name='multishape')
+        seeds = multishape_dataset.instance_seeds(n=8, mode='train', seed=0)
+        self.assertEqual(multishape_dataset.instance_seeds(n=4, mode='train', seed=0), seeds[:4])
+        self.assertEqual(len(set(seeds)), 8)
+        self.assertNotEqual(multishape_dataset.instance_seeds(n=4, mode='validation', seed=0), seeds[:4])
+        self.assertNotEqual(multishape_dataset.instance_seeds(n=4, mode='train', seed=1), seeds[:4])
+
+    def test_world_dtypes(self):
+        # lower precision worlds are the float32 worlds, with noise, converted and rounded
+        float_batch = dataset(dtype='classification', name='multishape').generate(n=4, mode='train', noise_range=0.1, seed=0)
+        for world_dtype in ('float16', 'uint8'):
+            batch = dataset(dtype='classification', name='multishape', config={'world_dtype': world_dtype}).generate(n=4, mode='train', noise_range=0.1, seed=0)
+            self.assertEqual(batch['world'].dtype, np.dtype(world_dtype))
+            if world_dtype == 'uint8':
+                self.assertTrue(np.array_equal(batch['world'], np.rint(float_batch['world'] * 255.0).astype(np.uint8)))
+            else:
+                self.assertTrue(np.array_equal(batch['world'], float_batch['world'].astype(np.float16)))
+
+    def test_enumerate_captions_requires_captioner(self):
+        with self.assertRaises(ValueError):
+            dataset(dtype='classification', name='multishape', config={'enumerate_captions': True})
+
+
+    def test_captioner_resamples(self):
+        # resampling captioner values for a world instead of discarding it generates fewer worlds for the same number of
+        # instances, and changes the instances generated for a seed
+        plain_dataset = ExistentialDataset(caption_realizer=Vocabulary())
+        resampling_dataset = ExistentialDataset(caption_realizer=Vocabulary())
+        resampling_dataset.captioner_resamples = 3
+        self.assertNotEqual(resampling_dataset.instance_seeds(n=4, mode='train', seed=0), plain_dataset.instance_seeds(n=4, mode='train', seed=0))
+        for seed in range(3):
+            plain_dataset.generate_unrealized(n=20, mode='train', seed=seed)
+            resampling_dataset.generate_unrealized(n=20, mode='train', seed=seed)
+        for generating_dataset in (plain_dataset, resampling_dataset):
+            generator = generating_dataset.world_generator
+            self.assertEqual(generating_dataset.statistics()['generated_worlds'], generator.num_worlds - generator.num_failed_worlds)
+        plain_statistics = plain_dataset.statistics()
+        resampling_statistics = resampling_dataset.statistics()
+        self.assertEqual(plain_statistics['resampled_captions'], 0)
+        self.assertGreater(resampling_statistics['resampled_captions'], 0)
+        self.assertGreater(plain_statistics['generated_worlds'], 60)
+        self.assertGreaterEqual(resampling_statistics['generated_worlds'], 60)
+        self.assertLess(resampling_statistics['generated_worlds'], plain_statistics['generated_worlds'])
+
+
+    def test_aiterate(self):
+        # seeded batches of aiterate equal those of iterate, closing it cancels the batch scheduled ahead
+        realizer = SlowVocabulary()
+        async_dataset = ExistentialDataset(caption_realizer=realizer)
+
+        async def generate():
+            iterator = async_dataset.aiterate(n=5, mode='train', seed=0)
+            batches = [await iterator.__anext__() for _ in range(3)]
+            self.assertEqual(realizer.pending, 1)
+            await iterator.aclose()
+            # the cancellation is delivered at the next step of the event loop
+            await asyncio.sleep(0)
+            self.assertEqual(len(asyncio.all_tasks()), 1)
+            return batches
+
+        batches = asyncio.run(generate())
+        self.assertEqual((realizer.pending, realizer.cancelled), (0, 1))
+        iterator = ExistentialDataset(caption_realizer=Vocabulary()).iterate(n=5, mode='train', seed=0)
+        for batch in batches:
+            expected = next(iterator)
+            self.assertEqual(sorted(batch), sorted(expected))
+            for value_name in expected:
+                self.assertTrue(np.array_equal(batch[value_name], expected[value_name]), value_name)
+
+
+if __name__ == '__main__':
+    unittest.main()
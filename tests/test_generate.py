@@ -0,0 +1,78 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def generate(directory, config, workers=None):
+    command = [sys.executable, os.path.join(root, 'generate.py'), '-d', directory, '-U', '-t', 'classification', '-n', 'oneshape', '-m', 'train', '-f', '3', '-i', '4', '-s', '0', '-c', config]
+    if workers is not None:
+        command.extend(('-w', str(workers)))
+    subprocess.check_call(command, cwd=root, stdout=subprocess.DEVNULL)
+
+
+def generate_shard(directory, shard=None):
+    # managed layout with train, validation and test parts
+    command = [sys.executable, os.path.join(root, 'generate.py'), '-d', directory, '-t', 'classification', '-n', 'oneshape', '-f', '(3,2,1)', '-i', '4', '-s', '0']
+    if shard is not None:
+        command.extend(('-S', shard))
+    subprocess.check_call(command, cwd=root, stdout=subprocess.DEVNULL)
+
+
+def merge(directory, shard_directories):
+    command = [sys.executable, os.path.join(root, 'generate.py'), '-d', directory, '--merge'] + shard_directories
+    return subprocess.run(command, cwd=root, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+
+def read_files(directory):
+    files = dict()
+    for path, _, filenames in os.walk(directory):
+        for filename in filenames:
+            with open(os.path.join(path, filename), 'rb') as filehandle:
+                files[os.path.relpath(os.path.join(path, filename), directory)] = filehandle.read()
+    return files
+
+
+class GenerateWorkersTest(unittest.TestCase):
+
+    def test_workers_match_sequential(self):
+        # dataset-level options like renderer and world_dtype have to reach the worker processes
+        config = '{"renderer": "polygon", "world_dtype": "uint8"}'
+        with tempfile.TemporaryDirectory() as directory:
+            generate(directory=os.path.join(directory, 'sequential'), config=config)
+            expected = read_files(os.path.join(directory, 'sequential'))
+            self.assertTrue(expected)
+            for workers in (1, 2):
+                generate(directory=os.path.join(directory, str(workers)), config=config, workers=workers)
+                self.assertEqual(read_files(os.path.join(directory, str(workers))), expected)
+
+
+
+class GenerateShardsTest(unittest.TestCase):
+
+    def test_merged_shards_match_single_run(self):
+        with tempfile.TemporaryDirectory() as directory:
+            generate_shard(directory=os.path.join(directory, 'single'))
+            expected = read_files(os.path.join(directory, 'single'))
+            self.assertEqual({os.path.dirname(path) for path in expected if path.endswith('.txt')}, {os.path.join('classification', 'oneshape', mode, 'part{}'.format(part)) for mode, num_parts in (('train', 3), ('validation', 2), ('test', 1)) for part in range(1, num_parts + 1)})
+            shard_directories = [os.path.join(directory, 'shard1'), os.path.join(directory, 'shard2')]
+            generate_shard(directory=shard_directories[0], shard='1/2')
+            generate_shard(directory=shard_directories[1], shard='2/2')
+            result = merge(directory=os.path.join(directory, 'merged'), shard_directories=shard_directories)
+            self.assertEqual(result.returncode, 0, result.stderr)
+            self.assertEqual(read_files(os.path.join(directory, 'merged')), expected)
+
+            # a missing or duplicated shard is rejected before anything is written
+            for shard_directories in ([shard_directories[0]], [shard_directories[1], shard_directories[1]]):
+                result = merge(directory=os.path.join(directory, 'rejected'), shard_directories=shard_directories)
+                self.assertNotEqual(result.returncode, 0)
+                self.assertIn(b'shards missing or duplicated', result.stderr)
+                self.assertFalse(os.path.exists(os.path.join(directory, 'rejected')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,29 @@
+import random
+import unittest
+import numpy as np
+from shapeworld.util import Point
+from shapeworld.world import Entity, World
+from shapeworld.generators import GenericGenerator
+
+
+class GenericGeneratorTest(unittest.TestCase):
+
+    def test_outside_block(self):
+        # candidates rejected on the block arrays have to be rejected by World.add_entity as well
+        random.seed(0)
+        np.random.seed(0)
+        for boundary_tolerance in (0.0, 0.25):
+            generator = GenericGenerator(entity_counts=[1], size_range=(0.02, 0.4), boundary_tolerance=boundary_tolerance)
+            generator.sample_values(mode=None)
+            block = generator.random_block(num_entities=2000)
+            centers = np.random.uniform(-0.2, 1.2, size=block['centers'].shape)
+            outside = generator.outside_block(block=block, centers=centers)
+            self.assertTrue(outside.any())
+            for n in np.flatnonzero(outside):
+                entity = Entity.from_block(block, n, center=Point(*centers[n]))
+                world = World(generator.world_size, generator.world_color)
+                self.assertFalse(world.add_entity(entity, boundary_tolerance=boundary_tolerance, collision_tolerance=generator.collision_tolerance))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import gc
+import sys
+import unittest
+import numpy as np
+from shapeworld.dataset import dataset
+
+
+class BatchProducerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dataset = dataset(dtype='classification', name='oneshape', config={'world_dtype': 'uint8'})
+        self.expected = list()
+        for batch in self.dataset.iterate(n=3, mode='train', seed=0):
+            self.expected.append(batch)
+            if len(self.expected) == 6:
+                break
+
+    def assert_batches_equal(self, batches):
+        self.assertEqual(len(batches), len(self.expected))
+        for batch, expected in zip(batches, self.expected):
+            self.assertEqual(sorted(batch), sorted(expected))
+            for value_name, value in expected.items():
+                self.assertTrue(np.array_equal(batch[value_name], value), value_name)
+
+    def test_kept_batches(self):
+        # by default batches are independent of later ones
+        batches = list()
+        for batch in self.dataset.iterate(n=3, mode='train', seed=0, workers=2):
+            batches.append(batch)
+            if len(batches) == 6:
+                break
+        self.assert_batches_equal(batches)
+
+    def test_shared_memory(self):
+        batches = list()
+        for batch in self.dataset.iterate(n=3, mode='train', seed=0, workers=2, shared_memory=True):
+            batches.append({value_name: np.array(value) for value_name, value in batch.items()})
+            if len(batches) == 6:
+                break
+        self.assert_batches_equal(batches)
+
+    def test_views_outlive_ring(self):
+        # the last batch remains valid after closing, and its memory is released without errors once discarded
+        unraisable = list()
+        unraisablehook = sys.unraisablehook
+        sys.unraisablehook = unraisable.append
+        try:
+            iterator = self.dataset.iterate(n=3, mode='train', seed=0, workers=1, shared_memory=True)
+            world = next(iterator)['world']
+            iterator.close()
+            self.assertTrue(np.array_equal(world, self.expected[0]['world']))
+            del world
+            gc.collect()
+        finally:
+            sys.unraisablehook = unraisablehook
+        self.assertEqual(unraisable, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+from random import seed, uniform
+import unittest
+import numpy as np
+from shapeworld.util import Point
+from shapeworld.world import Entity, Shape
+from shapeworld.world.renderer import SdfRenderer, PolygonRenderer
+
+
+def render(renderer, entity, world_size):
+    world_array = np.zeros(shape=(world_size.y, world_size.x, 3), dtype=np.float32)
+    renderer.draw_entity(entity=entity, world_array=world_array, world_size=world_size)
+    return world_array[:, :, 0]
+
+
+def centroid(alpha):
+    ys, xs = np.mgrid[:alpha.shape[0], :alpha.shape[1]]
+    return np.array([(xs * alpha).sum(), (ys * alpha).sum()]) / alpha.sum()
+
+
+class PolygonRendererTest(unittest.TestCase):
+
+    def test_parity_with_sdf(self):
+        # centroids agree up to supersampling resolution, shapes overlap up to the one-pixel falloff of SdfRenderer
+        seed(0)
+        world_size = Point(64, 64)
+        for supersampling, tolerance in ((1, 0.75), (4, 0.2)):
+            renderer = PolygonRenderer(supersampling=supersampling)
+            offsets = list()
+            for shape in sorted(Shape.shapes):
+                for _ in range(10):
+                    entity = Entity.random_instance(center=Point(uniform(0.25, 0.75), uniform(0.25, 0.75)), rotation=True, size_range=(0.1, 0.25), distortion_range=(2.0, 3.0), shade_range=0.0, shapes=[shape], colors=['red'], textures=['solid'])
+                    expected = render(renderer=SdfRenderer(), entity=entity, world_size=world_size)
+                    alpha = render(renderer=renderer, entity=entity, world_size=world_size)
+                    offset = centroid(alpha) - centroid(expected)
+                    self.assertLess(np.abs(offset).max(), tolerance, shape)
+                    self.assertGreater(np.minimum(alpha, expected).sum() / np.maximum(alpha, expected).sum(), 0.65, shape)
+                    offsets.append(offset)
+            # no systematic shift
+            self.assertLess(np.abs(np.mean(offsets, axis=0)).max(), 0.05)
+
+    def test_world_draw(self):
+        # filling all entities into one label image matches drawing them one by one, including overlaps
+        seed(0)
+        world_size = Point(64, 64)
+        renderer = PolygonRenderer()
+        for _ in range(10):
+            entities = [Entity.random_instance(center=Point(uniform(0.2, 0.8), uniform(0.2, 0.8)), rotation=True, size_range=(0.1, 0.4), distortion_range=(1.0, 3.0), shade_range=0.5, shapes=sorted(Shape.shapes), colors=['red', 'green', 'blue'], textures=['solid']) for _ in range(6)]
+            expected = np.full(shape=(world_size.y, world_size.x, 3), fill_value=0.5, dtype=np.float32)
+            for entity in entities:
+                renderer.draw_entity(entity=entity, world_array=expected, world_size=world_size)
+            world_array = np.full(shape=(world_size.y, world_size.x, 3), fill_value=0.5, dtype=np.float32)
+            renderer.draw(entities=entities, world_array=world_array, world_size=world_size)
+            self.assertTrue(np.allclose(world_array, expected, atol=1e-6))
+
+
+if __name__ == '__main__':
+    unittest.main()
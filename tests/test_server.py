@@ -0,0 +1,37 @@
+import os
+import tempfile
+import threading
+import unittest
+from shapeworld.dataset import dataset, ServedDataset
+from shapeworld.server import DatasetServer
+
+
+class DatasetServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.address = os.path.join(self.directory.name, 'shapeworld.sock')
+        self.config = {'world_dtype': 'uint8'}
+        self.server = DatasetServer(address=self.address, num_workers=1, preload=[{'dtype': 'classification', 'name': 'oneshape', 'language': None, 'config': self.config}])
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.server.shutdown()
+        self.server.close()
+        self.directory.cleanup()
+
+    def test_preloaded_config(self):
+        served = dataset(dtype='classification', name='oneshape', config='connect({})'.format(self.address))
+        self.assertEqual(served.world_dtype, 'uint8')
+        self.assertEqual(served.generate(n=2, mode='train')['world'].dtype.name, 'uint8')
+        served.close()
+
+    def test_conflicting_config(self):
+        with self.assertRaises(RuntimeError):
+            ServedDataset(address=self.address, dtype='classification', name='oneshape', config={'world_dtype': 'float16'})
+
+
+if __name__ == '__main__':
+    unittest.main()
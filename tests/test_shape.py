@@ -0,0 +1,50 @@
+import unittest
+import numpy as np
+from shapeworld.util import Point
+from shapeworld.world.shape import Shape, WorldShape
+
+
+def boundary_offsets(shape):
+    # outline points, and for polygonal outlines the midpoints of their edges, exactly on the boundary up to rounding
+    outline = np.array([(point.x, point.y) for point in shape.outline()])
+    if shape.outline_error > 0.0:
+        return outline
+    return np.concatenate([outline, 0.5 * (outline + np.roll(outline, shift=-1, axis=0))])
+
+
+class ShapeArrayTest(unittest.TestCase):
+
+    def assert_parity(self, shape, offsets):
+        distances = shape.distance_array(offsets)
+        contains = shape.contains_array(offsets)
+        self.assertEqual(distances.shape, offsets.shape[:-1])
+        self.assertEqual(contains.shape, offsets.shape[:-1])
+        for offset, distance, contained in zip(offsets, distances, contains):
+            offset = Point(float(offset[0]), float(offset[1]))
+            self.assertAlmostEqual(distance, shape.distance(offset), places=12, msg='{} at {}'.format(type(shape).__name__, offset))
+            self.assertEqual(bool(contained), offset in shape, msg='{} at {}'.format(type(shape).__name__, offset))
+
+    def test_parity(self):
+        # distance_array and contains_array agree with distance and __contains__ on random and boundary points
+        np.random.seed(0)
+        shapes = [WorldShape()]
+        for name, shape_class in sorted(Shape.shapes.items()):
+            for _ in range(5):
+                if shape_class.distorted:
+                    size = Point(*np.random.uniform(0.05, 0.5, size=2))
+                else:
+                    size = float(np.random.uniform(0.05, 0.5))
+                shapes.append(shape_class(size))
+        for shape in shapes:
+            offsets = np.random.uniform(-0.6, 0.6, size=(500, 2))
+            self.assert_parity(shape=shape, offsets=offsets)
+            if isinstance(shape, WorldShape):
+                offsets = np.array([(x, y) for x in (-0.5, 0.0, 0.5) for y in (-0.5, 0.0, 0.5)])
+            else:
+                offsets = boundary_offsets(shape)
+            self.assert_parity(shape=shape, offsets=offsets)
+            self.assert_parity(shape=shape, offsets=offsets[:, ::-1].copy())
+
+
+if __name__ == '__main__':
+    unittest.main()